@@ -0,0 +1,231 @@
+"""
+Seat alerts
+
+Subscriptions watch one CRN or every section of a course for a rule:
+
+seats_open      - Rem goes from 0 to above 0
+waitlist_moved  - WL Act changes by at least threshold between scrapes
+cap_increased   - Cap goes up
+
+AlertEngine is attached to a DBWriter and sees every committed scrape.
+It compares each section's counts with the previous scrape, and only
+sections that changed are looked up in the CRN and course indexes, so
+the cost of a scrape grows with the number of changes and the rules on
+them, not with subscriptions x sections.
+
+Subscriptions live in the subscriptions table of the tracker database:
+python alerts.py add 201902 seats_open me@example.com --crn 87654
+python alerts.py add 201902 cap_increased me@example.com --course "CS 6250"
+python alerts.py list 201902
+python alerts.py remove 3
+"""
+from collections import namedtuple
+import argparse
+import datetime
+import logging
+
+from dbwriter import connect, timestamp
+from enrollhist import snapshot_at
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+SUBSCRIPTIONS_SCHEMA = """CREATE TABLE IF NOT EXISTS subscriptions(
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL,
+    crn INTEGER,
+    course TEXT,
+    rule TEXT NOT NULL,
+    threshold INTEGER NOT NULL DEFAULT 1,
+    email TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    last_fired TEXT,
+    CHECK ((crn IS NULL) != (course IS NULL))
+)"""
+
+# Counts are (cap, act, rem, wl_cap, wl_act, wl_rem)
+RULES = {
+    'seats_open': lambda old, new, threshold: old[2] <= 0 < new[2],
+    'waitlist_moved': lambda old, new, threshold: abs(new[4] - old[4]) >= threshold,
+    'cap_increased': lambda old, new, threshold: new[0] > old[0],
+}
+
+Subscription = namedtuple('Subscription', ('id', 'term', 'crn', 'course', 'rule', 'threshold', 'email'))
+Alert = namedtuple('Alert', ('subscription', 'section', 'old', 'new'))
+
+
+def create_schema(conn):
+    """
+    :param conn: sqlite3 connection
+    """
+    conn.execute(SUBSCRIPTIONS_SCHEMA)
+
+
+def add_subscription(conn, term, rule, email, crn=None, course=None, threshold=1):
+    """
+    Add a subscription
+
+    :param term: Semester option value
+    :param rule: One of RULES
+    :param email: Address alerts are sent to
+    :param crn: Watch one section
+    :param course: Watch every section of a course, 'SUBJ CRSE' eg 'CS 6250'
+    :param threshold: Rule parameter, eg how far the waitlist has to move
+    :return: Subscription id
+    """
+    if rule not in RULES:
+        raise ValueError(f"Unknown rule {rule}, expected one of {sorted(RULES)}")
+    if (crn is None) == (course is None):
+        raise ValueError("Give exactly one of crn or course")
+    if course is not None:
+        course = " ".join(course.upper().split())
+    create_schema(conn)
+    cursor = conn.execute("INSERT INTO subscriptions(term, crn, course, rule, threshold, email) "
+                          "VALUES (?, ?, ?, ?, ?, ?)", (term, crn, course, rule, threshold, email))
+    return cursor.lastrowid
+
+
+def remove_subscription(conn, subscription_id):
+    """
+    Deactivate a subscription
+
+    :return: True if it existed
+    """
+    create_schema(conn)
+    return conn.execute("UPDATE subscriptions SET active=0 WHERE id=?", (subscription_id,)).rowcount > 0
+
+
+def load_subscriptions(conn, term=None):
+    """
+    :param term: Only this term's subscriptions, every term if None
+    :return: List of active Subscription
+    """
+    create_schema(conn)
+    cursor = conn.execute(f"SELECT {', '.join(Subscription._fields)} FROM subscriptions "
+                          "WHERE active=1 AND (? IS NULL OR term=?) ORDER BY id", (term, term))
+    return [Subscription(*row) for row in cursor]
+
+
+def notify_alert(alert):
+    """Default delivery, queue an email to the subscriber through notify"""
+    from notify import default_notifier
+    sub, sec = alert.subscription, alert.section
+    labels = ('Cap', 'Act', 'Rem', 'WL Cap', 'WL Act', 'WL Rem')
+    changes = "\n".join(f"{label}: {old} -> {new}" for label, old, new in zip(labels, alert.old, alert.new)
+                        if old != new)
+    subject = f"{sub.rule.replace('_', ' ')}: {sec.subj} {sec.crse} {sec.sec} (CRN {sec.crn})"
+    body = f"{sec.title}\n{sec.days} {sec.time} {sec.instructor}\n\n{changes}\n\nSubscription {sub.id}"
+    default_notifier().notify(subject, body, to=sub.email)
+
+
+class AlertEngine:
+    """
+    Evaluates subscriptions against each written scrape
+
+    Attach with writer.listeners.append(engine.observe). Subscriptions
+    added from another process, eg the alerts.py CLI, are picked up on
+    the next scrape.
+
+    :param conn: sqlite3 connection, normally the DBWriter's
+    :param deliver: Callable taking an Alert, defaults to an email to the subscriber
+    """
+
+    def __init__(self, conn, deliver=notify_alert):
+        self.conn = conn
+        self.deliver = deliver
+        # term -> CRN -> counts at the previous scrape
+        self.previous = {}
+        self.by_crn = {}
+        self.by_course = {}
+        self.data_version = None
+        self.reload()
+
+    def reload(self):
+        """Rebuild the CRN and course indexes from the subscriptions table"""
+        self.by_crn = {}
+        self.by_course = {}
+        subscriptions = load_subscriptions(self.conn)
+        for sub in subscriptions:
+            if sub.crn is not None:
+                self.by_crn.setdefault((sub.term, sub.crn), []).append(sub)
+            else:
+                self.by_course.setdefault((sub.term, sub.course), []).append(sub)
+        # Bumped by commits from any other connection
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        logger.debug(f"Loaded {len(subscriptions)} subscriptions")
+
+    def _previous(self, term, scrape_time):
+        if term not in self.previous:
+            # Written scrapes are already in the db, start from the one before
+            before = scrape_time - datetime.timedelta(microseconds=1)
+            self.previous[term] = snapshot_at(self.conn, term, timestamp(before))[1]
+        return self.previous[term]
+
+    def observe(self, term, sections, scrape_time, subject='', campus=''):
+        """
+        Check the sections of one scrape, DBWriter listener signature
+
+        :param term: Semester option value
+        :param sections: sections.Section records written
+        :param scrape_time: datetime of the scrape
+        :param subject: Subject searched for, unused, alerts only compare the sections scraped
+        :param campus: Campus searched for, unused
+        :return: List of Alert delivered
+        """
+        if self.conn.execute("PRAGMA data_version").fetchone()[0] != self.data_version:
+            self.reload()
+        previous = self._previous(term, scrape_time)
+        fired = []
+        for sec in sections:
+            new = sec.counts
+            old = previous.get(sec.crn)
+            previous[sec.crn] = new
+            if old is None or old == new:
+                continue
+            watchers = self.by_crn.get((term, sec.crn), []) + self.by_course.get((term, f"{sec.subj} {sec.crse}"), [])
+            for sub in watchers:
+                if RULES[sub.rule](old, new, sub.threshold):
+                    fired.append(Alert(sub, sec, old, new))
+        for alert in fired:
+            try:
+                self.deliver(alert)
+            except Exception:
+                logger.exception(f"Delivering alert for subscription {alert.subscription.id} failed")
+        if fired:
+            ts = timestamp(scrape_time)
+            self.conn.executemany("UPDATE subscriptions SET last_fired=? WHERE id=?",
+                                  [(ts, alert.subscription.id) for alert in fired])
+            logger.info(f"{len(fired)} alerts fired")
+        return fired
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default="OMSCS_CA.db")
+    commands = parser.add_subparsers(dest="command")
+    add = commands.add_parser("add", help="Add a subscription")
+    add.add_argument("term")
+    add.add_argument("rule", choices=sorted(RULES))
+    add.add_argument("email")
+    watch = add.add_mutually_exclusive_group(required=True)
+    watch.add_argument("--crn", type=int)
+    watch.add_argument("--course", help="eg 'CS 6250'")
+    add.add_argument("--threshold", type=int, default=1)
+    listing = commands.add_parser("list", help="List active subscriptions")
+    listing.add_argument("term", nargs="?")
+    remove = commands.add_parser("remove", help="Deactivate a subscription")
+    remove.add_argument("id", type=int)
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    if args.command == "add":
+        print(add_subscription(db, args.term, args.rule, args.email, args.crn, args.course, args.threshold))
+    elif args.command == "list":
+        for subscription in load_subscriptions(db, args.term):
+            print(subscription)
+    elif args.command == "remove":
+        print("Removed" if remove_subscription(db, args.id) else "No such subscription")
+    else:
+        parser.print_help()
+    db.close()
@@ -0,0 +1,356 @@
+"""
+Enrollment analytics
+
+Keeps per course rollups in materialized tables so questions such as
+"how fast did CS 6250 fill", "when did it get a waitlist" or "how many
+seats were taken per hour" are single primary key lookups instead of
+queries over a whole term of enrollment history.
+
+rollup_courses  - one row per course: first seen, time it filled, time
+                  its waitlist opened, waitlist peak, current totals
+rollup_hourly   - seats added and dropped per course and hour
+rollup_daily    - the same per day
+
+Counts are summed over every section of a course, from the latest scrape
+of each target, so a course whose sections are tracked under several
+campus or subject targets is totalled over all of them. Rollups is
+attached to a DBWriter and updated after each write, only for courses
+whose totals changed. rebuild() recomputes a term from stored history, eg
+after migrate.py imported legacy tables.
+
+Usage:
+python analytics.py courses 201902 [--subject CS] [--sort fill]
+python analytics.py velocity 201902 "CS 6250" [--daily]
+python analytics.py busiest 201902 [--daily] [--limit 10]
+python analytics.py rebuild 201902
+"""
+import argparse
+import datetime
+import logging
+
+from dbwriter import connect, timestamp
+from enrollhist import parse_ts, scrape_times, snapshot_at
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+# Buckets are timestamp prefixes, 'YYYY-MM-DD HH' and 'YYYY-MM-DD'
+BUCKETS = {'rollup_hourly': 13, 'rollup_daily': 10}
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS rollup_courses(
+        term TEXT NOT NULL,
+        subj TEXT NOT NULL,
+        crse TEXT NOT NULL,
+        first_ts TEXT NOT NULL,
+        updated_ts TEXT NOT NULL,
+        sections INTEGER NOT NULL,
+        cap INTEGER NOT NULL,
+        act INTEGER NOT NULL,
+        wl_act INTEGER NOT NULL,
+        wl_peak INTEGER NOT NULL,
+        wl_peak_ts TEXT,
+        filled_ts TEXT,
+        waitlisted_ts TEXT,
+        PRIMARY KEY (term, subj, crse)
+    ) WITHOUT ROWID""",
+) + tuple(
+    f"""CREATE TABLE IF NOT EXISTS {table}(
+        term TEXT NOT NULL,
+        subj TEXT NOT NULL,
+        crse TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        added INTEGER NOT NULL,
+        dropped INTEGER NOT NULL,
+        act INTEGER NOT NULL,
+        wl_act INTEGER NOT NULL,
+        PRIMARY KEY (term, subj, crse, bucket)
+    ) WITHOUT ROWID""" for table in BUCKETS
+) + tuple(
+    f"CREATE INDEX IF NOT EXISTS {table}_by_time ON {table}(term, bucket, added)" for table in BUCKETS
+)
+COURSE_COLUMNS = ('first_ts', 'updated_ts', 'sections', 'cap', 'act', 'wl_act', 'wl_peak', 'wl_peak_ts',
+                  'filled_ts', 'waitlisted_ts')
+
+
+def create_schema(conn):
+    """
+    :param conn: sqlite3 connection
+    """
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def course_totals(latest):
+    """
+    :param latest: Iterable of (subj, crse, cap, act, wl_act), one per section
+    :return: {(subj, crse): (sections, cap, act, wl_act)}
+    """
+    totals = {}
+    for subj, crse, cap, act, wl_act in latest:
+        total = totals.setdefault((subj, crse), [0, 0, 0, 0])
+        total[0] += 1
+        total[1] += cap
+        total[2] += act
+        total[3] += wl_act
+    return {course: tuple(total) for course, total in totals.items()}
+
+
+class Rollups:
+    """
+    Incrementally maintained course rollups
+
+    Attach with writer.listeners.append(rollups.observe). The latest row
+    of every course and bucket, and the latest counts of every section,
+    are kept in memory, so a scrape costs one pass over the term's
+    sections plus writes for the courses that changed.
+
+    :param conn: sqlite3 connection in autocommit mode, normally the DBWriter's
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        create_schema(conn)
+        # term -> (subj, crse) -> list of COURSE_COLUMNS values
+        self.courses = {}
+        # term -> table -> (subj, crse) -> [bucket, added, dropped, act, wl_act]
+        self.buckets = {}
+        # term -> CRN -> (subj, crse, cmp, cap, act, wl_act) of its latest scrape
+        self.latest = {}
+
+    def _load(self, term):
+        if term in self.courses:
+            return
+        cursor = self.conn.execute(f"SELECT subj, crse, {', '.join(COURSE_COLUMNS)} FROM rollup_courses WHERE term=?",
+                                   (term,))
+        self.courses[term] = {(row[0], row[1]): list(row[2:]) for row in cursor}
+        self.buckets[term] = {}
+        for table in BUCKETS:
+            cursor = self.conn.execute(f"""
+                SELECT b.subj, b.crse, b.bucket, b.added, b.dropped, b.act, b.wl_act
+                FROM {table} b JOIN (SELECT subj, crse, max(bucket) AS bucket FROM {table}
+                                     WHERE term=? GROUP BY subj, crse) latest
+                ON b.subj=latest.subj AND b.crse=latest.crse AND b.bucket=latest.bucket
+                WHERE b.term=?""", (term, term))
+            self.buckets[term][table] = {(row[0], row[1]): list(row[2:]) for row in cursor}
+        self.latest[term] = self._stored_counts(term, "9999")
+
+    def _stored_counts(self, term, ts):
+        """CRN -> (subj, crse, cmp, cap, act, wl_act) as of the scrapes at or before ts"""
+        info = {row[0]: row[1:] for row in
+                self.conn.execute("SELECT crn, subj, crse, cmp FROM sections WHERE term=?", (term,))}
+        return {crn: info[crn] + (counts[0], counts[1], counts[4])
+                for crn, counts in snapshot_at(self.conn, term, ts)[1].items() if crn in info}
+
+    def observe(self, term, sections, scrape_time, subject='', campus=''):
+        """
+        Update the rollups from one scrape, DBWriter listener signature
+
+        The scrape replaces the latest counts of its subject and campus,
+        sections of that scope it did not return are gone. Course totals
+        are then taken over every section of the term.
+
+        :param term: Semester option value
+        :param sections: sections.Section records written
+        :param scrape_time: datetime of the scrape
+        :param subject: Subject searched for, '' if the scrape covered every subject
+        :param campus: Campus searched for, '' if the scrape covered every campus
+        :return: Number of courses updated
+        """
+        self._load(term)
+        latest = self.latest[term]
+        scraped = {sec.crn for sec in sections}
+        for crn, row in list(latest.items()):
+            if crn not in scraped and subject in ('', row[0]) and campus in ('', row[2]):
+                del latest[crn]
+        for sec in sections:
+            latest[sec.crn] = (sec.subj, sec.crse, sec.cmp, sec.cap, sec.act, sec.wl_act)
+        return self.update(term, course_totals((row[:2] + row[3:] for row in latest.values())),
+                           timestamp(scrape_time))
+
+    def update(self, term, totals, ts):
+        """
+        :param term: Semester option value
+        :param totals: {(subj, crse): (sections, cap, act, wl_act)} as of ts
+        :param ts: Scrape timestamp text, not older than earlier updates
+        :return: Number of courses updated
+        """
+        self._load(term)
+        courses = self.courses[term]
+        course_rows = []
+        bucket_rows = {table: [] for table in BUCKETS}
+        for course, (n_sections, cap, act, wl_act) in totals.items():
+            row = courses.get(course)
+            if row is None:
+                # Enrollment before the first scrape is not counted as added
+                row = courses[course] = [ts, ts, n_sections, cap, act, wl_act, wl_act, ts if wl_act else None,
+                                         None, None]
+                delta = 0
+            elif row[2:6] == [n_sections, cap, act, wl_act]:
+                continue
+            else:
+                delta = act - row[4]
+                row[1:6] = [ts, n_sections, cap, act, wl_act]
+                if wl_act > row[6]:
+                    row[6:8] = [wl_act, ts]
+            if row[8] is None and 0 < cap <= act:
+                row[8] = ts
+            if row[9] is None and wl_act > 0:
+                row[9] = ts
+            course_rows.append((term,) + course + tuple(row))
+            for table, length in BUCKETS.items():
+                buckets = self.buckets[term][table]
+                bucket = buckets.get(course)
+                if bucket is None or bucket[0] != ts[:length]:
+                    bucket = buckets[course] = [ts[:length], 0, 0, act, wl_act]
+                bucket[1:] = [bucket[1] + max(delta, 0), bucket[2] + max(-delta, 0), act, wl_act]
+                bucket_rows[table].append((term,) + course + tuple(bucket))
+        if not course_rows:
+            return 0
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(f"INSERT OR REPLACE INTO rollup_courses VALUES ({', '.join('?' * 13)})",
+                                  course_rows)
+            for table, rows in bucket_rows.items():
+                self.conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            # Memory is ahead of the tables now, reload on the next update
+            del self.courses[term]
+            del self.latest[term]
+            raise
+        return len(course_rows)
+
+    def rebuild(self, term):
+        """
+        Recompute a term's rollups from the stored enrollment history
+
+        :param term: Semester option value
+        :return: Number of scrapes replayed
+        """
+        for table in ('rollup_courses',) + tuple(BUCKETS):
+            self.conn.execute(f"DELETE FROM {table} WHERE term=?", (term,))
+        self.courses.pop(term, None)
+        times = scrape_times(self.conn, term)
+        for ts in times:
+            latest = self._stored_counts(term, ts)
+            self.update(term, course_totals(row[:2] + row[3:] for row in latest.values()), ts)
+        logger.info(f"Rebuilt rollups of {term} from {len(times)} scrapes")
+        return len(times)
+
+
+def _course(text):
+    """'CS 6250' -> ('CS', '6250')"""
+    subj, crse = text.upper().split()
+    return subj, crse
+
+
+def courses(conn, term, subject=None):
+    """
+    Fill and waitlist times of every course of a term
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param subject: Only courses of this subject
+    :return: List of dicts, time_to_fill/time_to_waitlist are timedeltas from first seen or None
+    """
+    create_schema(conn)
+    cursor = conn.execute(f"""
+        SELECT subj, crse, {', '.join(COURSE_COLUMNS)} FROM rollup_courses
+        WHERE term=? AND (? IS NULL OR subj=?) ORDER BY subj, crse""", (term, subject, subject))
+    results = []
+    for row in cursor:
+        result = dict(zip(('subj', 'crse') + COURSE_COLUMNS, row))
+        first = parse_ts(result['first_ts'])
+        for name, column in (('time_to_fill', 'filled_ts'), ('time_to_waitlist', 'waitlisted_ts')):
+            result[name] = parse_ts(result[column]) - first if result[column] else None
+        results.append(result)
+    return results
+
+
+def velocity(conn, term, subj, crse, daily=False, start=None, end=None):
+    """
+    Seats added and dropped per hour or day for one course
+
+    :param start: Optional first bucket included, text prefix eg '2019-11-04'
+    :param end: Optional last bucket included
+    :return: List of (bucket, added, dropped, act, wl_act), oldest first
+    """
+    create_schema(conn)
+    table = 'rollup_daily' if daily else 'rollup_hourly'
+    return conn.execute(f"""
+        SELECT bucket, added, dropped, act, wl_act FROM {table}
+        WHERE term=? AND subj=? AND crse=? AND bucket BETWEEN ? AND ? ORDER BY bucket""",
+                        (term, subj, crse, start or "", end or "9999")).fetchall()
+
+
+def busiest(conn, term, daily=False, limit=10):
+    """
+    Hours or days with the most seats added over all courses
+
+    :return: List of (bucket, added, dropped), busiest first
+    """
+    create_schema(conn)
+    table = 'rollup_daily' if daily else 'rollup_hourly'
+    return conn.execute(f"""
+        SELECT bucket, sum(added), sum(dropped) FROM {table} WHERE term=?
+        GROUP BY bucket ORDER BY sum(added) DESC LIMIT ?""", (term, limit)).fetchall()
+
+
+def _duration(delta):
+    return '-' if delta is None else str(delta).split('.')[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default="OMSCS_CA.db")
+    commands = parser.add_subparsers(dest="command")
+    course_list = commands.add_parser("courses", help="Time to fill and to waitlist per course")
+    course_list.add_argument("term")
+    course_list.add_argument("--subject")
+    course_list.add_argument("--sort", choices=("course", "fill", "waitlist", "peak"), default="course")
+    course_velocity = commands.add_parser("velocity", help="Seats added and dropped per hour for a course")
+    course_velocity.add_argument("term")
+    course_velocity.add_argument("course", help="eg 'CS 6250'")
+    course_velocity.add_argument("--daily", action="store_true")
+    course_velocity.add_argument("--start")
+    course_velocity.add_argument("--end")
+    busy = commands.add_parser("busiest", help="Hours with the most seats added over all courses")
+    busy.add_argument("term")
+    busy.add_argument("--daily", action="store_true")
+    busy.add_argument("--limit", type=int, default=10)
+    rebuild = commands.add_parser("rebuild", help="Recompute a term's rollups from stored history")
+    rebuild.add_argument("term")
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    if args.command == "courses":
+        rows = courses(db, args.term, args.subject and args.subject.upper())
+        # Courses that never filled or got a waitlist sort last
+        sort_keys = {'course': lambda r: (r['subj'], r['crse']),
+                     'fill': lambda r: (r['time_to_fill'] is None, r['time_to_fill'] or datetime.timedelta()),
+                     'waitlist': lambda r: (r['time_to_waitlist'] is None,
+                                            r['time_to_waitlist'] or datetime.timedelta()),
+                     'peak': lambda r: -r['wl_peak']}
+        print(f"{'course':>10} {'secs':>5} {'cap':>5} {'act':>5} {'wl':>5} {'wl peak':>8} "
+              f"{'first seen':>19} {'to fill':>17} {'to waitlist':>17}")
+        for r in sorted(rows, key=sort_keys[args.sort]):
+            print(f"{r['subj'] + ' ' + r['crse']:>10} {r['sections']:>5} {r['cap']:>5} {r['act']:>5} "
+                  f"{r['wl_act']:>5} {r['wl_peak']:>8} {r['first_ts'][:19]:>19} "
+                  f"{_duration(r['time_to_fill']):>17} {_duration(r['time_to_waitlist']):>17}")
+    elif args.command == "velocity":
+        print(f"{'bucket':>13} {'added':>6} {'dropped':>8} {'act':>5} {'wl':>5}")
+        for bucket, added, dropped, act, wl_act in velocity(db, args.term, *_course(args.course), args.daily,
+                                                            args.start, args.end):
+            print(f"{bucket:>13} {added:>6} {dropped:>8} {act:>5} {wl_act:>5}")
+    elif args.command == "busiest":
+        print(f"{'bucket':>13} {'added':>6} {'dropped':>8}")
+        for bucket, added, dropped in busiest(db, args.term, args.daily, args.limit):
+            print(f"{bucket:>13} {added:>6} {dropped:>8}")
+    elif args.command == "rebuild":
+        print(f"Replayed {Rollups(db).rebuild(args.term)} scrapes")
+    else:
+        parser.print_help()
+    db.close()
@@ -0,0 +1,120 @@
+"""
+The original dbadd, kept as the baseline of the ingestion benchmarks
+
+coursexp.dbadd now writes through DBWriter, so benchmarking it against
+DBWriter would measure DBWriter twice. This is dbadd as it was before:
+a connection per call, an existence check and a SELECT or INSERT per
+section, one S19_<CRN> table per section. Only the email on non integer
+counts is left out, the benchmarks never produce those.
+"""
+import re
+import sqlite3
+import logging
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+
+def dbadd(rows, scrape_time, dbname='OMSCS_CA.db'):
+    """
+    Creates/adds to course table & table for each course
+
+    :param rows: Rows from course table, in the 22 or 26 field layout
+    :param scrape_time: Time the rows were scraped, datetime object
+    :param dbname: Name of the database to write to
+    """
+    # Account for courses that can be registered for
+    for i in range(0, len(rows)):
+        if len(rows[i]) == 26:
+            rows[i] = rows[i][4:]
+    row_size = 22
+    ue_rows = [row for row in rows[1:] if len(row) != row_size]
+    if len(ue_rows) != 0:
+        logger.error(f"Bad row lengths found:{len(ue_rows)}")
+        logger.error(f"Rows\n{ue_rows}")
+
+    # Ensure at minimum, key fields can be repd as int
+    irows = [[row[2]] + [row[4]] + row[12:18] for row in rows[2:]]
+    [int(el) for row in irows for el in row]
+
+    conn = sqlite3.connect(dbname, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    cursor = conn.cursor()
+    courses = [row[2] for row in rows[2:]]
+    semester_prefix = "S19"
+    course_tbl = f"courses{semester_prefix}"
+    tb_exists = f"SELECT name FROM sqlite_master WHERE type='table' AND name='{course_tbl}'"
+    if not cursor.execute(tb_exists).fetchone():
+        logger.warning(f"{course_tbl} table being created")
+        cursor.execute("""
+            CREATE TABLE {}(
+            Slct,
+            CRN,
+            Subj,
+            Crse,
+            Sec,
+            Cmp,
+            Bas,
+            Cred,
+            Title,
+            Days,
+            Time,
+            Instructor,
+            Location,
+            Attribute
+            )""".format(course_tbl))
+        for row in rows[2:]:
+            row_data = row[1:12] + row[18:21]
+            cursor.execute("""
+                INSERT INTO {}
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""".format(course_tbl),
+                           row_data)
+    else:
+        # Check if course data has changed
+        for row in rows[2:]:
+            crn = row[2]
+            row_data = tuple(row[1:12] + row[18:21])
+            cursor.execute(f"SELECT * FROM {course_tbl} where CRN='{crn}'")
+            tbl_data = cursor.fetchall()
+            if row_data not in tbl_data:
+                logger.warning("Changes to course table rows")
+                logger.warning(f"scrape: {row_data}")
+                logger.warning(f"db:     {tbl_data}")
+                cursor.execute("""
+                    INSERT INTO {}
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""".format(course_tbl),
+                               row_data)
+
+    # The original check, CRNs never match it
+    for course in courses:
+        if re.match(r"^[a-zA-Z][\w]+$", course):
+            logger.error(f"Illegal course name found: {course}")
+            raise ValueError(f"Illegal course name found: {course}")
+    course_tables = [semester_prefix + "_" + course for course in courses]
+    enroll_stats = [row[12:18] for row in rows[2:]]
+
+    # Fill in enrollment numbers for each course
+    for i in range(0, len(course_tables)):
+        course = course_tables[i]
+        row_stats = enroll_stats[i]
+        row_stats.insert(0, scrape_time)
+        tb_exists = f"SELECT name FROM sqlite_master WHERE type='table' AND name='{course}'"
+        if not cursor.execute(tb_exists).fetchone():
+            logger.warning(f"{course} table being created")
+            cursor.execute("""
+                CREATE TABLE {}(
+                Timestamp,
+                Cap,
+                Act,
+                Rem,
+                WL_Cap,
+                WL_Act,
+                WL_Rem
+                )""".format(course))
+        cursor.execute("""
+            INSERT INTO {}
+            VALUES (?, ?, ?, ?, ?, ?, ?)""".format(course),
+                       row_stats)
+    conn.commit()
+    conn.close()
+    logger.debug("DB fill finished")
@@ -0,0 +1,110 @@
+"""
+Alert evaluation cost per scrape
+
+Times AlertEngine.observe against a naive check of every subscription
+against every section, for a growing number of subscriptions and a
+fixed share of sections changing between scrapes. The engine's cost
+should follow the changed sections, the naive one subscriptions x sections.
+
+Deliveries are counted instead of sent.
+
+Usage (from the repository root):
+python -m benchmarks.bench_alerts [--sections 1000] [--churn 0.03] [--subscriptions 100 1000 10000]
+"""
+import argparse
+import datetime
+import logging
+import os
+import random
+import tempfile
+import time
+
+from alerts import RULES, AlertEngine, add_subscription, load_subscriptions
+from dbwriter import DBWriter
+from sections import Section
+
+TERM = '202002'
+START = datetime.datetime(2019, 11, 1)
+
+
+def make_sections(n_sections, rng, previous=None, churn=0.03):
+    """
+    :param previous: Sections of the last scrape, None for a first scrape
+    :return: List of Section, churn share of them with changed counts
+    """
+    sections = []
+    for i in range(n_sections):
+        if previous is None:
+            cap, act = 50, rng.randint(40, 50)
+            wl_act = rng.randint(0, 5)
+        else:
+            cap, act, _, _, wl_act, _ = previous[i].counts
+            if rng.random() < churn:
+                act = min(max(act + rng.choice((-1, 1)), 0), cap)
+                wl_act = max(wl_act + rng.choice((-1, 0, 1)), 0)
+        sections.append(Section(crn=20000 + i, subj='CS', crse=str(6000 + i // 4), sec=f'O{i % 4:02}', cmp='O',
+                                cap=cap, act=act, rem=cap - act, wl_cap=10, wl_act=wl_act, wl_rem=10 - wl_act))
+    return sections
+
+
+def naive(subscriptions, previous, sections):
+    """Every subscription checked against every section"""
+    old = {sec.crn: sec.counts for sec in previous}
+    fired = 0
+    for sub in subscriptions:
+        for sec in sections:
+            if (sub.crn == sec.crn or sub.course == f"{sec.subj} {sec.crse}") and \
+                    RULES[sub.rule](old[sec.crn], sec.counts, sub.threshold):
+                fired += 1
+    return fired
+
+
+def run(n_subscriptions, n_sections, churn, scrapes, tmp, seed=0):
+    """
+    :return: (mean engine seconds, mean naive seconds, alerts fired by the engine)
+    """
+    rng = random.Random(seed)
+    writer = DBWriter(os.path.join(tmp, f"alerts{n_subscriptions}.db"), term=TERM)
+    for i in range(n_subscriptions):
+        crn = 20000 + rng.randrange(n_sections)
+        if rng.random() < 0.8:
+            add_subscription(writer.conn, TERM, rng.choice(sorted(RULES)), f"user{i}@example.com", crn=crn)
+        else:
+            add_subscription(writer.conn, TERM, rng.choice(sorted(RULES)), f"user{i}@example.com",
+                             course=f"CS {6000 + (crn - 20000) // 4}")
+    delivered = []
+    engine = AlertEngine(writer.conn, deliver=delivered.append)
+    subscriptions = load_subscriptions(writer.conn, TERM)
+    previous = make_sections(n_sections, rng)
+    writer.write(previous, START)
+    engine_seconds = naive_seconds = 0
+    for i in range(1, scrapes + 1):
+        sections = make_sections(n_sections, rng, previous, churn)
+        scrape_time = START + datetime.timedelta(minutes=30 * i)
+        # Written without listeners, so only the evaluation itself is timed
+        writer.write(sections, scrape_time)
+        start = time.perf_counter()
+        engine.observe(TERM, sections, scrape_time)
+        engine_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        naive(subscriptions, previous, sections)
+        naive_seconds += time.perf_counter() - start
+        previous = sections
+    writer.close()
+    return engine_seconds / scrapes, naive_seconds / scrapes, len(delivered)
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--churn", type=float, default=0.03, help="Share of sections changing per scrape")
+    parser.add_argument("--subscriptions", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--scrapes", type=int, default=5)
+    args = parser.parse_args()
+    print(f"{args.sections} sections, {100 * args.churn:.0f}% changing per scrape")
+    print(f"{'subscriptions':>14} {'engine ms':>10} {'naive ms':>10} {'alerts':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.subscriptions:
+            engine_s, naive_s, fired = run(n, args.sections, args.churn, args.scrapes, tmp)
+            print(f"{n:>14} {1000 * engine_s:>10.2f} {1000 * naive_s:>10.2f} {fired:>7}")
@@ -0,0 +1,118 @@
+"""
+Analytics rollup cost and query latency over a simulated term
+
+Writes a term of 30 minute scrapes with Rollups attached to the writer,
+then times the analytics queries against the same answers computed
+from the enrollment table, and checks that rebuild() reproduces the
+incrementally maintained rollups.
+
+Usage (from the repository root):
+python -m benchmarks.bench_analytics [--courses 150] [--days 30] [--store full]
+"""
+import argparse
+import datetime
+import logging
+import os
+import random
+import tempfile
+import time
+
+import analytics
+from dbwriter import DBWriter
+from sections import Section
+
+TERM = '202002'
+START = datetime.datetime(2019, 11, 1)
+SECTIONS_PER_COURSE = 4
+
+
+def simulate(writer, n_courses, days, seed=0):
+    """
+    Write one scrape every 30 minutes, seats filling faster in the first days
+
+    :return: Number of scrapes written
+    """
+    rng = random.Random(seed)
+    n_sections = n_courses * SECTIONS_PER_COURSE
+    act = [rng.randint(0, 20) for _ in range(n_sections)]
+    wl_act = [0] * n_sections
+    scrapes = days * 48
+    for i in range(scrapes):
+        now = START + datetime.timedelta(minutes=30 * i)
+        rate = 0.3 * 0.9 ** (i / 48) + 0.01
+        sections = []
+        for j in range(n_sections):
+            if rng.random() < rate:
+                if act[j] < 50:
+                    act[j] += 1
+                elif wl_act[j] < 10:
+                    wl_act[j] += 1
+            elif rng.random() < 0.005 and act[j] > 0:
+                act[j] -= 1
+            sections.append(Section(crn=20000 + j, subj='CS', crse=str(6000 + j // SECTIONS_PER_COURSE),
+                                    sec=f'O{j % SECTIONS_PER_COURSE:02}', cmp='O', cap=50, act=act[j],
+                                    rem=50 - act[j], wl_cap=10, wl_act=wl_act[j], wl_rem=10 - wl_act[j]))
+        writer.write(sections, now, term=TERM, subject='CS', campus='O')
+    return scrapes
+
+
+def raw_time_to_fill(conn):
+    """Time to fill of every course computed from the enrollment table"""
+    return conn.execute("""
+        SELECT subj, crse, min(ts) FROM (
+            SELECT s.subj, s.crse, e.ts, sum(e.act) AS act, sum(e.cap) AS cap
+            FROM enrollment e JOIN sections s ON s.term=e.term AND s.crn=e.crn
+            WHERE e.term=? GROUP BY s.subj, s.crse, e.ts)
+        WHERE act>=cap GROUP BY subj, crse""", (TERM,)).fetchall()
+
+
+def raw_velocity(conn, crse):
+    """Hourly net seat changes of one course computed from the enrollment table"""
+    return conn.execute("""
+        SELECT substr(e.ts, 1, 13), sum(e.act) FROM enrollment e JOIN sections s ON s.term=e.term AND s.crn=e.crn
+        WHERE e.term=? AND s.subj='CS' AND s.crse=? GROUP BY substr(e.ts, 1, 13), e.ts""",
+                        (TERM, crse)).fetchall()
+
+
+def best_ms(fction, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fction()
+        best = min(best, time.perf_counter() - start)
+    return 1000 * best
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--courses", type=int, default=150)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--store", choices=("full", "changes"), default="full")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        for attach in (False, True):
+            writer = DBWriter(os.path.join(tmp, f"analytics{int(attach)}.db"), term=TERM, store=args.store)
+            rollups = analytics.Rollups(writer.conn)
+            if attach:
+                writer.listeners.append(rollups.observe)
+            start = time.perf_counter()
+            scrapes = simulate(writer, args.courses, args.days)
+            elapsed = time.perf_counter() - start
+            print(f"{scrapes} scrapes of {args.courses * SECTIONS_PER_COURSE} sections "
+                  f"{'with' if attach else 'without'} rollups: {1000 * elapsed / scrapes:.2f} ms per scrape")
+        conn = writer.conn
+        queries = [('courses', lambda: analytics.courses(conn, TERM)),
+                   ('velocity', lambda: analytics.velocity(conn, TERM, 'CS', '6000')),
+                   ('busiest', lambda: analytics.busiest(conn, TERM))]
+        if args.store == 'full':
+            queries += [('raw time to fill', lambda: raw_time_to_fill(conn)),
+                        ('raw velocity', lambda: raw_velocity(conn, '6000'))]
+        for name, query in queries:
+            print(f"{name:>17}: {best_ms(query):.2f} ms")
+        incremental = analytics.courses(conn, TERM)
+        start = time.perf_counter()
+        analytics.Rollups(conn).rebuild(TERM)
+        print(f"rebuild: {time.perf_counter() - start:.1f} s, "
+              f"{'matches' if analytics.courses(conn, TERM) == incremental else 'DIFFERS FROM'} incremental")
+        writer.close()
@@ -0,0 +1,85 @@
+"""
+Live API throughput
+
+Serves a snapshot of synthetic sections from liveapi and requests it
+from several keep-alive clients at once: single sections, the whole
+term, and single sections revalidated with If-None-Match. Reports
+requests per second.
+
+Usage (from the repository root):
+python -m benchmarks.bench_api [--sections 500] [--clients 8] [--seconds 3]
+"""
+import argparse
+import http.client
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from dbwriter import DBWriter
+import liveapi
+from benchmarks.bench_dbwriter import synthetic_rows
+from sections import Section
+
+
+def client(port, paths, etags, deadline, counts, index):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    rng = random.Random(index)
+    done = 0
+    while time.perf_counter() < deadline:
+        path = rng.choice(paths)
+        conn.request('GET', path, headers={'If-None-Match': etags[path]} if etags else {})
+        response = conn.getresponse()
+        response.read()
+        assert response.status == (304 if etags else 200)
+        done += 1
+    conn.close()
+    counts[index] = done
+
+
+def run(port, paths, clients, seconds, etags=None):
+    counts = [0] * clients
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(port, paths, etags, deadline, counts, i))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sections", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        dbname = os.path.join(tmp, "api.db")
+        writer = DBWriter(dbname, term='201902')
+        sections = [Section.from_row(row) for row in synthetic_rows(args.sections)[2:]]
+        writer.write(sections, "2019-11-01 00:00:00", subject='CS', campus='O')
+        writer.close()
+        api = liveapi.LiveAPI(dbname)
+        api.load()
+        server = liveapi.serve(api, 0)
+        crn_paths = [f"/sections/{sec.crn}" for sec in sections]
+        etags = {}
+        for path in crn_paths:
+            conn = http.client.HTTPConnection('127.0.0.1', server.server_port)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            etags[path] = response.getheader('ETag')
+            conn.close()
+        print(f"{args.sections} sections, {args.clients} keep-alive clients, {os.cpu_count()} cores")
+        for name, paths, tags in (("/sections/<crn>", crn_paths, None),
+                                  ("/sections/<crn> 304", crn_paths, etags),
+                                  ("/sections", ["/sections"], None)):
+            print(f"{name:>20}: {run(server.server_port, paths, args.clients, args.seconds, tags):8.0f} req/s")
+        server.shutdown()
+        api.close()
@@ -0,0 +1,69 @@
+"""
+Page archive size and speed
+
+Archives a sequence of synthetic results pages, as a term of scrapes
+would fetch them: enrollment changes between some scrapes and not
+others, so part of the pages are exact repeats. Reports the stored size
+against keeping every page raw or gzipped on its own, and the time to
+add and read back a page.
+
+Usage (from the repository root):
+python -m benchmarks.bench_archive [--sections 500] [--pages 200] [--repeat-share 0.5]
+"""
+import argparse
+import gzip
+import logging
+import os
+import random
+import tempfile
+import time
+
+from pagearchive import PageArchive
+from benchmarks.synthpages import generate_page
+
+
+def page_sequence(n_sections, n_pages, repeat_share, seed=0):
+    """
+    :return: List of page bytes, repeat_share of them identical to the page before
+    """
+    rng = random.Random(seed)
+    pages = []
+    version = 0
+    for _ in range(n_pages):
+        if not pages or rng.random() >= repeat_share:
+            version += 1
+        pages.append(generate_page(n_sections, 'open', seed=version).encode('utf-8'))
+    return pages
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sections", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--repeat-share", type=float, default=0.5, help="Share of fetches repeating the last page")
+    args = parser.parse_args()
+    pages = page_sequence(args.sections, args.pages, args.repeat_share)
+    raw = sum(len(page) for page in pages)
+    gzipped = sum(len(gzip.compress(page)) for page in pages)
+    print(f"{len(pages)} pages of {args.sections} sections, {len(set(pages))} distinct")
+    print(f"{'raw':>22}: {raw / 2**20:8.2f} MB")
+    print(f"{'gzip per page':>22}: {gzipped / 2**20:8.2f} MB ({raw / gzipped:.0f}x)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, train_after in (('archive, no dictionary', None), ('archive, dictionary', 20)):
+            archive = PageArchive(os.path.join(tmp, f"{train_after}.db"), train_after=train_after)
+            start = time.perf_counter()
+            for i, page in enumerate(pages):
+                archive.add(page, '201902', 'CS', 'O', fetched=f"2019-11-01 00:00:{i:06}")
+            add_ms = 1000 * (time.perf_counter() - start) / len(pages)
+            stored = archive.stats().stored_bytes
+            hashes = [digest for *_, digest in archive.pages('201902')]
+            start = time.perf_counter()
+            for digest in hashes:
+                archive.get(digest)
+            get_ms = 1000 * (time.perf_counter() - start) / len(hashes)
+            assert [archive.get(digest) for digest in hashes] == pages
+            archive.close()
+            file_size = os.path.getsize(os.path.join(tmp, f"{train_after}.db"))
+            print(f"{name:>22}: {stored / 2**20:8.2f} MB ({raw / stored:.0f}x), file {file_size / 2**20:.2f} MB, "
+                  f"add {add_ms:.1f} ms, read {get_ms:.1f} ms")
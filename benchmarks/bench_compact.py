@@ -0,0 +1,104 @@
+"""
+Compaction of old enrollment
+
+Writes a month of scrapes to a full store, then downsamples all but the
+last week with compact.py while another connection keeps writing
+scrapes, as etracker's scrape job would. Reports rows and file size
+before and after, the longest compaction transaction, and the slowest
+concurrent write. Checks that enrollhist returns the same histories,
+series and snapshots before and after.
+
+Usage (from the repository root):
+python -m benchmarks.bench_compact [--sections 1000] [--scrapes 1440] [--churn 0.03]
+"""
+import argparse
+import datetime
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import compact
+from dbwriter import DBWriter, connect
+import enrollhist
+from benchmarks.bench_storage import scrape_sequence
+
+TERM = '201902'
+
+
+def queries(conn, crns, times):
+    return ([enrollhist.history(conn, TERM, crn) for crn in crns],
+            [enrollhist.series(conn, TERM, crn, times[0], times[-1]) for crn in crns],
+            [enrollhist.snapshot_at(conn, TERM, when) for when in times],
+            enrollhist.change_counts(conn, TERM))
+
+
+def run(n_sections, n_scrapes, churn, keep_days, daily_days, tmp):
+    dbname = os.path.join(tmp, 'full.db')
+    writer = DBWriter(dbname, term=TERM)
+    scrapes = scrape_sequence(n_sections, n_scrapes + 48, churn)
+    last = None
+    for _, (sections, scrape_time) in zip(range(n_scrapes), scrapes):
+        writer.write(sections, scrape_time)
+        last = scrape_time
+    writer.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    rows = writer.conn.execute("SELECT count(*) FROM enrollment").fetchone()[0]
+    size = os.path.getsize(dbname)
+
+    first = datetime.datetime(2019, 1, 1)
+    crns = (20000, 20000 + n_sections // 2, 20000 + n_sections - 1)
+    times = [first + datetime.timedelta(hours=hours) for hours in range(7, int((last - first).total_seconds() // 3600),
+                                                                        97)]
+    before = queries(writer.conn, crns, times)
+
+    # A day of scrapes written while compaction runs
+    latencies = []
+
+    def scrape():
+        for sections, scrape_time in scrapes:
+            started = time.perf_counter()
+            writer.write(sections, scrape_time)
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.01)
+
+    conn = connect(dbname)
+    thread = threading.Thread(target=scrape)
+    thread.start()
+    started = time.perf_counter()
+    stats = compact.compact(conn, keep_days, daily_days, now=last)[TERM]
+    elapsed = time.perf_counter() - started
+    thread.join()
+    after = queries(conn, crns, times)
+    assert before[0] == [enrollhist.history(conn, TERM, crn, None, last) for crn in crns]
+    assert before[1:] == after[1:3] + (after[3][:len(before[3])],)
+    writer.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    remaining = conn.execute("SELECT count(*) FROM enrollment").fetchone()[0]
+    rollups = conn.execute("SELECT resolution, count(*) FROM enrollment_rollups GROUP BY resolution").fetchall()
+    conn.close()
+    writer.close()
+    return {'rows': (rows, remaining), 'size': (size, os.path.getsize(dbname)), 'stats': stats,
+            'elapsed': elapsed, 'rollups': dict(rollups), 'latencies': latencies}
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description="compaction of old enrollment")
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--scrapes", type=int, default=1440, help="1440 is 30 days at 30 minutes")
+    parser.add_argument("--churn", type=float, default=0.03)
+    parser.add_argument("--keep-days", type=float, default=7)
+    parser.add_argument("--daily-days", type=float, default=14)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(args.sections, args.scrapes, args.churn, args.keep_days, args.daily_days, tmp)
+    stats = result['stats']
+    print(f"enrollment rows  {result['rows'][0]:>10} -> {result['rows'][1]}")
+    print(f"db bytes         {result['size'][0]:>10} -> {result['size'][1]}")
+    print(f"rollups          {result['rollups']}")
+    print(f"compaction       {result['elapsed']:.2f}s in {stats.transactions} transactions, "
+          f"longest {stats.longest * 1000:.0f} ms")
+    latencies = sorted(result['latencies'])
+    print(f"concurrent writes {len(latencies)}, median {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"slowest {latencies[-1] * 1000:.0f} ms")
+    print("Histories, series and snapshots match")
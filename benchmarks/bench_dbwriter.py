@@ -0,0 +1,87 @@
+"""
+Benchmark dbadd against the persistent DBWriter
+
+Times repeated scrapes of 100, 1,000 and 10,000 synthetic sections
+written by the original per call dbadd of benchmarks.baseline and by
+coursexp.dbadd through one long lived DBWriter, in both the legacy per
+course layout and the long layout.
+
+Usage (from the repository root):
+python -m benchmarks.bench_dbwriter [--cycles 3]
+"""
+import argparse
+import copy
+import datetime
+import logging
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import baseline
+from coursexp import dbadd
+from dbwriter import DBWriter
+
+SIZES = (100, 1000, 10000)
+
+
+def synthetic_rows(n_sections, seed=0):
+    """
+    Rows in the 22 field layout returned by scrape_courses
+
+    :param n_sections: Number of course sections
+    :param seed: Random seed, enrollment numbers vary between seeds
+    :return: List of rows including the two header rows
+    """
+    rng = random.Random(seed)
+    rows = [['', 'Computer Science', ''],
+            ['', 'Select', 'CRN', 'Subj', 'Crse', 'Sec', 'Cmp', 'Bas', 'Cred', 'Title', 'Days', 'Time',
+             'Cap', 'Act', 'Rem', 'WL Cap', 'WL Act', 'WL Rem', 'Instructor', 'Location', 'Attribute', '']]
+    for i in range(n_sections):
+        cap = rng.choice((50, 100, 250, 500))
+        act = rng.randint(0, cap)
+        wl_act = rng.randint(0, 20)
+        rows.append(['', 'C', str(20000 + i), 'CS', str(6000 + i % 900), f'O{i % 20:02d}', 'O', 'L',
+                     '3.000', f'Course {i}', 'TBA', 'TBA', str(cap), str(act), str(cap - act),
+                     '100', str(wl_act), str(100 - wl_act), 'Staff (P)', 'TBA', 'Online', ''])
+    return rows
+
+
+def run(n_sections, cycles):
+    """
+    Time `cycles` scrapes after an initial table creating scrape
+
+    :return: Seconds per scrape for dbadd, legacy layout writer, long layout writer
+    """
+    scrapes = [synthetic_rows(n_sections, seed) for seed in range(cycles + 1)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, 'legacy.db')
+        baseline.dbadd(copy.deepcopy(scrapes[0]), datetime.datetime.now(), dbname=legacy_db)
+        start = time.perf_counter()
+        for rows in scrapes[1:]:
+            baseline.dbadd(copy.deepcopy(rows), datetime.datetime.now(), dbname=legacy_db)
+        results.append((time.perf_counter() - start) / cycles)
+
+        for layout in ('legacy', 'long'):
+            writer = DBWriter(os.path.join(tmp, f'{layout}_writer.db'), term='201902', layout=layout)
+            dbadd(copy.deepcopy(scrapes[0]), datetime.datetime.now(), writer=writer)
+            start = time.perf_counter()
+            for rows in scrapes[1:]:
+                dbadd(copy.deepcopy(rows), datetime.datetime.now(), writer=writer)
+            results.append((time.perf_counter() - start) / cycles)
+            writer.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="dbadd vs DBWriter")
+    parser.add_argument("--cycles", type=int, default=3, help="Timed scrapes per size")
+    args = parser.parse_args()
+    # Table creation warnings would otherwise flood stderr
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    print(f"{'sections':>9} {'dbadd s':>10} {'writer s':>10} {'speedup':>8} {'long s':>10} {'speedup':>8}")
+    for size in SIZES:
+        legacy, batched, long = run(size, args.cycles)
+        print(f"{size:>9} {legacy:>10.4f} {batched:>10.4f} {legacy / batched:>7.1f}x"
+              f" {long:>10.4f} {legacy / long:>7.1f}x")
@@ -0,0 +1,95 @@
+"""
+Columnar export against reading enrollment from sqlite
+
+Fills a database with a term of full storage scrapes, exports it with
+colexport, appends a few more scrapes and exports again, then computes
+the peak enrollment of every section both from the memory mapped export
+with NumPy and row by row from sqlite.
+
+Usage (from the repository root):
+python -m benchmarks.bench_export [--sections 1000] [--scrapes 2000]
+"""
+import argparse
+import datetime
+import logging
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import colexport
+from dbwriter import connect, create_schema
+
+TERM = '202002'
+START = datetime.datetime(2019, 11, 1)
+
+
+def fill(conn, n_sections, first, last, seed=0):
+    """Insert scrapes first..last-1, 30 minutes apart, straight into the long layout"""
+    rng = random.Random(seed + first)
+    conn.execute("BEGIN")
+    for i in range(first, last):
+        ts = (START + datetime.timedelta(minutes=30 * i)).isoformat(" ")
+        rows = []
+        for j in range(n_sections):
+            act = min(i * 50 // 1000 + rng.randint(0, 3), 50)
+            rows.append((TERM, 20000 + j, ts, 50, act, 50 - act, 10, 0, 10))
+        conn.executemany("INSERT INTO enrollment VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT INTO scrapes VALUES (?, '', '', ?, ?)", (TERM, ts, n_sections))
+    conn.execute("COMMIT")
+
+
+def peak_sqlite(dbname):
+    """Peak Act per CRN, reading every row into Python"""
+    conn = connect(dbname, readonly=True)
+    peaks = {}
+    for crn, act in conn.execute("SELECT crn, act FROM enrollment WHERE term=?", (TERM,)):
+        if act > peaks.get(crn, -1):
+            peaks[crn] = act
+    conn.close()
+    return peaks
+
+
+def peak_numpy(out_dir):
+    """Peak Act per CRN from the memory mapped export"""
+    columns = colexport.load(out_dir, TERM)
+    peaks = np.full(len(columns['crns']), -1, dtype='<i4')
+    np.maximum.at(peaks, columns['crn_id'], columns['act'])
+    return dict(zip(columns['crns'].tolist(), peaks.tolist()))
+
+
+def timed(fction, *args):
+    start = time.perf_counter()
+    result = fction(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--scrapes", type=int, default=2000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        dbname = os.path.join(tmp, 'bench.db')
+        out_dir = os.path.join(tmp, 'export')
+        conn = connect(dbname)
+        create_schema(conn)
+        fill(conn, args.sections, 0, args.scrapes)
+        print(f"{args.sections * args.scrapes} observations of {args.sections} sections")
+        reader = connect(dbname, readonly=True)
+        seconds, rows = timed(colexport.export_term, reader, TERM, out_dir)
+        print(f"full export: {seconds:.2f} s, {rows} rows")
+        fill(conn, args.sections, args.scrapes, args.scrapes + 10)
+        seconds, rows = timed(colexport.export_term, reader, TERM, out_dir)
+        print(f"incremental export of 10 scrapes: {seconds:.3f} s, {rows} rows")
+        reader.close()
+        conn.close()
+        sqlite_s, from_sqlite = timed(peak_sqlite, dbname)
+        numpy_s, from_numpy = timed(peak_numpy, out_dir)
+        load_s, _ = timed(colexport.load, out_dir, TERM)
+        print(f"peak per section from sqlite: {sqlite_s:.2f} s")
+        print(f"peak per section from export: {numpy_s:.3f} s (load {1000 * load_s:.1f} ms), "
+              f"{'same' if from_numpy == from_sqlite else 'DIFFERENT'} result")
@@ -0,0 +1,74 @@
+"""
+Logging cost on the scraping thread
+
+Times log calls as the scrape thread sees them, with the plain
+FileHandler logsetup used to attach and with logpipe's queue. Each
+round logs a few short messages and one dump of a results page's rows,
+at ERROR and at a disabled DEBUG level, as dbadd does.
+
+Usage (from the repository root):
+python -m benchmarks.bench_logging [--rounds 2000] [--rows 500]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import logpipe
+from logpipe import fields
+from benchmarks.bench_dbwriter import synthetic_rows
+
+
+def file_handler(logger, logfile):
+    # coursexp.logsetup before logpipe
+    handler = logging.FileHandler(logfile)
+    handler.setFormatter(logging.Formatter('%(asctime)s:%(funcName)-8s:%(levelname)-8s %(message)s'))
+    logger.addHandler(handler)
+    return handler.close
+
+
+def pipe(logger, logfile):
+    logpipe.attach(logger, logfile)
+    return logpipe.stop_all
+
+
+def run(setup, rounds, rows, tmp):
+    logger = logging.getLogger(f'bench_logging.{setup.__name__}')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    close = setup(logger, os.path.join(tmp, f'{setup.__name__}.log'))
+    page = synthetic_rows(rows)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(rounds):
+        call = time.perf_counter()
+        logger.info(f"Preforming scheduled actions on {i} targets")
+        logger.info("Scrape complete")
+        if setup is pipe:
+            logger.error(f"Bad row lengths found:{len(page)}", extra=fields(rows=lambda: page))
+            logger.debug("Rows with bad lengths", extra=fields(rows=lambda: page))
+        else:
+            logger.error(f"Bad row lengths found:{len(page)}")
+            logger.error(f"Rows\n{page}")
+        latencies.append(time.perf_counter() - call)
+    caller = time.perf_counter() - started
+    close()
+    total = time.perf_counter() - started
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    latencies.sort()
+    return caller, total, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description="logging cost on the scraping thread")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=500, help="Rows in each dumped page")
+    args = parser.parse_args()
+    print(f"{'handler':>12} {'caller s':>9} {'total s':>8} {'median us':>10} {'p99 us':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for setup in (file_handler, pipe):
+            caller, total, median, p99 = run(setup, args.rounds, args.rows, tmp)
+            print(f"{setup.__name__:>12} {caller:>9.3f} {total:>8.3f} {median * 1e6:>10.0f} {p99 * 1e6:>8.0f}")
@@ -0,0 +1,91 @@
+"""
+Benchmark the typed section parser against the list of rows path
+
+legacy - parse_course_table, then dbadd's 26 -> 22 trim and int checks
+typed  - sections.parse_sections
+
+Reports seconds and peak memory per page for large synthetic pages.
+Memory is the peak RSS growth while parsing, measured in a fresh child
+process, so it includes the libxml2 element tree that tracemalloc
+cannot see. Linux only, it relies on /proc/self/clear_refs.
+
+Usage (from the repository root):
+python -m benchmarks.bench_parser [--sections 1000 10000]
+"""
+import argparse
+import multiprocessing
+import re
+import tempfile
+import time
+
+from coursexp import parse_course_table
+from sections import parse_sections
+from benchmarks.synthpages import generate_page
+
+
+def legacy_parse(html_source):
+    """The parse and validation steps scrape_courses + dbadd perform before writing"""
+    rows = parse_course_table(html_source)
+    for i in range(0, len(rows)):
+        if len(rows[i]) == 26:
+            rows[i] = rows[i][4:]
+    irows = [[row[2]] + [row[4]] + row[12:18] for row in rows[2:]]
+    [int(el) for row in irows for el in row]
+    return rows
+
+
+PARSERS = {'legacy': legacy_parse, 'typed': parse_sections}
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as fh:
+        return int(re.search(field + r':\s+(\d+)', fh.read()).group(1))
+
+
+def _peak_rss_growth(name, path, queue):
+    with open(path) as fh:
+        html_source = fh.read()
+    # Reset the high water mark left by reading the page
+    with open('/proc/self/clear_refs', 'w') as fh:
+        fh.write('5')
+    before = _status_kb('VmRSS')
+    result = PARSERS[name](html_source)
+    queue.put(_status_kb('VmHWM') - before)
+    del result
+
+
+def measure(name, size, layout, repeat=5):
+    """
+    :return: (best seconds, peak RSS growth in bytes)
+    """
+    html_source = generate_page(size, layout)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        PARSERS[name](html_source)
+        best = min(best, time.perf_counter() - start)
+    # Fresh interpreter reading the page from disk, so earlier allocations
+    # cannot be reused and hide part of the peak
+    with tempfile.NamedTemporaryFile('w', suffix='.html') as fh:
+        fh.write(html_source)
+        fh.flush()
+        ctx = multiprocessing.get_context('spawn')
+        queue = ctx.Queue()
+        child = ctx.Process(target=_peak_rss_growth, args=(name, fh.name, queue))
+        child.start()
+        growth_kb = queue.get()
+        child.join()
+    return best, growth_kb * 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="list of rows vs typed section parsing")
+    parser.add_argument("--sections", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+    print(f"{'sections':>9} {'layout':>7} {'legacy s':>9} {'typed s':>9} {'legacy MB':>10} {'typed MB':>9}")
+    for size in args.sections:
+        for layout in ('closed', 'open'):
+            legacy_s, legacy_mem = measure('legacy', size, layout)
+            typed_s, typed_mem = measure('typed', size, layout)
+            print(f"{size:>9} {layout:>7} {legacy_s:>9.3f} {typed_s:>9.3f} "
+                  f"{legacy_mem / 2**20:>10.1f} {typed_mem / 2**20:>9.1f}")
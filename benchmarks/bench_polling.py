@@ -0,0 +1,113 @@
+"""
+Compare fixed and adaptive polling on a simulated term
+
+Seat changes are simulated as a Poisson process per section: busy
+during registration phases, decaying through each phase, and sparse
+otherwise. Every scrape is written with store="changes" and the
+adaptive policy reads its change rates back from that database, as it
+does in etracker.
+
+Reports scrapes made, seat changes seen as separate transitions (two
+changes of a section between scrapes collapse into one) and the mean
+delay from a change to the first scrape that saw it.
+
+Usage (from the repository root):
+python -m benchmarks.bench_polling [--sections 150] [--days 14]
+"""
+import argparse
+import bisect
+import datetime
+import logging
+import os
+import random
+import tempfile
+
+from dbwriter import DBWriter
+from pollpolicy import AdaptivePolicy, Phase, PollPlan
+from scrapepool import Target
+from sections import Section
+
+START = datetime.datetime(2019, 11, 1)
+TARGET = Target('202002', 'CS', 'O')
+
+
+def simulate_changes(n_sections, days, phases, seed=0):
+    """
+    :return: Per section sorted list of change times
+    """
+    rng = random.Random(seed)
+    end = START + datetime.timedelta(days=days)
+    changes = []
+    for _ in range(n_sections):
+        times = []
+        when = START
+        while when < end:
+            phase = next((p for p in phases if p.start <= when < p.end), None)
+            if phase is not None:
+                # Busiest when the phase opens, settling down over its length
+                progress = (when - phase.start) / (phase.end - phase.start)
+                rate = 2.0 * (1 - progress) + 0.1
+            else:
+                rate = 1 / 48
+            when += datetime.timedelta(hours=rng.expovariate(rate))
+            times.append(when)
+        changes.append([t for t in times if t < end])
+    return changes
+
+
+def run_schedule(changes, days, tmp, name, policy=None, interval=datetime.timedelta(minutes=30)):
+    """
+    :return: (scrapes, changes seen, mean delay minutes)
+    """
+    end = START + datetime.timedelta(days=days)
+    writer = DBWriter(os.path.join(tmp, f"{name}.db"), term=TARGET.term, store='changes')
+    plan = PollPlan([TARGET], policy, start=START) if policy is not None else None
+    now = START
+    scrapes = 0
+    seen = 0
+    delays = []
+    last_count = [0] * len(changes)
+    while now < end:
+        sections = []
+        for i, times in enumerate(changes):
+            count = bisect.bisect_right(times, now)
+            if count != last_count[i]:
+                seen += 1
+                delays += [(now - t).total_seconds() / 60 for t in times[last_count[i]:count]]
+                last_count[i] = count
+            sections.append(Section(crn=20000 + i, subj='CS', crse=str(6000 + i), sec='O01', cmp='O',
+                                    cap=500, act=count % 500, rem=500 - count % 500,
+                                    wl_cap=0, wl_act=0, wl_rem=0))
+        writer.write(sections, now, term=TARGET.term, subject=TARGET.subject, campus=TARGET.campus)
+        scrapes += 1
+        now = plan.reschedule(TARGET, writer.conn, now) if plan is not None else now + interval
+    writer.close()
+    return scrapes, seen, sum(delays) / max(len(delays), 1)
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sections", type=int, default=150)
+    parser.add_argument("--days", type=int, default=14)
+    args = parser.parse_args()
+    phases = [Phase("Phase I", START + datetime.timedelta(days=3, hours=8),
+                    START + datetime.timedelta(days=5, hours=16),
+                    datetime.timedelta(minutes=5), datetime.timedelta(minutes=30)),
+              Phase("Phase II", START + datetime.timedelta(days=10, hours=8),
+                    START + datetime.timedelta(days=11, hours=16),
+                    datetime.timedelta(minutes=5), datetime.timedelta(minutes=30))]
+    changes = simulate_changes(args.sections, args.days, phases)
+    total = sum(len(times) for times in changes)
+    schedules = {
+        'fixed 30m': None,
+        'adaptive': AdaptivePolicy(max_interval=datetime.timedelta(hours=4)),
+        'adaptive+phases': AdaptivePolicy(max_interval=datetime.timedelta(hours=4), phases=phases),
+    }
+    print(f"{total} simulated seat changes over {args.days} days")
+    print(f"{'schedule':>16} {'scrapes':>8} {'seen':>6} {'seen %':>7} {'delay min':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, policy in schedules.items():
+            scrapes, seen, delay = run_schedule(changes, args.days, tmp, name.replace('+', '_').replace(' ', '_'),
+                                                policy)
+            print(f"{name:>16} {scrapes:>8} {seen:>6} {100 * seen / total:>6.1f}% {delay:>10.1f}")
@@ -0,0 +1,60 @@
+"""
+Benchmark concurrent scraping of several targets
+
+Serves a synthetic results page from oscarstub with a fixed response
+delay, then scrapes N targets with the http engine through ScrapePool
+with 1 worker and with N workers, writing into one DBWriter.
+Ideally N workers take about as long as a single target.
+
+Usage (from the repository root):
+python -m benchmarks.bench_pool [--targets 4] [--delay 0.5] [--sections 300]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from dbwriter import DBWriter
+from engines import HttpEngine
+from oscarstub import serve
+from scrapepool import ScrapePool, Target
+from benchmarks.synthpages import generate_page
+
+
+def run(n_targets, delay, n_sections):
+    """
+    :return: List of (workers, seconds, sections written per target)
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "bwckgens.p_proc_term_date.html"), 'w') as fh:
+            fh.write("<html><body>Term selected</body></html>")
+        with open(os.path.join(tmp, "bwskfcls.P_GetCrse_Advanced.html"), 'w') as fh:
+            fh.write(generate_page(n_sections))
+        server = serve(tmp, delay=delay)
+        base_url = f"http://127.0.0.1:{server.server_port}/pls/bprod/"
+        targets = [Target(f"{2019 + i}02", 'CS', 'O') for i in range(n_targets)]
+        for workers in (1, n_targets):
+            writer = DBWriter(os.path.join(tmp, f"pool{workers}.db"), store='changes')
+            pool = ScrapePool(lambda: HttpEngine(cookies={'SESSID': 'stub'}, base_url=base_url),
+                              max_workers=workers, min_interval=0)
+            start = time.perf_counter()
+            written = pool.run(targets, writer)
+            results.append((workers, time.perf_counter() - start, sorted(set(written.values()))))
+            pool.close()
+            writer.close()
+        server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--targets", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.5, help="Stub response delay, seconds")
+    parser.add_argument("--sections", type=int, default=300, help="Sections per results page")
+    args = parser.parse_args()
+    print(f"{'workers':>8} {'seconds':>8}  rows written per target")
+    for workers, seconds, written in run(args.targets, args.delay, args.sections):
+        print(f"{workers:>8} {seconds:>8.2f}  {written}")
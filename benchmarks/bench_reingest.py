@@ -0,0 +1,47 @@
+"""
+Re-ingest throughput
+
+Archives a term of synthetic results pages, then re-ingests it into a
+fresh database with one parsing process and with every core, and with a
+commit per scrape against batched commits. Reports pages per second.
+
+Usage (from the repository root):
+python -m benchmarks.bench_reingest [--sections 500] [--pages 300] [--processes 4]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from pagearchive import PageArchive
+from reingest import BATCH, reingest
+from benchmarks.bench_archive import page_sequence
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sections", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--repeat-share", type=float, default=0.5, help="Share of fetches repeating the last page")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        archive_path = os.path.join(tmp, "pages.db")
+        archive = PageArchive(archive_path)
+        for i, page in enumerate(page_sequence(args.sections, args.pages, args.repeat_share)):
+            archive.add(page, '201902', 'CS', 'O', fetched=f"2019-11-01 00:00:{i:06}")
+        archive.close()
+        print(f"{args.pages} pages of {args.sections} sections, {os.cpu_count()} cores")
+        runs = [(1, 1), (1, BATCH)]
+        if args.processes > 1:
+            runs += [(args.processes, 1), (args.processes, BATCH)]
+        for processes, batch in runs:
+            dbname = os.path.join(tmp, f"{processes}_{batch}.db")
+            start = time.perf_counter()
+            stats = reingest('201902', dbname, archive_path, processes=processes, batch=batch, rollups=False)
+            elapsed = time.perf_counter() - start
+            assert stats.written == args.pages
+            print(f"{processes:>3} processes, {batch:>4} scrapes per commit: {elapsed:6.2f} s, "
+                  f"{stats.pages / elapsed:6.0f} pages/s")
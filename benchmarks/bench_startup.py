@@ -0,0 +1,92 @@
+"""
+Startup time of the omscs command line
+
+Runs each command in a fresh interpreter several times and reports the
+median wall time, and the time on top of an interpreter that does
+nothing. Fails when a read only command takes longer than the budget
+over the bare interpreter, or loads any of the heavy dependencies only
+scraping needs, so a module level import of one of them is caught.
+
+Usage (from the repository root):
+python -m benchmarks.bench_startup [--runs 15] [--budget-ms 80]
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from dbwriter import DBWriter
+from benchmarks.bench_storage import scrape_sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules a read only command must not import
+HEAVY = ('selenium', 'lxml', 'dotenv', 'smtplib', 'numpy', 'requests', 'apscheduler', 'http.server')
+# Runs the command in process, then prints the heavy modules it loaded
+LOADED = ("import sys, io, contextlib; sys.path.insert(0, {root!r}); import omscs\n"
+          "with contextlib.redirect_stdout(io.StringIO()): omscs.main({argv!r})\n"
+          "print(' '.join(name for name in {heavy!r} if name in sys.modules))")
+
+
+def median_time(command, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def loaded(argv):
+    code = LOADED.format(root=ROOT, argv=argv, heavy=HEAVY)
+    return subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.split()
+
+
+def run(runs, tmp):
+    """
+    :return: List of (name, median seconds, heavy modules loaded or None if not checked)
+    """
+    dbname = os.path.join(tmp, 'startup.db')
+    writer = DBWriter(dbname, term='201902')
+    for _, (sections, scrape_time) in zip(range(48), scrape_sequence(300, 48, 0.05)):
+        writer.write(sections, scrape_time)
+    writer.close()
+    omscs = [sys.executable, os.path.join(ROOT, "omscs.py")]
+    read_only = {
+        'query terms': ["query", "terms", "--db", dbname],
+        'query snapshot': ["query", "snapshot", "--db", dbname],
+        'query history': ["query", "history", "--db", dbname, "--crn", "20000"],
+        'help': ["--help"],
+    }
+    results = [('python -c pass', median_time([sys.executable, "-c", "pass"], runs), None)]
+    for name, argv in read_only.items():
+        heavy = loaded(argv) if argv != ["--help"] else []
+        results.append((name, median_time(omscs + argv, runs), heavy))
+    # What every command paid before, coursexp is imported by etracker and regpage
+    results.append(('import coursexp', median_time([sys.executable, "-c", "import coursexp"], runs), None))
+    return results
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description="startup time of the omscs command line")
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=80, help="Most a read only command may add to python")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(args.runs, tmp)
+    bare = results[0][1]
+    failed = []
+    print(f"{'command':>16} {'median ms':>10} {'over python ms':>15}  heavy modules")
+    for name, seconds, heavy in results:
+        print(f"{name:>16} {seconds * 1000:>10.0f} {(seconds - bare) * 1000:>15.0f}  "
+              f"{' '.join(heavy) if heavy is not None else ''}")
+        if heavy is not None and (heavy or (seconds - bare) * 1000 > args.budget_ms):
+            failed.append(name)
+    if failed:
+        sys.exit(f"Over the {args.budget_ms:.0f} ms budget or loading heavy modules: {', '.join(failed)}")
+    print(f"Read only commands within {args.budget_ms:.0f} ms of python and free of heavy modules")
@@ -0,0 +1,79 @@
+"""
+Compare full and change only enrollment storage
+
+Writes the same sequence of scrapes with store="full" and
+store="changes", then reports database size, rows written and checks
+that enrollhist rebuilds identical histories from both.
+
+Usage (from the repository root):
+python -m benchmarks.bench_storage [--sections 1000] [--scrapes 336] [--churn 0.03]
+"""
+import argparse
+import datetime
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from dbwriter import DBWriter
+import enrollhist
+from sections import Section
+from benchmarks.bench_dbwriter import synthetic_rows
+
+
+def scrape_sequence(n_sections, n_scrapes, churn, seed=0):
+    """
+    Yield (sections, scrape_time) with a fraction of sections changing each scrape
+
+    :param churn: Fraction of sections whose Act/Rem change per scrape
+    """
+    rng = random.Random(seed)
+    rows = synthetic_rows(n_sections, seed)
+    scrape_time = datetime.datetime(2019, 1, 1)
+    for _ in range(n_scrapes):
+        for row in rng.sample(rows[2:], int(n_sections * churn)):
+            cap = int(row[12])
+            act = min(cap, max(0, int(row[13]) + rng.choice((-1, 1))))
+            row[13], row[14] = str(act), str(cap - act)
+        yield [Section.from_row(row) for row in rows[2:]], scrape_time
+        scrape_time += datetime.timedelta(minutes=30)
+
+
+def run(n_sections, n_scrapes, churn, tmp):
+    results = {}
+    for store in ('full', 'changes'):
+        dbname = os.path.join(tmp, f'{store}.db')
+        writer = DBWriter(dbname, term='201902', store=store)
+        written = 0
+        start = time.perf_counter()
+        for sections, scrape_time in scrape_sequence(n_sections, n_scrapes, churn):
+            written += writer.write(sections, scrape_time)
+        elapsed = time.perf_counter() - start
+        writer.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        writer.conn.execute("VACUUM")
+        writer.close()
+        results[store] = (os.path.getsize(dbname), written, elapsed)
+    full = sqlite3.connect(os.path.join(tmp, 'full.db'))
+    changes = sqlite3.connect(os.path.join(tmp, 'changes.db'))
+    for crn in (20000, 20000 + n_sections // 2, 20000 + n_sections - 1):
+        assert enrollhist.history(full, '201902', crn) == enrollhist.history(changes, '201902', crn)
+    when = datetime.datetime(2019, 1, 1) + datetime.timedelta(minutes=30 * (n_scrapes // 2))
+    assert enrollhist.snapshot_at(full, '201902', when) == enrollhist.snapshot_at(changes, '201902', when)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="full vs change only storage")
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--scrapes", type=int, default=336, help="336 is one week at 30 minutes")
+    parser.add_argument("--churn", type=float, default=0.03)
+    args = parser.parse_args()
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(args.sections, args.scrapes, args.churn, tmp)
+    print(f"{'store':>8} {'db bytes':>12} {'rows written':>13} {'write s':>8}")
+    for store, (size, written, elapsed) in results.items():
+        print(f"{store:>8} {size:>12} {written:>13} {elapsed:>8.2f}")
+    print("Histories and snapshots match")
@@ -0,0 +1,119 @@
+"""
+Soak test against the OSCAR simulator
+
+Runs scrape cycles with the http engine through ScrapePool and DBWriter
+against oscarsim, with simulated time running --speed times faster than
+the wall clock, so days of polling take minutes. Each cycle scrapes
+every target once, at every --interval simulated minutes, and is stamped
+with simulated time. Reports cycle latency, failed targets, resident
+memory of this process and database size as the run goes, and their
+growth per simulated day at the end.
+
+Usage (from the repository root):
+python -m benchmarks.soak [--days 2] [--speed 2880] [--interval 30] [--sections 500] [--error-rate 0.01]
+"""
+import argparse
+import datetime
+import glob
+import logging
+import os
+import tempfile
+import time
+
+import metrics
+import oscarsim
+from dbwriter import DBWriter
+from engines import HttpEngine
+from scrapepool import ScrapePool, Target
+
+
+def db_bytes(dbname):
+    return sum(os.path.getsize(name) for name in glob.glob(dbname + '*'))
+
+
+def run(sim, targets, days, interval, workers, store, tmp, report=None):
+    """
+    :param report: Callable taking each cycle's result dict, eg to print progress
+    :return: List of cycle result dicts
+    """
+    server = oscarsim.serve(sim)
+    dbname = os.path.join(tmp, 'soak.db')
+    writer = DBWriter(dbname, store=store)
+    pool = ScrapePool(lambda: HttpEngine(base_url=sim.base_url, login_with=lambda: oscarsim.http_login(sim.url),
+                                         pool_size=1), max_workers=workers, min_interval=0)
+    step = datetime.timedelta(minutes=interval)
+    end = sim.now() + datetime.timedelta(days=days)
+    due = sim.now()
+    cycles = []
+    try:
+        while due < end:
+            wait = (due - sim.now()).total_seconds() / sim.speed
+            if wait > 0:
+                time.sleep(wait)
+            started = time.perf_counter()
+            scrape_time = sim.now()
+            failed = rows = 0
+            for target, sections, _ in pool.scrape(targets):
+                if sections is None:
+                    failed += 1
+                    continue
+                rows += writer.write(sections, scrape_time, term=target.term, subject=target.subject,
+                                     campus=target.campus) or 0
+            cycle = {'at': scrape_time, 'seconds': time.perf_counter() - started, 'failed': failed, 'rows': rows,
+                     'rss': metrics.process_tree_rss(os.getpid()) or 0, 'db': db_bytes(dbname)}
+            cycles.append(cycle)
+            if report is not None:
+                report(cycle)
+            due += step
+    finally:
+        pool.close()
+        writer.close()
+        server.shutdown()
+    return cycles
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description="soak test against the OSCAR simulator")
+    parser.add_argument("--days", type=float, default=2, help="Simulated days")
+    parser.add_argument("--speed", type=float, default=2880, help="Simulated seconds per second")
+    parser.add_argument("--interval", type=float, default=30, help="Simulated minutes between cycles")
+    parser.add_argument("--sections", type=int, default=500, help="Sections per term and campus")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--store", default='full', choices=('full', 'changes'))
+    parser.add_argument("--change-rate", type=float, default=1, help="Registration events per section per hour")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean seconds responses are held back")
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--expire-rate", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    simulation = oscarsim.Simulation(sections=args.sections, speed=args.speed, change_rate=args.change_rate,
+                                     latency=args.latency, error_rate=args.error_rate, expire_rate=args.expire_rate,
+                                     session_hours=12, duo_delay=0, seed=args.seed)
+    soak_targets = [Target(term, 'CS', campus) for term in simulation.terms for campus in ('O', 'A')]
+    every = max(1, int(24 * 60 / args.interval / 4))
+
+    def progress(cycle):
+        if len(progress.cycles) % every == 0:
+            print(f"{cycle['at']:%Y-%m-%d %H:%M} {cycle['seconds']:>9.3f} {cycle['failed']:>6} {cycle['rows']:>7} "
+                  f"{cycle['rss'] / 2**20:>7.1f} {cycle['db'] / 2**20:>7.1f}")
+        progress.cycles.append(cycle)
+    progress.cycles = []
+
+    print(f"{'simulated':>16} {'cycle s':>9} {'failed':>6} {'rows':>7} {'RSS MB':>7} {'DB MB':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(simulation, soak_targets, args.days, args.interval, args.workers, args.store, tmp, progress)
+    seconds = sorted(cycle['seconds'] for cycle in results)
+    settled = results[len(results) // 10:]
+    span = (settled[-1]['at'] - settled[0]['at']).total_seconds() / 86400 or 1
+    print(f"{len(results)} cycles, {sum(cycle['failed'] for cycle in results)} failed targets of "
+          f"{len(results) * len(soak_targets)}")
+    print(f"cycle seconds median {seconds[len(seconds) // 2]:.3f}, p99 {seconds[int(len(seconds) * 0.99)]:.3f}, "
+          f"max {seconds[-1]:.3f}")
+    print(f"RSS growth {(settled[-1]['rss'] - settled[0]['rss']) / 2**20 / span:.2f} MB per simulated day, "
+          f"DB growth {(settled[-1]['db'] - settled[0]['db']) / 2**20 / span:.2f} MB per simulated day")
+    faults = {}
+    for (kind, _), count in simulation.counts.items():
+        faults[kind] = faults.get(kind, 0) + count
+    print(f"simulator requests {faults.pop('request')}, injected {faults}")
@@ -0,0 +1,278 @@
+"""
+Benchmark suite for the scrape and storage paths
+
+Times parsing, validation and database ingestion separately on
+synthetic results pages from 50 to 20,000 sections, in both the closed
+(22 field) and open registration (26 field) layouts, and saves the
+results as JSON so runs on different commits can be compared.
+
+Pipelines:
+legacy - parse_course_table, dbadd's row trim and int checks, the original dbadd
+typed  - parse_sections (validates while parsing), DBWriter long layout
+
+Each stage reports the best of --repeat runs, its throughput and its
+peak RSS growth. Memory is measured in a fresh child process as in
+bench_parser, Linux only. Ingestion is timed on a second scrape into a
+database already holding the first, as in steady state tracking.
+
+Usage (from the repository root):
+python -m benchmarks.suite [--sizes 50 500 5000 20000] [--output results.json]
+python -m benchmarks.suite --compare old.json new.json
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import time
+import logging
+
+from coursexp import parse_course_table
+from dbwriter import DBWriter
+from sections import parse_sections
+from benchmarks.baseline import dbadd
+from benchmarks.synthpages import generate_page
+
+SIZES = (50, 500, 5000, 20000)
+LAYOUTS = ('closed', 'open')
+STAGES = ('parse', 'validate', 'ingest')
+
+
+def legacy_validate(rows):
+    """dbadd's checks before writing: 26 -> 22 trim and int conversion of key fields"""
+    for i in range(0, len(rows)):
+        if len(rows[i]) == 26:
+            rows[i] = rows[i][4:]
+    irows = [[row[2]] + [row[4]] + row[12:18] for row in rows[2:]]
+    [int(el) for row in irows for el in row]
+    return rows
+
+
+class LegacyPipeline:
+    name = 'legacy'
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+
+    def parse(self, html_source):
+        return parse_course_table(html_source)
+
+    def validate(self, rows):
+        return legacy_validate(rows)
+
+    def ingest(self, rows, scrape_time):
+        dbadd(rows, scrape_time, dbname=self.dbname)
+
+    def close(self):
+        pass
+
+
+class TypedPipeline:
+    name = 'typed'
+    # Validation happens inside parse_sections
+    validate = None
+
+    def __init__(self, dbname):
+        self.writer = DBWriter(dbname, term='201902')
+
+    def parse(self, html_source):
+        return parse_sections(html_source)
+
+    def ingest(self, sections, scrape_time):
+        self.writer.write(sections, scrape_time)
+
+    def close(self):
+        self.writer.close()
+
+
+PIPELINES = {pipeline.name: pipeline for pipeline in (LegacyPipeline, TypedPipeline)}
+
+
+def status_kb(field):
+    """Value of a /proc/self/status field in kB, eg VmRSS or VmHWM"""
+    with open('/proc/self/status') as fh:
+        return int(re.search(field + r':\s+(\d+)', fh.read()).group(1))
+
+
+def _prepare(pipeline, stage, page_path, seed_path):
+    """Load the page, writing the seed page's scrape first when ingestion is measured"""
+    if stage == 'ingest':
+        with open(seed_path) as fh:
+            records = pipeline.parse(fh.read())
+        if pipeline.validate is not None:
+            records = pipeline.validate(records)
+        pipeline.ingest(records, datetime.datetime(2019, 1, 1))
+    with open(page_path) as fh:
+        return fh.read()
+
+
+def run_stage(pipeline, stage, html_source, track_rss=False):
+    """
+    Run a pipeline's stages before a stage, then time the stage itself
+
+    :param track_rss: Also measure the stage's peak RSS growth. Resets the
+                      process high water mark, so only use in a child process.
+    :return: (seconds taken by the stage, peak RSS growth in kB or None)
+    """
+    scrape_time = datetime.datetime(2019, 1, 1, 0, 30)
+    result = html_source
+    for name in STAGES[:STAGES.index(stage)]:
+        step = getattr(pipeline, name)
+        if step is not None:
+            result = step(result)
+    before = None
+    if track_rss:
+        # The stage's own peak, not the high water mark left by reading and earlier stages
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+        before = status_kb('VmRSS')
+    start = time.perf_counter()
+    if stage == 'ingest':
+        pipeline.ingest(result, scrape_time)
+    else:
+        getattr(pipeline, stage)(result)
+    seconds = time.perf_counter() - start
+    return seconds, (max(status_kb('VmHWM') - before, 0) if track_rss else None)
+
+
+def _peak_rss_growth(pipeline_name, stage, page_path, seed_path, queue):
+    # Spawned children start without the parent's logging setup
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline = PIPELINES[pipeline_name](os.path.join(tmp, 'bench.db'))
+        html_source = _prepare(pipeline, stage, page_path, seed_path)
+        queue.put(run_stage(pipeline, stage, html_source, track_rss=True)[1])
+        pipeline.close()
+
+
+def measure(pipeline_name, size, layout, repeat=3):
+    """
+    Time and measure every stage of a pipeline on one page size and layout
+
+    :return: List of result dicts, one per stage
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        page_path = os.path.join(tmp, 'page.html')
+        seed_path = os.path.join(tmp, 'seed.html')
+        with open(seed_path, 'w') as fh:
+            fh.write(generate_page(size, layout, seed=0))
+        with open(page_path, 'w') as fh:
+            fh.write(generate_page(size, layout, seed=1))
+        page_bytes = os.path.getsize(page_path)
+        for stage in STAGES:
+            result = {'pipeline': pipeline_name, 'layout': layout, 'sections': size, 'stage': stage,
+                      'seconds': None, 'sections_per_s': None, 'mb_per_s': None, 'peak_rss_bytes': None}
+            results.append(result)
+            if getattr(PIPELINES[pipeline_name], stage) is None:
+                continue
+            best = float('inf')
+            for i in range(repeat):
+                # Fresh database per run, so each ingest is the second scrape
+                pipeline = PIPELINES[pipeline_name](os.path.join(tmp, f'{stage}{i}.db'))
+                html_source = _prepare(pipeline, stage, page_path, seed_path)
+                seconds, _ = run_stage(pipeline, stage, html_source)
+                pipeline.close()
+                best = min(best, seconds)
+            ctx = multiprocessing.get_context('spawn')
+            queue = ctx.Queue()
+            child = ctx.Process(target=_peak_rss_growth, args=(pipeline_name, stage, page_path, seed_path, queue))
+            child.start()
+            growth_kb = queue.get()
+            child.join()
+            result.update(seconds=best, sections_per_s=size / best, peak_rss_bytes=growth_kb * 1024)
+            if stage == 'parse':
+                result['mb_per_s'] = page_bytes / 2**20 / best
+    return results
+
+
+def environment():
+    """Commit and machine details stored with the results"""
+    def git(*args):
+        try:
+            return subprocess.check_output(('git',) + args, stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.datetime.now().isoformat(" "),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_suite(sizes=SIZES, layouts=LAYOUTS, pipelines=tuple(PIPELINES), repeat=3):
+    """
+    :return: {'environment': {...}, 'results': [result dicts]}
+    """
+    results = []
+    for size in sizes:
+        for layout in layouts:
+            for name in pipelines:
+                results += measure(name, size, layout, repeat)
+    return {'environment': environment(), 'results': results}
+
+
+def _key(result):
+    return result['pipeline'], result['layout'], result['sections'], result['stage']
+
+
+def compare(old, new):
+    """
+    :return: List of (key, old seconds, new seconds, new / old) for stages timed in both runs
+    """
+    old_seconds = {_key(result): result['seconds'] for result in old['results']}
+    rows = []
+    for result in new['results']:
+        before = old_seconds.get(_key(result))
+        if before and result['seconds']:
+            rows.append((_key(result), before, result['seconds'], result['seconds'] / before))
+    return rows
+
+
+def _fmt(value, scale=1, spec='.4f'):
+    return '-' if value is None else format(value * scale, spec)
+
+
+if __name__ == "__main__":
+    logging.getLogger('__main__').addHandler(logging.NullHandler())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument("--pipelines", nargs="+", choices=list(PIPELINES), default=list(PIPELINES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file, defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved runs")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as fh:
+            old = json.load(fh)
+        with open(args.compare[1]) as fh:
+            new = json.load(fh)
+        print(f"{'pipeline':>8} {'layout':>7} {'sections':>9} {'stage':>9} {'old s':>9} {'new s':>9} {'new/old':>8}")
+        for (name, layout, size, stage), before, after, ratio in compare(old, new):
+            print(f"{name:>8} {layout:>7} {size:>9} {stage:>9} {before:>9.4f} {after:>9.4f} {ratio:>8.2f}")
+    else:
+        suite = run_suite(args.sizes, args.layouts, args.pipelines, args.repeat)
+        print(f"{'pipeline':>8} {'layout':>7} {'sections':>9} {'stage':>9} {'seconds':>9} "
+              f"{'sections/s':>11} {'MB/s':>7} {'peak MB':>8}")
+        for r in suite['results']:
+            print(f"{r['pipeline']:>8} {r['layout']:>7} {r['sections']:>9} {r['stage']:>9} {_fmt(r['seconds']):>9} "
+                  f"{_fmt(r['sections_per_s'], spec='.0f'):>11} {_fmt(r['mb_per_s'], spec='.1f'):>7} "
+                  f"{_fmt(r['peak_rss_bytes'], 1 / 2**20, '.1f'):>8}")
+        output = args.output
+        if output is None:
+            commit = suite['environment']['commit'] or 'nocommit'
+            output = os.path.join(os.path.dirname(__file__), 'results',
+                                  f"{commit[:10]}{'-dirty' if suite['environment']['dirty'] else ''}.json")
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w') as fh:
+            json.dump(suite, fh, indent=1)
+        print(f"Saved {output}")
@@ -0,0 +1,67 @@
+"""
+Synthetic OSCAR results pages
+
+Builds "Sections Found" pages shaped like the ones scrape_courses reads,
+so parsing can be measured without a browser or GT servers.
+
+closed - registration closed, select cell holds a single letter, 22 fields per row
+open   - registration open, select cell holds the checkbox inputs, 26 fields per row
+"""
+import random
+
+HEADERS = ('Select', 'CRN', 'Subj', 'Crse', 'Sec', 'Cmp', 'Bas', 'Cred', 'Title', 'Days', 'Time',
+           'Cap', 'Act', 'Rem', 'WL Cap', 'WL Act', 'WL Rem', 'Instructor', 'Location', 'Attribute')
+
+
+def _select_cell(layout, crn, term):
+    if layout == 'closed':
+        return '<td class="dddefault">C</td>'
+    # Newlines between the inputs are what grow open rows to 26 fields
+    return ('<td class="dddefault">\n'
+            f'<input type="checkbox" name="sel_crn" value="{crn} {term}">\n'
+            f'<input type="hidden" name="assoc_term_in" value="{term}">\n'
+            '<abbr title="Not available for registration">&nbsp;</abbr>\n'
+            '</td>')
+
+
+def section_cells(i, rng):
+    """Cell values after the select cell for section number i"""
+    cap = rng.choice((50, 100, 250, 500))
+    act = rng.randint(0, cap)
+    wl_act = rng.randint(0, 20)
+    return (str(20000 + i), 'CS', str(6000 + i % 900), f'O{i % 20:02d}', 'O', 'L', '3.000',
+            f'Course {i}', 'TBA', 'TBA', str(cap), str(act), str(cap - act),
+            '100', str(wl_act), str(100 - wl_act), 'Staff (<abbr title="Primary">P</abbr>)',
+            'TBA', 'Online')
+
+
+def generate_page(n_sections, layout='closed', term='201902', seed=0, tbody=False):
+    """
+    Build a results page
+
+    :param n_sections: Number of section rows
+    :param layout: "closed" or "open"
+    :param term: Term code used in the select cell inputs
+    :param seed: Random seed for enrollment numbers
+    :param tbody: Wrap rows in a tbody, as browser page_source does
+    :return: HTML text
+    """
+    if layout not in ('closed', 'open'):
+        raise ValueError(f"Unknown layout: {layout}")
+    rng = random.Random(seed)
+    parts = ['<html><head><title>Look Up Classes</title></head><body>',
+             '<table class="datadisplaytable" summary="This layout table is used to present the sections found">',
+             '<caption class="captiontext">Sections Found</caption>']
+    if tbody:
+        parts.append('<tbody>')
+    parts.append(f'<tr>\n<th colspan="{len(HEADERS)}" class="ddtitle">Computer Science</th>\n</tr>')
+    parts.append('<tr>\n' + '\n'.join(f'<th class="ddheader">{h}</th>' for h in HEADERS) + '\n</tr>')
+    for i in range(n_sections):
+        crn = 20000 + i
+        cells = [_select_cell(layout, crn, term)]
+        cells += [f'<td class="dddefault">{value}</td>' for value in section_cells(i, rng)]
+        parts.append('<tr>\n' + '\n'.join(cells) + '\n</tr>')
+    if tbody:
+        parts.append('</tbody>')
+    parts.append('</table></body></html>')
+    return '\n'.join(parts)
@@ -0,0 +1,152 @@
+"""
+Browser lifecycle
+
+Firefox sessions kept open for days grow in memory and eventually start
+failing with "can't access dead object" and similar errors. ManagedBrowser
+wraps one selenium browser and replaces it, between runs, once it has
+served a number of runs, uses too much memory, or keeps failing. The
+replacement starts logged out, the engine's SessionManager then restores
+the saved login cookies into it on the next session check, so a recycle
+costs a browser start and not a Duo login.
+
+Intended use:
+managed = ManagedBrowser(lambda: browser_setup(lean=True), max_runs=100)
+with managed.run() as browser:
+    gotosem(browser, '201902')
+managed.close()
+"""
+from contextlib import contextmanager
+import logging
+
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException
+
+import metrics
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+# Defaults of ManagedBrowser
+MAX_RUNS = 100
+MAX_RSS = 2**30
+MAX_ERRORS = 3
+# Errors after which the browser is of no further use
+FATAL_ERRORS = (InvalidSessionIdException, NoSuchWindowException)
+FATAL_MESSAGES = ("dead object", "Browsing context has been discarded", "Tried to run command without establishing")
+
+
+def browser_rss(browser):
+    """
+    :param browser: Selenium browser object
+    :return: Resident bytes of its driver and browser processes, None if unknown
+    """
+    process = getattr(getattr(browser, 'service', None), 'process', None)
+    if process is None:
+        return None
+    return metrics.process_tree_rss(process.pid)
+
+
+def is_fatal(error):
+    """True if an exception means the browser session is broken for good"""
+    return isinstance(error, FATAL_ERRORS) or any(message in str(error) for message in FATAL_MESSAGES)
+
+
+class ManagedBrowser:
+    """
+    Selenium browser replaced when worn out
+
+    :param factory: Callable returning a new browser, eg lambda: browser_setup(lean=True)
+    :param max_runs: Runs before the browser is replaced, None for no limit
+    :param max_rss: Bytes of resident memory, browser children included, above
+                    which the browser is replaced after a run. None for no limit.
+    :param max_errors: Failed runs in a row before the browser is replaced
+    :param browser: Optional browser to start with, replaced through factory
+    """
+
+    def __init__(self, factory, max_runs=MAX_RUNS, max_rss=MAX_RSS, max_errors=MAX_ERRORS, browser=None):
+        self.factory = factory
+        self.max_runs = max_runs
+        self.max_rss = max_rss
+        self.max_errors = max_errors
+        self.current = browser
+        # Of the current browser
+        self.runs = 0
+        self.errors = 0
+        self.rss = None
+        self.recycles = 0
+
+    def get(self):
+        """
+        :return: The current browser, started if there is none
+        """
+        if self.current is None:
+            logger.debug("Starting browser")
+            self.current = self.factory()
+            self.runs = 0
+            self.errors = 0
+            self.rss = None
+        return self.current
+
+    @contextmanager
+    def run(self):
+        """
+        One unit of work, eg a scrape, on the browser
+
+        Exceptions are counted and raised again. The browser is checked
+        after the block and replaced if worn out.
+        """
+        browser = self.get()
+        try:
+            yield browser
+        except Exception as e:
+            self.finished(e)
+            raise
+        self.finished()
+
+    def finished(self, error=None):
+        """
+        Count a run and replace the browser if it is worn out
+
+        :param error: Exception the run ended with, if any
+        """
+        self.runs += 1
+        self.errors = self.errors + 1 if error is not None else 0
+        reason = self.worn_out(error)
+        if reason is not None:
+            self.recycle(reason)
+
+    def worn_out(self, error=None):
+        """
+        :param error: Exception the last run ended with, if any
+        :return: Reason the browser should be replaced, None if it is fine
+        """
+        if self.current is None:
+            return None
+        if error is not None and is_fatal(error):
+            return 'fatal'
+        if self.errors >= self.max_errors:
+            return 'errors'
+        if self.max_runs is not None and self.runs >= self.max_runs:
+            return 'runs'
+        if self.max_rss is not None:
+            self.rss = browser_rss(self.current)
+            if self.rss is not None and self.rss > self.max_rss:
+                return 'memory'
+        return None
+
+    def recycle(self, reason='manual'):
+        """Quit the browser, the next get() starts a new one"""
+        logger.info(f"Recycling browser after {self.runs} runs, {self.errors} errors in a row and "
+                    f"{(self.rss or 0) / 2**20:.0f} MB: {reason}")
+        metrics.inc('omscs_browser_recycles_total', reason=reason)
+        self.recycles += 1
+        self.close()
+
+    def close(self):
+        browser, self.current = self.current, None
+        if browser is not None:
+            try:
+                browser.quit()
+            except Exception as e:
+                # Already gone in most cases, the driver process is killed by quit either way
+                logger.warning(f"Quitting browser failed: {e!r}")
@@ -0,0 +1,123 @@
+"""
+Course catalog history
+
+Reads the section_versions table DBWriter keeps in the long layout.
+Every section has one row per version of its course info (title,
+instructor, days, time, ...), valid from the scrape that first saw it
+until the scrape that saw the next version. Change detection happens in
+DBWriter against a CRN -> content hash map loaded once per term, so a
+scrape costs one hash per section and a single bulk write.
+
+Usage:
+python catalog.py changes 201902 [--crn 87654] [--since "2019-11-01"] [--field instructor]
+python catalog.py versions 201902 87654
+python catalog.py at 201902 "2019-11-04 10:00" [--subject CS]
+"""
+from collections import namedtuple
+import argparse
+import logging
+
+from dbwriter import SECTION_COLUMNS, VERSION_COLUMNS, connect, create_schema, timestamp
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+FIELDS = SECTION_COLUMNS[2:]
+
+FieldChange = namedtuple('FieldChange', ('crn', 'ts', 'field', 'old', 'new'))
+
+
+def versions(conn, term, crn):
+    """
+    :param conn: sqlite3 connection
+    :param crn: Section CRN
+    :return: List of section_versions rows as dicts, oldest first
+    """
+    cursor = conn.execute(f"SELECT {', '.join(VERSION_COLUMNS)} FROM section_versions "
+                          f"WHERE term=? AND crn=? ORDER BY valid_from", (term, int(crn)))
+    return [dict(zip(VERSION_COLUMNS, row)) for row in cursor]
+
+
+def changes(conn, term, crn=None, since=None, field=None):
+    """
+    Field level changes between consecutive versions of sections
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param crn: Optional CRN, every section if None
+    :param since: Optional time, only changes at or after it
+    :param field: Optional column name, eg 'instructor'
+    :return: List of FieldChange, ts is when the new value was first scraped. Oldest first.
+    """
+    if field is not None and field not in FIELDS:
+        raise ValueError(f"Unknown field {field}, one of {', '.join(FIELDS)}")
+    since = timestamp(since) if since is not None else ""
+    cursor = conn.execute(f"""
+        SELECT crn, valid_from, {', '.join(FIELDS)} FROM section_versions
+        WHERE term=? AND (? IS NULL OR crn=?) ORDER BY crn, valid_from""",
+                          (term, crn, None if crn is None else int(crn)))
+    found = []
+    previous = None
+    for row in cursor:
+        if previous is not None and previous[0] == row[0] and row[1] >= since:
+            for name, old, new in zip(FIELDS, previous[2:], row[2:]):
+                if old != new and field in (None, name):
+                    found.append(FieldChange(row[0], row[1], name, old, new))
+        previous = row
+    found.sort(key=lambda change: (change.ts, change.crn))
+    return found
+
+
+def catalog_at(conn, term, at, subject=None):
+    """
+    Course info of every section as it was at a time
+
+    :param conn: sqlite3 connection
+    :param at: datetime or timestamp text
+    :param subject: Optional subject, eg 'CS'
+    :return: List of section_versions rows as dicts, by CRN
+    """
+    ts = timestamp(at)
+    cursor = conn.execute(f"""
+        SELECT {', '.join(VERSION_COLUMNS)} FROM section_versions
+        WHERE term=? AND valid_from <= ? AND (valid_to IS NULL OR valid_to > ?) AND (? IS NULL OR subj=?)
+        ORDER BY crn""", (term, ts, ts, subject, subject))
+    return [dict(zip(VERSION_COLUMNS, row)) for row in cursor]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default="OMSCS_CA.db")
+    commands = parser.add_subparsers(dest="command")
+    changed = commands.add_parser("changes", help="Field changes of every section or of one")
+    changed.add_argument("term")
+    changed.add_argument("--crn", type=int)
+    changed.add_argument("--since")
+    changed.add_argument("--field", choices=FIELDS)
+    history = commands.add_parser("versions", help="Every version of one section")
+    history.add_argument("term")
+    history.add_argument("crn", type=int)
+    snapshot = commands.add_parser("at", help="Course info of every section at a time")
+    snapshot.add_argument("term")
+    snapshot.add_argument("at")
+    snapshot.add_argument("--subject")
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    create_schema(db)
+    if args.command == "changes":
+        for change in changes(db, args.term, args.crn, args.since, args.field):
+            print(f"{change.ts[:19]} {change.crn} {change.field}: {change.old!r} -> {change.new!r}")
+    elif args.command == "versions":
+        for version in versions(db, args.term, args.crn):
+            print(f"{version['valid_from'][:19]} to {(version['valid_to'] or 'now')[:19]:<19} "
+                  f"{version['subj']} {version['crse']} {version['sec']} {version['title']} | "
+                  f"{version['instructor']} | {version['days']} {version['time']} | {version['location']}")
+    elif args.command == "at":
+        for version in catalog_at(db, args.term, args.at, args.subject and args.subject.upper()):
+            print(f"{version['crn']} {version['subj']} {version['crse']} {version['sec']} {version['title']} | "
+                  f"{version['instructor']}")
+    else:
+        parser.print_help()
+    db.close()
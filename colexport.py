@@ -0,0 +1,184 @@
+"""
+Columnar export of enrollment history
+
+Turns the enrollment history of each term into NumPy .npy files that
+load memory mapped, so analysis over millions of observations is
+vectorized and never touches the live database:
+
+<out>/<term>/
+    ts.npy          datetime64[us] scrape time of each observation
+    crn_id.npy      int32 index into crns.npy
+    cap.npy ... wl_rem.npy  int32 enrollment counts
+    crns.npy        int32 CRN dictionary, ids are stable across exports
+    sections.json   [crn, subj, crse, sec, cmp, title] per id
+    manifest.json   rows exported and the last scrape time included
+
+One row per section seen by each scrape, in scrape order, for both full
+and change only storage. Exports are incremental: only scrapes newer
+than the manifest's last one are appended. The database is opened read
+only, WAL lets the tracker keep writing meanwhile.
+
+Usage:
+python colexport.py [--db OMSCS_CA.db] [--out export] [--term 201902 ...]
+or python omscs.py export
+
+Loading:
+columns = colexport.load('export', '201902')
+columns['act'][columns['crn_id'] == 3]
+"""
+import json
+import logging
+import os
+
+import numpy as np
+
+from enrollhist import COUNT_COLUMNS, observations
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+COLUMNS = (('ts', np.dtype('datetime64[us]')), ('crn_id', np.dtype('<i4'))) + \
+    tuple((name, np.dtype('<i4')) for name in COUNT_COLUMNS)
+# Fixed size .npy header, room for any row count, so appending only rewrites the shape in place
+HEADER_SIZE = 128
+# Observations buffered before they are appended
+CHUNK_ROWS = 500000
+
+
+def _header(dtype, rows):
+    """Version 1.0 .npy header of a 1 dimensional array, padded to HEADER_SIZE bytes"""
+    text = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (rows,)})
+    text = text.ljust(HEADER_SIZE - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + (HEADER_SIZE - 10).to_bytes(2, 'little') + text.encode('latin1')
+
+
+class ColumnWriter:
+    """
+    Appends to the column files of one term
+
+    :param directory: Term directory
+    :param rows: Rows already exported according to the manifest. Anything
+                 past it, from an interrupted export, is cut off first.
+    """
+
+    def __init__(self, directory, rows):
+        self.directory = directory
+        self.rows = rows
+        os.makedirs(directory, exist_ok=True)
+        for name, dtype in COLUMNS:
+            path = self.path(name)
+            with open(path, 'r+b' if os.path.exists(path) else 'w+b') as fh:
+                fh.truncate(HEADER_SIZE + rows * dtype.itemsize)
+                fh.seek(0)
+                fh.write(_header(dtype, rows))
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.npy")
+
+    def append(self, columns):
+        """
+        :param columns: {name: array} of equal lengths, every name in COLUMNS
+        """
+        added = len(columns['ts'])
+        for name, dtype in COLUMNS:
+            with open(self.path(name), 'r+b') as fh:
+                fh.seek(HEADER_SIZE + self.rows * dtype.itemsize)
+                fh.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+                fh.seek(0)
+                fh.write(_header(dtype, self.rows + added))
+        self.rows += added
+
+
+def _write_json(path, data):
+    """Replace a json file atomically"""
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(data, fh)
+    os.replace(path + '.tmp', path)
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return default
+
+
+def export_term(conn, term, out_dir):
+    """
+    Append a term's scrapes newer than its last export
+
+    :param conn: sqlite3 connection, read only is enough
+    :param term: Semester option value
+    :param out_dir: Export root, the term gets its own directory
+    :return: Rows appended
+    """
+    directory = os.path.join(out_dir, term)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    manifest = _read_json(manifest_path, {'term': term, 'rows': 0, 'last_ts': None})
+    writer = ColumnWriter(directory, manifest['rows'])
+    crns_path = os.path.join(directory, 'crns.npy')
+    crns = [int(crn) for crn in np.load(crns_path)] if os.path.exists(crns_path) else []
+    crn_ids = {crn: i for i, crn in enumerate(crns)}
+    buffer = {name: [] for name, _ in COLUMNS}
+    appended = 0
+
+    def flush():
+        # Dictionary first, so every exported crn_id resolves even if interrupted after it
+        np.save(crns_path, np.array(crns, dtype='<i4'))
+        writer.append(buffer)
+        manifest.update(rows=writer.rows, last_ts=last_ts)
+        _write_json(manifest_path, manifest)
+        for values in buffer.values():
+            values.clear()
+
+    last_ts = manifest['last_ts']
+    for ts, seen in observations(conn, term, after=last_ts):
+        for crn, counts in seen:
+            if crn not in crn_ids:
+                crn_ids[crn] = len(crns)
+                crns.append(crn)
+            buffer['ts'].append(ts)
+            buffer['crn_id'].append(crn_ids[crn])
+            for name, value in zip(COUNT_COLUMNS, counts):
+                buffer[name].append(value)
+        last_ts = ts
+        appended += len(seen)
+        # Whole scrapes only, last_ts is where the next export resumes
+        if len(buffer['ts']) >= CHUNK_ROWS:
+            flush()
+    if buffer['ts']:
+        flush()
+    if appended:
+        info = {crn: row for crn, *row in conn.execute(
+            "SELECT crn, subj, crse, sec, cmp, title FROM sections WHERE term=?", (term,))}
+        _write_json(os.path.join(directory, 'sections.json'), [[crn] + info.get(crn, [None] * 5) for crn in crns])
+    logger.info(f"Exported {appended} rows of {term}, {writer.rows} in total")
+    return appended
+
+
+def load(out_dir, term):
+    """
+    Memory map an exported term
+
+    :param out_dir: Export root
+    :param term: Semester option value
+    :return: {column name: read only array}, plus 'crns' the CRN of each crn_id
+    """
+    directory = os.path.join(out_dir, term)
+    rows = _read_json(os.path.join(directory, 'manifest.json'), {'rows': 0})['rows']
+    columns = {}
+    for name, _ in COLUMNS:
+        # An export running meanwhile may have appended past the manifest
+        columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')[:rows]
+    columns['crns'] = np.load(os.path.join(directory, 'crns.npy'))
+    return columns
+
+
+if __name__ == "__main__":
+    # Same as python omscs.py export, without importing this file a second time
+    import sys
+    import omscs
+    sys.modules['colexport'] = sys.modules['__main__']
+    omscs.main(["export"] + sys.argv[1:])
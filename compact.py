@@ -0,0 +1,410 @@
+"""
+Retention and downsampling of old enrollment
+
+A full store keeps a row per section per scrape, most of them repeating
+the previous one. Once a scrape is older than the retention window, its
+section's counts are folded into hourly rollups (samples, min and max of
+act, rem and wl_act, last counts), and only the first and last scrape of
+each run of identical counts are kept. Every change stays in enrollment,
+enrollhist fills in the scrapes between from the scrapes table. Hourly
+rollups older than the daily window are merged into daily ones. A
+section missing from some scrapes, with the same counts before and
+after, reads as listed throughout once compacted.
+
+The work is done a few CRNs per transaction, each committed on its own
+with an incremental vacuum after it, so the scraper never waits long for
+the write lock. Progress is kept per CRN in compaction_progress, in the
+same transaction as the rows it covers, so an interrupted run carries on
+where it stopped. Terms stored change only are already compact and are
+skipped. Legacy <prefix>_<CRN> tables of dbadd are compacted the same way.
+
+The metrics table of metrics.store, one snapshot of every sample per
+cycle, is thinned on the same windows to the last snapshot of each hour,
+then of each day.
+
+Usage:
+python compact.py run [--db OMSCS_CA.db] [--keep-days 14] [--daily-days 90] [--term 201902] [--legacy]
+python compact.py enable-vacuum [--db OMSCS_CA.db]
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+import argparse
+import datetime
+import time
+import logging
+
+from dbwriter import connect, create_schema, term_prefix, timestamp
+import metrics
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+COMPACT_SCHEMA = (
+    # resolution is 'hour' or 'day', bucket the timestamp prefix it covers, eg '2019-11-04 10'.
+    # last_ts and the counts after it are those of the last scrape in the bucket.
+    """CREATE TABLE IF NOT EXISTS enrollment_rollups(
+        term TEXT NOT NULL,
+        crn INTEGER NOT NULL,
+        resolution TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        samples INTEGER NOT NULL,
+        min_act INTEGER NOT NULL,
+        max_act INTEGER NOT NULL,
+        min_rem INTEGER NOT NULL,
+        max_rem INTEGER NOT NULL,
+        min_wl_act INTEGER NOT NULL,
+        max_wl_act INTEGER NOT NULL,
+        last_ts TEXT NOT NULL,
+        cap INTEGER NOT NULL,
+        act INTEGER NOT NULL,
+        rem INTEGER NOT NULL,
+        wl_cap INTEGER NOT NULL,
+        wl_act INTEGER NOT NULL,
+        wl_rem INTEGER NOT NULL,
+        PRIMARY KEY (term, crn, resolution, bucket)
+    ) WITHOUT ROWID""",
+    # Scrapes of the CRN before compacted_to are compacted, daily_to likewise for its hourly rollups
+    """CREATE TABLE IF NOT EXISTS compaction_progress(
+        term TEXT NOT NULL,
+        crn INTEGER NOT NULL,
+        compacted_to TEXT NOT NULL,
+        daily_to TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (term, crn)
+    ) WITHOUT ROWID""",
+)
+ROLLUP_COLUMNS = ("samples", "min_act", "max_act", "min_rem", "max_rem", "min_wl_act", "max_wl_act",
+                  "last_ts", "cap", "act", "rem", "wl_cap", "wl_act", "wl_rem")
+# Length of the timestamp prefix naming a bucket, and what completes it to the bucket's start
+BUCKETS = {'hour': 13, 'day': 10}
+BUCKET_START = {'hour': ":00:00", 'day': " 00:00:00"}
+KEEP_DAYS = 14
+DAILY_DAYS = 90
+# Seconds a transaction holds the write lock before it is committed, a scrape waits at most about this long
+MAX_LOCK = 0.1
+# Seconds between transactions, lets a waiting scrape in
+PAUSE = 0.05
+# Free pages returned to the file system after each transaction
+VACUUM_PAGES = 256
+
+CompactStats = namedtuple('CompactStats', ('crns', 'rows', 'dropped', 'rollups', 'transactions', 'longest'))
+
+
+def create_compact_schema(conn):
+    """:param conn: sqlite3 connection"""
+    for statement in COMPACT_SCHEMA:
+        conn.execute(statement)
+
+
+def enable_incremental_vacuum(conn):
+    """
+    Switch an existing database to incremental auto vacuum
+
+    Databases created by dbwriter.connect already use it. Older ones need
+    a full VACUUM once, which rewrites the file and holds the write lock
+    throughout, so run it while the tracker is stopped.
+
+    :param conn: sqlite3 connection
+    :return: True if the database was vacuumed
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    logger.info("Vacuuming the database to enable incremental auto vacuum")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def _floor(ts, resolution):
+    """Start of the bucket a timestamp falls in, as timestamp text"""
+    return ts[:BUCKETS[resolution]] + BUCKET_START[resolution]
+
+
+def downsample(rows, previous=None, following=None):
+    """
+    Hourly rollups of one section's scrapes, and the scrapes not needed to tell its changes
+
+    :param rows: [(key, timestamp text, counts tuple), ...] oldest first, key identifies the row
+    :param previous: Counts of the scrape before rows, None if there is none
+    :param following: Counts of the scrape after rows, None if there is none
+    :return: ({bucket: rollup tuple in ROLLUP_COLUMNS order}, [key of each row to drop])
+    """
+    rollups = {}
+    dropped = []
+    for i, (key, ts, counts) in enumerate(rows):
+        after = rows[i + 1][2] if i + 1 < len(rows) else following
+        # Inside a run of identical counts, the first and last scrape of the run are kept
+        if counts == previous and counts == after:
+            dropped.append(key)
+        previous = counts
+        bucket = ts[:BUCKETS['hour']]
+        act, rem, wl_act = counts[1], counts[2], counts[4]
+        rollup = (1, act, act, rem, rem, wl_act, wl_act, ts) + tuple(counts)
+        rollups[bucket] = merge(rollups[bucket], rollup) if bucket in rollups else rollup
+    return rollups, dropped
+
+
+def merge(first, second):
+    """
+    :param first: Rollup tuple in ROLLUP_COLUMNS order
+    :param second: Rollup tuple of a later or overlapping period
+    :return: Rollup tuple covering both
+    """
+    last = second if second[7] >= first[7] else first
+    return ((first[0] + second[0],
+             min(first[1], second[1]), max(first[2], second[2]),
+             min(first[3], second[3]), max(first[4], second[4]),
+             min(first[5], second[5]), max(first[6], second[6]))
+            + tuple(last[7:]))
+
+
+class _Source:
+    """Scrapes of one term's sections, in the long layout or in legacy per CRN tables"""
+
+    def __init__(self, conn, term, legacy=False):
+        self.conn = conn
+        self.term = term
+        self.prefix = term_prefix(term) + "_" if legacy else None
+
+    def crns(self):
+        if self.prefix is None:
+            return [crn for (crn,) in self.conn.execute("SELECT DISTINCT crn FROM enrollment WHERE term=?",
+                                                        (self.term,))]
+        names = self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ?",
+                                  (self.prefix + "%",))
+        return sorted(int(name[len(self.prefix):]) for (name,) in names
+                      if name.startswith(self.prefix) and name[len(self.prefix):].isdigit())
+
+    def _select(self, crn):
+        if self.prefix is None:
+            return ("SELECT ts, ts, cap, act, rem, wl_cap, wl_act, wl_rem FROM enrollment "
+                    "WHERE term=? AND crn=? AND ", "ts", (self.term, crn))
+        return (f"SELECT rowid, Timestamp, Cap, Act, Rem, WL_Cap, WL_Act, WL_Rem FROM {self.prefix}{crn} "
+                f"WHERE ", "Timestamp", ())
+
+    def rows(self, crn, start, before):
+        """
+        :return: (counts of the scrape before start or None, [(key, ts, counts) from start to before],
+                  counts of the first scrape at or after before or None)
+        """
+        select, ts, params = self._select(crn)
+        row = self.conn.execute(f"{select}{ts}<? ORDER BY {ts} DESC LIMIT 1", params + (start,)).fetchone()
+        previous = tuple(int(count) for count in row[2:]) if row is not None else None
+        rows = []
+        following = None
+        for row in self.conn.execute(f"{select}{ts}>=? ORDER BY {ts}", params + (start,)):
+            counts = tuple(int(count) for count in row[2:])
+            if str(row[1]) >= before:
+                following = counts
+                break
+            rows.append((row[0], str(row[1]), counts))
+        return previous, rows, following
+
+    def drop(self, crn, keys):
+        if self.prefix is None:
+            self.conn.executemany("DELETE FROM enrollment WHERE term=? AND crn=? AND ts=?",
+                                  ((self.term, crn, key) for key in keys))
+        else:
+            self.conn.executemany(f"DELETE FROM {self.prefix}{crn} WHERE rowid=?", ((key,) for key in keys))
+
+
+@contextmanager
+def _transaction(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def compact_term(conn, term, before, daily_before=None, legacy=False, max_lock=MAX_LOCK, pause=PAUSE):
+    """
+    Downsample a term's scrapes older than a time
+
+    :param conn: sqlite3 connection, not inside a transaction
+    :param term: Semester option value
+    :param before: datetime or timestamp text, scrapes before the start of its hour are compacted
+    :param daily_before: Optional datetime or timestamp text, hourly rollups of the days before it
+                         are merged into daily ones. Capped at before.
+    :param legacy: Compact the <prefix>_<CRN> tables of dbadd instead of enrollment
+    :param max_lock: Seconds after which a transaction is committed, once its current CRN is done
+    :param pause: Seconds between transactions
+    :return: CompactStats
+    """
+    create_compact_schema(conn)
+    before = _floor(timestamp(before), 'hour')
+    daily = min(_floor(timestamp(daily_before), 'day'), before) if daily_before is not None else ''
+    source = _Source(conn, term, legacy)
+    progress = {crn: (compacted, daily_to) for crn, compacted, daily_to in conn.execute(
+        "SELECT crn, compacted_to, daily_to FROM compaction_progress WHERE term=?", (term,))}
+    crns = [crn for crn in source.crns()
+            if progress.get(crn, ('', ''))[0] < before or progress.get(crn, ('', ''))[1] < daily]
+    incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    totals = [0, 0, 0]
+    transactions = 0
+    longest = 0.0
+    i = 0
+    while i < len(crns):
+        with _transaction(conn), metrics.REGISTRY.stage('compact_batch'):
+            started = time.perf_counter()
+            while i < len(crns) and time.perf_counter() - started < max_lock:
+                compacted, daily_to = progress.get(crns[i], ('', ''))
+                counted = _compact_crn(conn, source, crns[i], compacted, before, daily_to, daily)
+                totals = [total + count for total, count in zip(totals, counted)]
+                i += 1
+        transactions += 1
+        longest = max(longest, time.perf_counter() - started)
+        if incremental:
+            # execute steps the pragma once, which frees a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES});")
+        if pause:
+            time.sleep(pause)
+    stats = CompactStats(len(crns), totals[0], totals[1], totals[2], transactions, longest)
+    if crns:
+        logger.info(f"Compacted {term} before {before}: {stats}")
+    metrics.inc('omscs_compacted_rows_total', totals[1])
+    return stats
+
+
+def _compact_crn(conn, source, crn, compacted, before, daily_to, daily):
+    """
+    Compact one section and record its progress, within the caller's transaction
+
+    :return: (rows read, rows dropped, rollups written)
+    """
+    term = source.term
+    rows = dropped = rollups = 0
+    if compacted < before:
+        previous, scraped, following = source.rows(crn, compacted, before)
+        buckets, drop = downsample(scraped, previous, following)
+        source.drop(crn, drop)
+        _store(conn, term, crn, 'hour', buckets)
+        rows, dropped, rollups = len(scraped), len(drop), len(buckets)
+        compacted = before
+    if daily_to < daily:
+        rollups += _merge_daily(conn, term, crn, daily)
+        daily_to = daily
+    conn.execute("INSERT OR REPLACE INTO compaction_progress VALUES (?, ?, ?, ?)", (term, crn, compacted, daily_to))
+    return rows, dropped, rollups
+
+
+def _store(conn, term, crn, resolution, buckets):
+    """Write rollups, merged into any already stored for the same buckets"""
+    if not buckets:
+        return
+    stored = {row[0]: tuple(row[1:]) for row in conn.execute(
+        f"SELECT bucket, {', '.join(ROLLUP_COLUMNS)} FROM enrollment_rollups "
+        f"WHERE term=? AND crn=? AND resolution=? AND bucket BETWEEN ? AND ?",
+        (term, crn, resolution, min(buckets), max(buckets)))}
+    placeholders = ", ".join("?" * (4 + len(ROLLUP_COLUMNS)))
+    conn.executemany(f"INSERT OR REPLACE INTO enrollment_rollups VALUES ({placeholders})",
+                     ((term, crn, resolution, bucket) + (merge(stored[bucket], rollup) if bucket in stored else rollup)
+                      for bucket, rollup in buckets.items()))
+
+
+def _merge_daily(conn, term, crn, before):
+    """Replace the hourly rollups of days before a time with daily ones, return the number written"""
+    hours = conn.execute(f"""
+        SELECT bucket, {', '.join(ROLLUP_COLUMNS)} FROM enrollment_rollups
+        WHERE term=? AND crn=? AND resolution='hour' AND bucket<? ORDER BY bucket""",
+                         (term, crn, before[:BUCKETS['hour']])).fetchall()
+    days = {}
+    for row in hours:
+        day = row[0][:BUCKETS['day']]
+        days[day] = merge(days[day], tuple(row[1:])) if day in days else tuple(row[1:])
+    conn.execute("DELETE FROM enrollment_rollups WHERE term=? AND crn=? AND resolution='hour' AND bucket<?",
+                 (term, crn, before[:BUCKETS['hour']]))
+    _store(conn, term, crn, 'day', days)
+    return len(days)
+
+
+def compact_metrics(conn, before, daily_before=None, pause=PAUSE):
+    """
+    Keep one metrics snapshot per hour before a time, and one per day before another
+
+    Counters and summaries are cumulative, so the last snapshot of an
+    hour or day still gives every total and rate at that resolution.
+
+    :param conn: sqlite3 connection, not inside a transaction
+    :param before: datetime or timestamp text, snapshots before the start of its hour are thinned
+    :param daily_before: Optional datetime or timestamp text, days before it keep their last snapshot only.
+                         Capped at before.
+    :param pause: Seconds between transactions, one per day thinned
+    :return: Number of rows deleted
+    """
+    conn.execute(metrics.METRICS_SCHEMA)
+    before = _floor(timestamp(before), 'hour')
+    daily = min(_floor(timestamp(daily_before), 'day'), before) if daily_before is not None else ''
+    days = [day for (day,) in conn.execute(
+        "SELECT DISTINCT substr(ts, 1, ?) FROM metrics WHERE ts<? ORDER BY 1", (BUCKETS['day'], before))]
+    deleted = 0
+    for day in days:
+        resolution = 'day' if day < daily[:BUCKETS['day']] else 'hour'
+        start = _floor(day, 'day')
+        end = min(timestamp(datetime.datetime.strptime(day, "%Y-%m-%d") + datetime.timedelta(days=1)), before)
+        with _transaction(conn):
+            # Every sample of a snapshot shares its ts, keep the latest ts of each bucket
+            deleted += conn.execute("""
+                DELETE FROM metrics WHERE ts>=? AND ts<? AND ts NOT IN (
+                    SELECT max(ts) FROM metrics WHERE ts>=? AND ts<? GROUP BY substr(ts, 1, ?))""",
+                                    (start, end, start, end, BUCKETS[resolution])).rowcount
+        if pause:
+            time.sleep(pause)
+    if deleted:
+        logger.info(f"Thinned {deleted} metrics rows before {before}")
+    return deleted
+
+
+def compact(conn, keep_days=KEEP_DAYS, daily_days=DAILY_DAYS, terms=None, legacy=False, now=None, **kwargs):
+    """
+    Compact every term of a database and thin its metrics, keeping the last keep_days at full resolution
+
+    :param conn: sqlite3 connection, not inside a transaction
+    :param keep_days: Days of scrapes kept as they are, eg the current registration window
+    :param daily_days: Days after which hourly rollups become daily, None to keep them hourly
+    :param terms: Terms compacted, by default every term stored in full
+    :param legacy: Compact the legacy tables of terms instead, which must then be given
+    :param now: datetime the windows end at, now by default
+    :param kwargs: Passed to compact_term, eg max_lock or pause
+    :return: {term: CompactStats}
+    """
+    now = now or datetime.datetime.now()
+    if terms is None:
+        if legacy:
+            raise ValueError("Legacy tables are compacted per term, give terms")
+        create_schema(conn)
+        terms = [term for (term,) in conn.execute("SELECT DISTINCT term FROM enrollment ORDER BY term")]
+    before = now - datetime.timedelta(days=keep_days)
+    daily_before = now - datetime.timedelta(days=daily_days) if daily_days is not None else None
+    stats = {term: compact_term(conn, term, before, daily_before, legacy, **kwargs) for term in terms}
+    if not legacy:
+        compact_metrics(conn, before, daily_before, kwargs.get('pause', PAUSE))
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default="OMSCS_CA.db")
+    commands = parser.add_subparsers(dest="command")
+    run = commands.add_parser("run", help="Downsample scrapes older than the retention window")
+    run.add_argument("--keep-days", type=float, default=KEEP_DAYS, help="Days kept at full resolution")
+    run.add_argument("--daily-days", type=float, default=DAILY_DAYS, help="Days after which rollups are daily")
+    run.add_argument("--term", action="append", help="Term to compact, may be repeated. Every term by default.")
+    run.add_argument("--legacy", action="store_true", help="Compact the per CRN tables of dbadd")
+    run.add_argument("--max-lock", type=float, default=MAX_LOCK, help="Seconds per transaction")
+    commands.add_parser("enable-vacuum", help="Vacuum once to switch the database to incremental vacuum")
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    if args.command == "run":
+        for name, result in compact(db, args.keep_days, args.daily_days, args.term, args.legacy,
+                                    max_lock=args.max_lock).items():
+            print(f"{name}: {result.crns} sections, {result.dropped} of {result.rows} scrapes dropped, "
+                  f"{result.rollups} rollups, {result.transactions} transactions, longest {result.longest:.3f}s")
+    elif args.command == "enable-vacuum":
+        print("Vacuumed" if enable_incremental_vacuum(db) else "Incremental vacuum already enabled")
+    else:
+        parser.print_help()
+    db.close()
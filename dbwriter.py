@@ -0,0 +1,545 @@
+"""
+Persistent database writer
+
+Keeps one sqlite connection open across scheduler runs and writes a
+whole scrape in a single transaction. Replaces the per call connection,
+per row sqlite_master checks and per CRN SELECTs of coursexp.dbadd.
+
+Layouts:
+long   - one enrollment table keyed by (term, CRN, timestamp) plus a
+         sections table with the latest course info per CRN
+legacy - the dbadd layout, courses<prefix> + one <prefix>_<CRN> table
+         per section. Use migrate.py to move existing data to long.
+
+The long layout can store every scrape (store="full") or only changes
+(store="changes"). In changes mode enrollment_runs holds one row per
+run of identical counts and scrapes records when each scrape happened,
+enrollhist.py rebuilds the per scrape or regular interval series.
+
+Intended use:
+writer = DBWriter('OMSCS_CA.db', term='201902')
+writer.write(parse_sections(page), scrape_time)
+or through dbadd(sections, scrape_time, writer=writer)
+"""
+from contextlib import contextmanager
+import hashlib
+import sqlite3
+import logging
+
+import metrics
+from metrics import timed
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+COURSE_COLUMNS = ("Slct", "CRN", "Subj", "Crse", "Sec", "Cmp", "Bas", "Cred",
+                  "Title", "Days", "Time", "Instructor", "Location", "Attribute")
+ENROLL_COLUMNS = ("Timestamp", "Cap", "Act", "Rem", "WL_Cap", "WL_Act", "WL_Rem")
+
+# Long layout
+# enrollment is clustered on its primary key, so one CRN across a term is
+# a range scan. enrollment_by_time covers every column, so all sections
+# at a time is a range scan of the index alone.
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS sections(
+        term TEXT NOT NULL,
+        crn INTEGER NOT NULL,
+        subj TEXT,
+        crse TEXT,
+        sec TEXT,
+        cmp TEXT,
+        bas TEXT,
+        cred TEXT,
+        title TEXT,
+        days TEXT,
+        time TEXT,
+        instructor TEXT,
+        location TEXT,
+        attribute TEXT,
+        PRIMARY KEY (term, crn)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS enrollment(
+        term TEXT NOT NULL,
+        crn INTEGER NOT NULL,
+        ts TEXT NOT NULL,
+        cap INTEGER NOT NULL,
+        act INTEGER NOT NULL,
+        rem INTEGER NOT NULL,
+        wl_cap INTEGER NOT NULL,
+        wl_act INTEGER NOT NULL,
+        wl_rem INTEGER NOT NULL,
+        PRIMARY KEY (term, crn, ts)
+    ) WITHOUT ROWID""",
+    """CREATE INDEX IF NOT EXISTS enrollment_by_time
+        ON enrollment(term, ts, crn, cap, act, rem, wl_cap, wl_act, wl_rem)""",
+    # Course info history. A section gets a new version whenever its hash
+    # changes, valid_to is NULL for the current one. sections holds the
+    # same current rows for simple joins.
+    """CREATE TABLE IF NOT EXISTS section_versions(
+        term TEXT NOT NULL,
+        crn INTEGER NOT NULL,
+        valid_from TEXT NOT NULL,
+        valid_to TEXT,
+        hash TEXT NOT NULL,
+        subj TEXT,
+        crse TEXT,
+        sec TEXT,
+        cmp TEXT,
+        bas TEXT,
+        cred TEXT,
+        title TEXT,
+        days TEXT,
+        time TEXT,
+        instructor TEXT,
+        location TEXT,
+        attribute TEXT,
+        PRIMARY KEY (term, crn, valid_from)
+    ) WITHOUT ROWID""",
+    """CREATE INDEX IF NOT EXISTS section_versions_by_time ON section_versions(term, valid_from, valid_to)""",
+    # Change only storage. first_ts/last_ts are the first and last scrapes
+    # that saw these counts, last_ts is NULL while the run is still current.
+    """CREATE TABLE IF NOT EXISTS enrollment_runs(
+        term TEXT NOT NULL,
+        crn INTEGER NOT NULL,
+        first_ts TEXT NOT NULL,
+        last_ts TEXT,
+        cap INTEGER NOT NULL,
+        act INTEGER NOT NULL,
+        rem INTEGER NOT NULL,
+        wl_cap INTEGER NOT NULL,
+        wl_act INTEGER NOT NULL,
+        wl_rem INTEGER NOT NULL,
+        PRIMARY KEY (term, crn, first_ts)
+    ) WITHOUT ROWID""",
+    """CREATE INDEX IF NOT EXISTS enrollment_runs_by_time ON enrollment_runs(term, first_ts, last_ts)""",
+    # subject and campus are '' when a scrape covered all of them
+    """CREATE TABLE IF NOT EXISTS scrapes(
+        term TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        campus TEXT NOT NULL,
+        ts TEXT NOT NULL,
+        sections INTEGER NOT NULL,
+        PRIMARY KEY (term, subject, campus, ts)
+    ) WITHOUT ROWID""",
+)
+SECTION_COLUMNS = ("term", "crn", "subj", "crse", "sec", "cmp", "bas", "cred", "title",
+                   "days", "time", "instructor", "location", "attribute")
+VERSION_COLUMNS = ("term", "crn", "valid_from", "valid_to", "hash") + SECTION_COLUMNS[2:]
+# GT term codes are <year><month semester starts>
+TERM_SEASONS = {'02': 'S', '05': 'U', '08': 'F'}
+
+# WAL lets readers continue while a scrape is written,
+# NORMAL sync is durable across application crashes in WAL mode
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+
+def connect(dbname, readonly=False):
+    """
+    Open a connection configured with the writer pragmas
+
+    :param dbname: Name of the database
+    :param readonly: Open read only through a uri
+    :return: sqlite3 connection in autocommit mode, transactions are explicit
+    """
+    # Scheduler jobs run on worker threads, one job at a time
+    if readonly:
+        conn = sqlite3.connect(f"file:{dbname}?mode=ro", uri=True, isolation_level=None,
+                               check_same_thread=False)
+    else:
+        conn = sqlite3.connect(dbname, isolation_level=None, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        # Only takes effect in a new database, before WAL and its first table. Lets compact.py
+        # return freed pages a few at a time, older databases need compact.py enable-vacuum once.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    for pragma in PRAGMAS[int(readonly):]:
+        conn.execute(pragma)
+    return conn
+
+
+def create_schema(conn):
+    """
+    Create the long layout tables and indexes if missing
+
+    :param conn: sqlite3 connection
+    """
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def term_prefix(term):
+    """
+    Legacy table prefix for a term code
+
+    :param term: Semester option value, eg '201902'
+    :return: Prefix, eg 'S19'
+    """
+    try:
+        return TERM_SEASONS[term[4:]] + term[2:4]
+    except (KeyError, TypeError):
+        raise ValueError(f"Unrecognized term code: {term}")
+
+
+def section_hash(section):
+    """
+    Content hash of a section's course info
+
+    :param section: sections table row, (term, crn, subj, ..., attribute)
+    :return: sha1 hex digest of every field after the CRN
+    """
+    return hashlib.sha1("\x1f".join(str(field) for field in section[2:]).encode('utf-8')).hexdigest()
+
+
+def changed_fields(old, new):
+    """
+    :param old: sections table row
+    :param new: sections table row of the same CRN
+    :return: List of (column, old value, new value) that differ
+    """
+    return [(column, before, after) for column, before, after in zip(SECTION_COLUMNS[2:], old[2:], new[2:])
+            if before != after]
+
+
+def timestamp(scrape_time):
+    """
+    Text form of a scrape time, as sqlite3 stores a datetime
+
+    :param scrape_time: datetime object or already formatted string
+    """
+    return scrape_time if isinstance(scrape_time, str) else scrape_time.isoformat(" ")
+
+
+class DBWriter:
+    """
+    Long lived writer for scraped course tables
+
+    long layout:
+    sections         - latest course info per (term, CRN)
+    section_versions - every version of the course info, see catalog.py
+    enrollment       - enrollment numbers per (term, CRN, scrape)
+
+    legacy layout, as written by coursexp.dbadd:
+    courses<prefix> - course info, a new row whenever a section changes
+    <prefix>_<CRN>  - enrollment numbers per scrape
+
+    One writer can take scrapes of several terms, subjects and campuses.
+    It is not thread safe, scrapes from worker threads should be handed
+    to the thread owning the writer.
+
+    :param dbname: Name of the database to write to
+    :param term: Default semester option value scrapes belong to, eg '201902'.
+                 None to require the term of every write.
+    :param layout: "long" or "legacy"
+    :param store: "full" writes every scrape, "changes" only changed counts.
+                   Long layout only.
+    """
+
+    def __init__(self, dbname='OMSCS_CA.db', term=None, layout='long', store='full'):
+        if layout not in ('long', 'legacy'):
+            raise ValueError(f"Unknown layout: {layout}")
+        if store not in ('full', 'changes') or (store == 'changes' and layout != 'long'):
+            raise ValueError(f"Unsupported store {store} for {layout} layout")
+        self.dbname = dbname
+        self.term = term
+        self.layout = layout
+        self.store = store
+        self.conn = connect(dbname)
+        if layout == 'long':
+            create_schema(self.conn)
+        self.known_tables = {name for (name,) in
+                             self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        # Called as listener(term, sections, scrape_time, subject=, campus=) after each committed write
+        self.listeners = []
+        # Inside batch(), writes join its transaction
+        self.in_batch = False
+        self._reset_caches()
+
+    def _reset_caches(self):
+        # term -> CRN -> stored course rows, loaded once per term.
+        # legacy: set of every row version, long: latest sections row
+        self.course_rows = {}
+        # Long layout: term -> CRN -> hash of the current section version
+        self.course_hashes = {}
+        # Change only store: term -> CRN -> (first_ts, counts) of the current run
+        self.open_runs = {}
+        # Change only store: (term, subject, campus) -> timestamp of the last scrape
+        self.last_scrape = {}
+
+    def _load_term(self, term):
+        if self.layout == 'long':
+            cursor = self.conn.execute(f"SELECT {', '.join(SECTION_COLUMNS)} FROM sections WHERE term=?", (term,))
+            self.course_rows[term] = {row[1]: tuple(row) for row in cursor}
+            self.course_hashes[term] = dict(self.conn.execute(
+                "SELECT crn, hash FROM section_versions WHERE term=? AND valid_to IS NULL", (term,)))
+            self._version_unversioned(term)
+        else:
+            course_tbl = f"courses{term_prefix(term)}"
+            self.course_rows[term] = {}
+            if course_tbl in self.known_tables:
+                for row in self.conn.execute(f"SELECT * FROM {course_tbl}"):
+                    self.course_rows[term].setdefault(row[1], set()).add(tuple(row))
+        if self.store == 'changes':
+            cursor = self.conn.execute("""
+                SELECT crn, first_ts, cap, act, rem, wl_cap, wl_act, wl_rem
+                FROM enrollment_runs WHERE term=? AND last_ts IS NULL""", (term,))
+            self.open_runs[term] = {row[0]: (row[1], tuple(row[2:])) for row in cursor}
+            cursor = self.conn.execute("SELECT subject, campus, max(ts) FROM scrapes WHERE term=? "
+                                       "GROUP BY subject, campus", (term,))
+            for subject, campus, ts in cursor:
+                self.last_scrape[(term, subject, campus)] = ts
+
+    def _version_unversioned(self, term):
+        """
+        First versions for sections written before section_versions existed
+
+        They are taken as valid from the first scrape of the term.
+        """
+        missing = [row for crn, row in self.course_rows[term].items() if crn not in self.course_hashes[term]]
+        if not missing:
+            return
+        first = self.conn.execute("SELECT min(ts) FROM scrapes WHERE term=?", (term,)).fetchone()[0] or \
+            self.conn.execute("SELECT min(ts) FROM enrollment WHERE term=?", (term,)).fetchone()[0] or ""
+        values = []
+        for row in missing:
+            digest = section_hash(row)
+            values.append(row[:2] + (first, None, digest) + row[2:])
+            self.course_hashes[term][row[1]] = digest
+        logger.info(f"Recording first versions of {len(values)} sections of {term}")
+        self._transaction([(f"INSERT OR IGNORE INTO section_versions VALUES "
+                            f"({', '.join('?' * len(VERSION_COLUMNS))})", values)])
+
+    def _create_table(self, name, columns):
+        if not name.replace("_", "").isalnum():
+            raise ValueError(f"Illegal table name: {name}")
+        logger.warning(f"{name} table being created")
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {name}({', '.join(columns)})")
+        self.known_tables.add(name)
+
+    @timed('db_write')
+    def write(self, sections, scrape_time, term=None, subject='', campus=''):
+        """
+        Write one scrape
+
+        :param sections: sections.Section records from parse_sections
+        :param scrape_time: Time the sections were scraped, datetime object
+        :param term: Semester the scrape belongs to, defaults to the writer's term
+        :param subject: Subject searched for, '' if the scrape covered every subject
+        :param campus: Campus searched for, '' if the scrape covered every campus.
+                       Sections of other subjects or campuses are not treated
+                       as gone when missing from this scrape.
+        :return: Number of enrollment rows written
+        :raise ValueError: If neither the scrape nor the writer has a term
+        """
+        term = term or self.term
+        if not term:
+            raise ValueError("Scrape written without a term and the writer has no default term")
+        if term not in self.course_rows:
+            self._load_term(term)
+        if self.layout == 'long':
+            written = self._write_long(sections, scrape_time, term, subject, campus)
+        else:
+            written = self._write_legacy(sections, scrape_time, term)
+        metrics.inc('omscs_rows_written_total', written)
+        for listener in self.listeners:
+            # The scrape is already committed, a failing listener must not fail the write
+            try:
+                listener(term, sections, scrape_time, subject=subject, campus=campus)
+            except Exception:
+                logger.exception(f"Write listener {listener} failed")
+        return written
+
+    def _transaction(self, statements, new_tables=()):
+        """
+        Run (sql, values) pairs with executemany inside one transaction
+
+        On failure the cached state is dropped so it is reloaded from the db.
+
+        :param statements: (sql, values) pairs
+        :param new_tables: (name, columns) of tables to create first
+        """
+        cursor = self.conn.cursor()
+        if self.in_batch:
+            # batch() commits, or rolls back and resets the caches
+            for name, columns in new_tables:
+                self._create_table(name, columns)
+            for sql, values in statements:
+                cursor.executemany(sql, values)
+            return
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for name, columns in new_tables:
+                self._create_table(name, columns)
+            for sql, values in statements:
+                cursor.executemany(sql, values)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            self._reset_after_rollback()
+            raise
+
+    def _reset_after_rollback(self):
+        self.known_tables = {name for (name,) in
+                             self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        self._reset_caches()
+
+    @contextmanager
+    def batch(self):
+        """
+        Write several scrapes in one transaction
+
+        Used for bulk loads such as reingest.py, where a commit per scrape
+        would dominate. Other statements run on self.conn inside the block
+        join the transaction. Listeners still run after each write, they
+        must not begin transactions of their own.
+
+        with writer.batch():
+            for sections, scrape_time in scrapes:
+                writer.write(sections, scrape_time)
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.in_batch = True
+        try:
+            yield self
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            self._reset_after_rollback()
+            raise
+        finally:
+            self.in_batch = False
+
+    def _run_statements(self, ts, counts, term, subject, campus):
+        """
+        Changes to enrollment_runs for one scrape
+
+        Runs whose counts changed, or whose section disappeared from the
+        scraped subject and campus, are closed at the previous scrape of
+        that subject and campus, and a new run is opened at this one.
+
+        :param ts: Timestamp text of this scrape
+        :param counts: CRN -> tuple of the six enrollment counts
+        :return: ((close sql, values), (open sql, values)), updated open runs
+        """
+        last_scrape = self.last_scrape.get((term, subject, campus))
+        course_rows = self.course_rows[term]
+        closed = []
+        opened = []
+        open_runs = dict(self.open_runs[term])
+        for crn, values in counts.items():
+            current = open_runs.get(crn)
+            if current is not None and current[1] == values:
+                continue
+            if current is not None:
+                # A run opened by another target's scrape ends at least where it began
+                closed.append((max(last_scrape or '', current[0]), term, crn, current[0]))
+            opened.append((term, crn, ts) + values)
+            open_runs[crn] = (ts, values)
+        for crn in set(open_runs) - set(counts):
+            # sections rows are (term, crn, subj, crse, sec, cmp, ...)
+            row = course_rows.get(crn)
+            if row is None or (subject and row[2] != subject) or (campus and row[5] != campus):
+                continue
+            first_ts = open_runs.pop(crn)[0]
+            closed.append((max(last_scrape or '', first_ts), term, crn, first_ts))
+        statements = (
+            ("UPDATE enrollment_runs SET last_ts=? WHERE term=? AND crn=? AND first_ts=?", closed),
+            ("INSERT OR REPLACE INTO enrollment_runs VALUES (?, ?, ?, NULL, ?, ?, ?, ?, ?, ?)", opened),
+        )
+        return statements, open_runs
+
+    def _write_long(self, sections, scrape_time, term, subject, campus):
+        ts = timestamp(scrape_time)
+        course_rows = self.course_rows[term]
+        course_hashes = self.course_hashes[term]
+        section_values = []
+        version_values = []
+        closed_versions = []
+        enroll_values = []
+        for sec in sections:
+            crn = sec.crn
+            section = (term, crn, sec.subj, sec.crse, sec.sec, sec.cmp, sec.bas, sec.cred, sec.title,
+                       sec.days, sec.time, sec.instructor, sec.location, sec.attribute)
+            digest = section_hash(section)
+            if course_hashes.get(crn) != digest:
+                if crn in course_hashes:
+                    logger.warning(f"Changes to course table row of {crn}: "
+                                   f"{changed_fields(course_rows[crn], section)}")
+                    closed_versions.append((ts, term, crn))
+                section_values.append(section)
+                version_values.append(section[:2] + (ts, None, digest) + section[2:])
+            enroll_values.append((term, crn, ts) + sec.counts)
+        statements = [
+            (f"INSERT OR REPLACE INTO sections VALUES ({', '.join('?' * len(SECTION_COLUMNS))})",
+             section_values),
+            ("UPDATE section_versions SET valid_to=? WHERE term=? AND crn=? AND valid_to IS NULL",
+             closed_versions),
+            (f"INSERT OR REPLACE INTO section_versions VALUES ({', '.join('?' * len(VERSION_COLUMNS))})",
+             version_values),
+            ("INSERT OR IGNORE INTO scrapes VALUES (?, ?, ?, ?, ?)",
+             [(term, subject, campus, ts, len(enroll_values))]),
+        ]
+        if self.store == 'changes':
+            # Scope checks for gone sections need this scrape's course rows
+            for section in section_values:
+                course_rows[section[1]] = section
+            run_statements, open_runs = self._run_statements(ts, {v[1]: v[3:] for v in enroll_values},
+                                                             term, subject, campus)
+            statements += run_statements
+            written = sum(len(values) for _, values in run_statements)
+        else:
+            statements.append(("INSERT OR IGNORE INTO enrollment VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               enroll_values))
+            written = len(enroll_values)
+        self._transaction(statements)
+        for section, version in zip(section_values, version_values):
+            course_rows[section[1]] = section
+            course_hashes[section[1]] = version[4]
+        if self.store == 'changes':
+            self.open_runs[term] = open_runs
+            self.last_scrape[(term, subject, campus)] = ts
+        logger.debug(f"DB fill finished, {written} enrollment rows")
+        return written
+
+    def _write_legacy(self, sections, scrape_time, term):
+        semester_prefix = term_prefix(term)
+        course_tbl = f"courses{semester_prefix}"
+        course_rows = self.course_rows[term]
+        course_values = []
+        enroll_values = {}
+        for sec in sections:
+            crn = str(sec.crn)
+            row_data = sec.course_row()
+            stored = course_rows.setdefault(crn, set())
+            if row_data not in stored:
+                if stored:
+                    logger.warning("Changes to course table rows")
+                    logger.warning(f"scrape: {row_data}")
+                    logger.warning(f"db:     {stored}")
+                course_values.append(row_data)
+            enroll_values.setdefault(f"{semester_prefix}_{crn}", []).append((scrape_time,) + sec.counts)
+
+        new_tables = [(table, ENROLL_COLUMNS) for table in enroll_values if table not in self.known_tables]
+        if course_tbl not in self.known_tables:
+            new_tables.insert(0, (course_tbl, COURSE_COLUMNS))
+        statements = [(f"INSERT INTO {course_tbl} VALUES ({', '.join('?' * len(COURSE_COLUMNS))})",
+                       course_values)]
+        placeholders = ", ".join("?" * len(ENROLL_COLUMNS))
+        statements += [(f"INSERT INTO {table} VALUES ({placeholders})", values)
+                       for table, values in enroll_values.items()]
+        self._transaction(statements, new_tables)
+        for row_data in course_values:
+            course_rows[row_data[1]].add(row_data)
+        written = sum(len(values) for values in enroll_values.values())
+        logger.debug(f"DB fill finished, {written} enrollment rows")
+        return written
+
+    def close(self):
+        """Checkpoint the WAL and close the connection"""
+        self.conn.execute("PRAGMA optimize")
+        self.conn.close()
@@ -0,0 +1,418 @@
+"""
+Scraping engines
+
+Common interface for getting the OSCAR course table for a semester.
+
+selenium - drives a full browser through buzzport and OSCAR
+http     - submits the term select and advanced search forms directly
+           over a pooled HTTP session, reusing the browser login cookies
+
+Both hand the results page to sections.parse_sections, so the records
+returned are identical whichever engine fetched them. Both keep their
+login cookies in a sessioncache.SessionManager, so a login is only done
+when the cached session no longer passes a one request check.
+"""
+from urllib.parse import urlsplit
+import datetime
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from browsers import MAX_RSS, MAX_RUNS, ManagedBrowser
+from coursexp import _lookup_classes, browser_setup, gtlogin, gotosem, scrape_sections
+from sections import parse_sections
+from termwatch import TERM_PAGE, parse_terms
+import metrics
+from metrics import timed
+from navsteps import BUZZPORT_HOME, site_url
+from sessioncache import CookieCache, SessionManager
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+OSCAR_BASE_URL = site_url("https://oscar.gatech.edu/pls/bprod/")
+# Elements of the buzzport and CAS login forms, see navsteps.LOGIN_PAGE
+LOGIN_FORM_MARKERS = ('id="login_btn"', 'id="username"')
+
+
+class SessionExpired(Exception):
+    """Raised when OSCAR answers with a login page instead of results"""
+
+
+class ScrapeEngine:
+    """
+    Interface shared by all engines
+
+    Subclasses implement login(), scrape(semester, subject, campus) and terms()
+    """
+    name = None
+
+    def login(self):
+        """Ensure the engine is authenticated with OSCAR"""
+        raise NotImplementedError
+
+    def scrape(self, semester, subject=None, campus=None):
+        """
+        Fetch and parse the course table for a semester
+
+        :param semester: Semester option value on webpage, eg '201902'
+        :param subject: Subject searched for, engine default if None
+        :param campus: Campus searched for, engine default if None
+        :return: List of sections.Section
+        """
+        raise NotImplementedError
+
+    def terms(self):
+        """
+        Fetch the term options of the Look Up Classes page
+
+        :return: List of (term value, option text), see termwatch.parse_terms
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release any browser or network resources"""
+
+
+class SeleniumEngine(ScrapeEngine):
+    """
+    Original browser based navigation
+
+    gtlogin -> gotosem -> scrape_sections on a long lived browser
+
+    :param browser: Optional existing Selenium browser object
+    :param headless: Used if a browser needs to be created
+    :param subject: Default subject searched for
+    :param campus: Default campus searched for
+    :param cache: sessioncache.CookieCache the buzzport cookies are kept in
+    :param archive: pagearchive.PageArchive every results page is kept in, None to keep none
+    :param lean: Browsers skip images, stylesheets and fonts, see coursexp.browser_setup
+    :param max_runs: Scrapes before the browser is replaced, see browsers.ManagedBrowser
+    :param max_rss: Browser memory in bytes above which it is replaced
+    """
+    name = "selenium"
+
+    def __init__(self, browser=None, headless=True, subject='CS', campus='O', cache=None, archive=None,
+                 lean=True, max_runs=MAX_RUNS, max_rss=MAX_RSS):
+        self.managed = ManagedBrowser(lambda: browser_setup(headless=headless, lean=lean), max_runs, max_rss,
+                                      browser=browser)
+        self.subject = subject
+        self.campus = campus
+        self.archive = archive
+        self.sessions = SessionManager(self._full_login, self._check_session, cache)
+        self.cookies = None
+
+    @property
+    def browser(self):
+        """The current browser, a new one after a recycle"""
+        return self.managed.get()
+
+    def _full_login(self):
+        gtlogin(self.browser)
+        cookies = self.browser.get_cookies()
+        # gtlogin reports its own errors and returns None, only BuzzPort loading shows the login worked
+        if not self._check_session(cookies):
+            raise SessionExpired("Login did not reach BuzzPort")
+        return cookies
+
+    def _check_session(self, cookies):
+        self.browser.get(BUZZPORT_HOME)
+        if self.browser.title != "BuzzPort":
+            # Fresh browser, load the cached cookies and try again
+            restore_cookies(self.browser, cookies)
+            self.browser.get(BUZZPORT_HOME)
+        return self.browser.title == "BuzzPort"
+
+    def login(self):
+        self.cookies = self.sessions.get(rejected=self.cookies)
+
+    def scrape(self, semester, subject=None, campus=None):
+        subject = subject or self.subject
+        campus = campus or self.campus
+        with self.managed.run() as browser:
+            # One page load confirms the browser is still logged in, gtlogin only runs when it is not.
+            # A recycled browser gets the saved cookies back here.
+            self.cookies = self.sessions.get(verify=True)
+            gotosem(browser, semester, subject, campus)
+            return scrape_sections(browser, keep=_keeper(self.archive, semester, subject, campus))
+
+    def terms(self):
+        with self.managed.run() as browser:
+            self.cookies = self.sessions.get(verify=True)
+            _lookup_classes(browser)
+            return parse_terms(browser.page_source)
+
+    def close(self):
+        self.managed.close()
+
+
+class HttpEngine(ScrapeEngine):
+    """
+    Browserless engine posting the OSCAR forms directly
+
+    Authentication still relies on buzzport + Duo, so cookies are taken
+    from a browser session once and reused until OSCAR rejects them.
+
+    :param cookies: Cookies as returned by selenium's get_cookies()
+                    or a plain name -> value dict
+    :param base_url: OSCAR base url, override to point at a stub server
+    :param subject: Subject code searched for
+    :param campus: Campus code searched for
+    :param timeout: Per request timeout in seconds
+    :param pool_size: Number of pooled connections kept per host
+    :param login_with: Callable returning fresh cookies, used by login()
+    :param sessions: sessioncache.SessionManager used by login() instead of login_with,
+                     can be shared by several engines
+    :param archive: pagearchive.PageArchive every results page is kept in, None to keep none
+    """
+    name = "http"
+
+    def __init__(self, cookies=None, base_url=OSCAR_BASE_URL, subject='CS', campus='O',
+                 timeout=30, pool_size=4, login_with=None, sessions=None, archive=None):
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.subject = subject
+        self.campus = campus
+        self.timeout = timeout
+        self.login_with = login_with
+        self.sessions = sessions
+        self.archive = archive
+        self.cookies = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if cookies:
+            self.set_cookies(cookies)
+
+    def set_cookies(self, cookies):
+        """
+        Load cookies into the pooled session
+
+        :param cookies: List of selenium cookie dicts or name -> value dict
+        """
+        self.session.cookies.clear()
+        if isinstance(cookies, dict):
+            cookies = [{'name': name, 'value': value} for name, value in cookies.items()]
+        for cookie in cookies:
+            kwargs = {}
+            if cookie.get('domain'):
+                kwargs['domain'] = cookie['domain']
+            if cookie.get('path'):
+                kwargs['path'] = cookie['path']
+            self.session.cookies.set(cookie['name'], cookie['value'], **kwargs)
+
+    def login(self):
+        if self.sessions is not None:
+            self.cookies = self.sessions.get(rejected=self.cookies)
+            self.set_cookies(self.cookies)
+            return
+        if self.login_with is None:
+            if not self.session.cookies:
+                raise SessionExpired("No cookies available and no login method supplied")
+            return
+        logger.debug("Refreshing http engine cookies")
+        self.set_cookies(self.login_with())
+
+    def _post(self, proc, data):
+        return self._request('POST', proc, data=data)
+
+    def _request(self, method, proc, **kwargs):
+        url = self.base_url + proc
+        response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        # Expired sessions are redirected back to the buzzport/CAS login
+        if 'login' in response.url.lower():
+            raise SessionExpired(f"Redirected to login page at {response.url}")
+        return response
+
+    def check_session(self):
+        """
+        Check the session cookies with a single request for the OSCAR main menu
+
+        :return: False if OSCAR answers with its login page
+        """
+        try:
+            response = self.session.get(self.base_url + 'twbkwbis.P_GenMenu', params={'name': 'bmenu.P_MainMnu'},
+                                        timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.warning(f"Session check request failed: {e!r}")
+            return False
+        return response.ok and 'login' not in response.url.lower()
+
+    def term_form(self, semester):
+        """Submit the term selection form, as clicking Submit on Look Up Classes"""
+        data = [('p_calling_proc', 'P_CrseSearch'), ('p_term', semester)]
+        return self._post('bwckgens.p_proc_term_date', data)
+
+    def search_form(self, semester, subject=None, campus=None):
+        """
+        Submit the advanced search form
+
+        Field order and the 'dummy' placeholders mirror the form OSCAR
+        serves, the backend expects every multi select to be present.
+        """
+        subject = subject or self.subject
+        campus = campus or self.campus
+        data = [('rsts', 'dummy'), ('crn', 'dummy'), ('term_in', semester)]
+        for field in ('sel_subj', 'sel_day', 'sel_schd', 'sel_insm', 'sel_camp',
+                      'sel_levl', 'sel_sess', 'sel_instr', 'sel_ptrm', 'sel_attr'):
+            data.append((field, 'dummy'))
+        data += [('sel_subj', subject), ('sel_crse', ''), ('sel_title', ''), ('sel_schd', '%'),
+                 ('sel_from_cred', ''), ('sel_to_cred', ''), ('sel_camp', campus), ('sel_levl', '%'),
+                 ('sel_ptrm', '%'), ('sel_instr', '%'), ('sel_attr', '%'),
+                 ('begin_hh', '0'), ('begin_mi', '0'), ('begin_ap', 'a'),
+                 ('end_hh', '0'), ('end_mi', '0'), ('end_ap', 'a'),
+                 ('SUB_BTN', 'Section Search'), ('path', '1')]
+        return self._post('bwskfcls.P_GetCrse_Advanced', data)
+
+    @timed('http_search')
+    def scrape(self, semester, subject=None, campus=None):
+        if not self.session.cookies:
+            self.login()
+        self.term_form(semester)
+        response = self.search_form(semester, subject, campus)
+        # A login form served in place of the results, without a redirect to give it away
+        if any(marker in response.text for marker in LOGIN_FORM_MARKERS):
+            raise SessionExpired("Results page is a login form")
+        # Empty when OSCAR found no classes, ValueError on any other page without the course table
+        sections = parse_sections(response.text)
+        # Only results pages are archived, reingest parses them again
+        keep = _keeper(self.archive, semester, subject or self.subject, campus or self.campus)
+        if keep is not None:
+            keep(response.text)
+        metrics.inc('omscs_rows_scraped_total', len(sections))
+        logger.debug("Scrape complete")
+        return sections
+
+    @timed('http_terms')
+    def terms(self):
+        if not self.session.cookies:
+            self.login()
+        response = self._request('GET', TERM_PAGE)
+        try:
+            return parse_terms(response.text)
+        except ValueError:
+            raise SessionExpired("Term page missing term select")
+
+    def close(self):
+        self.session.close()
+
+
+def _keeper(archive, semester, subject, campus):
+    """Callable archiving a fetched page under its target, None without an archive"""
+    if archive is None:
+        return None
+    return lambda page: archive.add(page, semester, subject, campus)
+
+
+def browser_cookies(headless=True):
+    """
+    Login through a temporary browser and return its cookies
+
+    The browser is closed afterwards so only the http session stays resident.
+
+    :param headless: Set if headless mode is to be used with the browser
+    :return: Cookies as returned by selenium's get_cookies()
+    """
+    browser = browser_setup(headless=headless)
+    try:
+        gtlogin(browser)
+        browser.get(BUZZPORT_HOME)
+        if browser.title != "BuzzPort":
+            raise SessionExpired("Login did not reach BuzzPort")
+        # OSCAR sets its own session cookie on first visit
+        browser.get(OSCAR_BASE_URL + "twbkwbis.P_GenMenu?name=bmenu.P_MainMnu")
+        return browser.get_cookies()
+    finally:
+        browser.quit()
+
+
+def restore_cookies(browser, cookies):
+    """
+    Add saved cookies belonging to the browser's current domain
+
+    Selenium only accepts cookies for the page it is on.
+
+    :param browser: Selenium browser object
+    :param cookies: Cookies as returned by selenium's get_cookies()
+    """
+    host = urlsplit(browser.current_url).hostname or ''
+    for cookie in cookies:
+        if host.endswith(cookie.get('domain', host).lstrip('.')):
+            browser.add_cookie(cookie)
+
+
+def http_sessions(base_url=OSCAR_BASE_URL, headless=True, cache=None):
+    """
+    SessionManager for http engines, logging in through a temporary browser
+
+    :param base_url: OSCAR base url the cookies are checked against
+    :param headless: Set if headless mode is to be used with the login browser
+    :param cache: sessioncache.CookieCache, defaults to session_http.bin
+    """
+    def check(cookies):
+        engine = HttpEngine(cookies, base_url=base_url, pool_size=1)
+        try:
+            return engine.check_session()
+        finally:
+            engine.close()
+
+    cache = cache if cache is not None else CookieCache('session_http.bin')
+    return SessionManager(lambda: browser_cookies(headless=headless), check, cache)
+
+
+def make_engine(name='selenium', headless=True, **kwargs):
+    """
+    Build a scraping engine by name
+
+    :param name: "selenium" or "http"
+    :param headless: Set if headless mode is to be used for any browser
+    :param kwargs: Passed to the engine constructor
+    :return: ScrapeEngine instance
+    """
+    if name == 'selenium':
+        kwargs.setdefault('cache', CookieCache('session_selenium.bin'))
+        return SeleniumEngine(headless=headless, **kwargs)
+    if name == 'http':
+        if 'cookies' not in kwargs and 'login_with' not in kwargs and 'sessions' not in kwargs:
+            kwargs['sessions'] = http_sessions(kwargs.get('base_url', OSCAR_BASE_URL), headless)
+        return HttpEngine(**kwargs)
+    raise ValueError(f"Unknown engine: {name}")
+
+
+def scrape_with_retry(engine, semester, subject=None, campus=None):
+    """
+    Scrape with an engine, retrying once through login on expired sessions
+
+    :param engine: ScrapeEngine instance
+    :param semester: Semester option value on webpage
+    :param subject: Subject searched for, engine default if None
+    :param campus: Campus searched for, engine default if None
+    :return: (sections, scrape_time)
+    """
+    try:
+        sections = engine.scrape(semester, subject, campus)
+    except SessionExpired:
+        logger.info(f"{engine.name} session expired, logging in again")
+        metrics.inc('omscs_retries_total', engine=engine.name)
+        engine.login()
+        sections = engine.scrape(semester, subject, campus)
+    return sections, datetime.datetime.now()
+
+
+def terms_with_retry(engine):
+    """
+    Term options from an engine, retrying once through login on expired sessions
+
+    :param engine: ScrapeEngine instance
+    :return: List of (term value, option text)
+    """
+    try:
+        return engine.terms()
+    except SessionExpired:
+        logger.info(f"{engine.name} session expired, logging in again")
+        metrics.inc('omscs_retries_total', engine=engine.name)
+        engine.login()
+        return engine.terms()
@@ -0,0 +1,342 @@
+"""
+Enrollment history queries
+
+Reads enrollment from the long layout regardless of how it was stored.
+Terms written with store="changes" are expanded from enrollment_runs,
+terms written with store="full" are read from enrollment directly, so
+callers see the same series either way. Scrapes compact.py dropped from
+a full store are filled in from the runs it kept, except in
+observations, which yields the kept scrapes only.
+"""
+import datetime
+
+COUNT_COLUMNS = ("cap", "act", "rem", "wl_cap", "wl_act", "wl_rem")
+
+
+def parse_ts(ts):
+    """
+    Parse timestamp text written by DBWriter
+
+    :param ts: 'YYYY-MM-DD HH:MM:SS[.ffffff]'
+    :return: datetime object
+    """
+    fmt = "%Y-%m-%d %H:%M:%S.%f" if "." in ts else "%Y-%m-%d %H:%M:%S"
+    return datetime.datetime.strptime(ts, fmt)
+
+
+def _text(when):
+    return when if isinstance(when, str) else when.isoformat(" ")
+
+
+def uses_runs(conn, term):
+    """
+    Check if a term was stored change only
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    """
+    return conn.execute("SELECT 1 FROM enrollment_runs WHERE term=? LIMIT 1", (term,)).fetchone() is not None
+
+
+def compacted_to(conn, term, crn=None):
+    """
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param crn: Optional CRN, any section of the term if None
+    :return: Timestamp text compact.py has compacted scrapes up to, '' if none
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='compaction_progress'").fetchone() is None:
+        return ""
+    row = conn.execute("SELECT max(compacted_to) FROM compaction_progress WHERE term=? AND (? IS NULL OR crn=?)",
+                       (term, crn, crn)).fetchone()
+    return row[0] or ""
+
+
+def terms(conn):
+    """Terms with stored enrollment"""
+    return [term for (term,) in conn.execute("SELECT DISTINCT term FROM scrapes UNION SELECT DISTINCT term "
+                                             "FROM enrollment UNION SELECT DISTINCT term FROM enrollment_runs "
+                                             "ORDER BY 1")]
+
+
+def _scope(conn, term, crn):
+    """(subject, campus) of a section, as written to the sections table"""
+    row = conn.execute("SELECT subj, cmp FROM sections WHERE term=? AND crn=?", (term, int(crn))).fetchone()
+    return row if row is not None else (None, None)
+
+
+def scrape_times(conn, term, start=None, end=None, subject=None, campus=None):
+    """
+    Timestamps of every scrape of a term
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param start: Optional first time included, datetime or text
+    :param end: Optional last time included, datetime or text
+    :param subject: Only scrapes that covered this subject
+    :param campus: Only scrapes that covered this campus
+    :return: List of timestamp text, oldest first
+    """
+    start = _text(start) if start is not None else ""
+    end = _text(end) if end is not None else "9999"
+    cursor = conn.execute("""
+        SELECT DISTINCT ts FROM scrapes
+        WHERE term=? AND ts BETWEEN ? AND ?
+        AND (? IS NULL OR subject='' OR subject=?) AND (? IS NULL OR campus='' OR campus=?)
+        ORDER BY ts""", (term, start, end, subject, subject, campus, campus))
+    times = [ts for (ts,) in cursor]
+    if not times and not uses_runs(conn, term):
+        # Full store written before the scrapes table existed
+        cursor = conn.execute("SELECT DISTINCT ts FROM enrollment WHERE term=? AND ts BETWEEN ? AND ? ORDER BY ts",
+                              (term, start, end))
+        times = [ts for (ts,) in cursor]
+    return times
+
+
+def snapshot_at(conn, term, when):
+    """
+    Enrollment of every section as of the last scrape at or before a time
+
+    Each section is taken from the last scrape of its own subject and
+    campus, when several targets of a term are scraped separately.
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param when: datetime or timestamp text
+    :return: (latest scrape timestamp used, {crn: (cap, act, rem, wl_cap, wl_act, wl_rem)}),
+             (None, {}) if nothing was scraped yet
+    """
+    when = _text(when)
+    scopes = conn.execute("""
+        SELECT subject, campus, max(ts) FROM scrapes WHERE term=? AND ts<=?
+        GROUP BY subject, campus""", (term, when)).fetchall()
+    if not scopes:
+        times = scrape_times(conn, term, end=when)
+        scopes = [('', '', times[-1])] if times else []
+    if not scopes:
+        return None, {}
+    runs = uses_runs(conn, term)
+    snapshot = {}
+    for subject, campus, ts in scopes:
+        snapshot.update(_scrape_counts(conn, term, ts, subject, campus, runs))
+    return max(ts for _, _, ts in scopes), snapshot
+
+
+def _scrape_counts(conn, term, ts, subject, campus, runs):
+    """(crn, counts) of the sections one scrape of a subject and campus saw"""
+    if runs:
+        cursor = conn.execute(f"""
+            SELECT r.crn, {', '.join('r.' + c for c in COUNT_COLUMNS)}
+            FROM enrollment_runs r JOIN sections s ON s.term=r.term AND s.crn=r.crn
+            WHERE r.term=? AND r.first_ts<=? AND (r.last_ts IS NULL OR r.last_ts>=?)
+            AND (?='' OR s.subj=?) AND (?='' OR s.cmp=?)""",
+                              (term, ts, ts, subject, subject, campus, campus))
+    elif ts < compacted_to(conn, term):
+        # Unchanged scrapes were dropped, take each section's last row at or before ts.
+        # Compaction keeps the first and last scrape of each run, so the section was still listed
+        # if the next row continues the same run, as _fill_compacted reads it.
+        cursor = conn.execute(f"""
+            SELECT e.crn, {', '.join('e.' + c for c in COUNT_COLUMNS)}
+            FROM sections s JOIN enrollment e ON e.term=s.term AND e.crn=s.crn AND e.ts=(
+                SELECT max(ts) FROM enrollment WHERE term=s.term AND crn=s.crn AND ts<=?)
+            WHERE s.term=? AND (?='' OR s.subj=?) AND (?='' OR s.cmp=?)
+            AND (e.ts=? OR EXISTS (
+                SELECT 1 FROM enrollment n WHERE n.term=s.term AND n.crn=s.crn AND n.ts=(
+                    SELECT min(ts) FROM enrollment WHERE term=s.term AND crn=s.crn AND ts>?)
+                AND {' AND '.join(f'n.{c}=e.{c}' for c in COUNT_COLUMNS)}))""",
+                              (ts, term, subject, subject, campus, campus, ts, ts))
+    else:
+        cursor = conn.execute(f"SELECT crn, {', '.join(COUNT_COLUMNS)} FROM enrollment WHERE term=? AND ts=?",
+                              (term, ts))
+    return ((row[0], tuple(row[1:])) for row in cursor)
+
+
+def observations(conn, term, after=None):
+    """
+    Every section seen by every scrape of a term, scrape by scrape
+
+    Unlike snapshot_at, a scrape of one subject or campus only yields the
+    sections it saw, so each observation is returned once.
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param after: Only scrapes later than this time, datetime or text
+    :return: Iterator of (timestamp text, [(crn, counts tuple), ...]), oldest first
+    """
+    after = _text(after) if after is not None else ""
+    runs = uses_runs(conn, term)
+    if not runs:
+        # One pass over the covering time index
+        cursor = conn.execute(f"""
+            SELECT ts, crn, {', '.join(COUNT_COLUMNS)} FROM enrollment
+            WHERE term=? AND ts>? ORDER BY ts, crn""", (term, after))
+        current, seen = None, []
+        for row in cursor:
+            if row[0] != current:
+                if seen:
+                    yield current, seen
+                current, seen = row[0], []
+            seen.append((row[1], tuple(row[2:])))
+        if seen:
+            yield current, seen
+        return
+    scrapes = conn.execute("SELECT ts, subject, campus FROM scrapes WHERE term=? AND ts>? ORDER BY ts",
+                           (term, after)).fetchall()
+    for ts, subject, campus in scrapes:
+        yield ts, list(_scrape_counts(conn, term, ts, subject, campus, runs))
+
+
+def history(conn, term, crn, start=None, end=None):
+    """
+    Enrollment of one section at every scrape it was seen in
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param crn: Section CRN
+    :param start: Optional first time included
+    :param end: Optional last time included
+    :return: List of (timestamp text, counts tuple), oldest first
+    """
+    start = _text(start) if start is not None else ""
+    end = _text(end) if end is not None else "9999"
+    if not uses_runs(conn, term):
+        compacted = compacted_to(conn, term, int(crn))
+        if start < compacted:
+            # Also the last row before start, its run may reach into the range
+            first = conn.execute("SELECT max(ts) FROM enrollment WHERE term=? AND crn=? AND ts<?",
+                                 (term, int(crn), start)).fetchone()[0]
+            start_from = first or start
+        else:
+            start_from = start
+        cursor = conn.execute(f"""
+            SELECT ts, {', '.join(COUNT_COLUMNS)} FROM enrollment
+            WHERE term=? AND crn=? AND ts BETWEEN ? AND ? ORDER BY ts""", (term, int(crn), start_from, end))
+        observed = [(row[0], tuple(row[1:])) for row in cursor]
+        if observed and observed[0][0] < compacted:
+            observed = _fill_compacted(observed, scrape_times(conn, term, observed[0][0], min(end, compacted),
+                                                              *_scope(conn, term, crn)), compacted)
+        return [(ts, counts) for ts, counts in observed if ts >= start]
+
+    runs = conn.execute(f"""
+        SELECT first_ts, last_ts, {', '.join(COUNT_COLUMNS)} FROM enrollment_runs
+        WHERE term=? AND crn=? AND first_ts<=? AND (last_ts IS NULL OR last_ts>=?)
+        ORDER BY first_ts""", (term, int(crn), end, start)).fetchall()
+    if not runs:
+        return []
+    subject, campus = _scope(conn, term, crn)
+    times = scrape_times(conn, term, max(start, runs[0][0]), end, subject, campus)
+    series = []
+    i = 0
+    for ts in times:
+        # Runs are disjoint and ordered, advance past runs that ended
+        while i < len(runs) and runs[i][1] is not None and runs[i][1] < ts:
+            i += 1
+        if i == len(runs):
+            break
+        if runs[i][0] <= ts:
+            series.append((ts, tuple(runs[i][2:])))
+    return series
+
+
+def _fill_compacted(observed, times, compacted):
+    """
+    Add the scrapes compaction dropped back into one section's rows
+
+    Kept rows before compacted are the first and last scrape of each run of
+    identical counts, every scrape between two rows of the same run saw them.
+
+    :param observed: [(timestamp text, counts)] oldest first
+    :param times: Scrape times covering the section, oldest first
+    :param compacted: Timestamp text the section was compacted up to
+    """
+    filled = []
+    i = 0
+    for (ts, counts), (next_ts, next_counts) in zip(observed, observed[1:] + [(None, None)]):
+        filled.append((ts, counts))
+        if next_ts is None or ts >= compacted or counts != next_counts:
+            continue
+        while i < len(times) and times[i] <= ts:
+            i += 1
+        while i < len(times) and times[i] < next_ts:
+            filled.append((times[i], counts))
+            i += 1
+    return filled
+
+
+def series(conn, term, crn, start, end, interval=datetime.timedelta(minutes=30)):
+    """
+    Regular interval series for one section
+
+    Each point carries the last scrape at or before it forward. Points
+    before the section was first seen, or after it disappeared, are None.
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param crn: Section CRN
+    :param start: First point, datetime
+    :param end: Last point, datetime
+    :param interval: Spacing of points, timedelta
+    :return: List of (datetime, counts tuple or None)
+    """
+    observed = history(conn, term, crn, None, end)
+    seen = scrape_times(conn, term, None, end, *_scope(conn, term, crn))
+    present = {ts for ts, _ in observed}
+    values = dict(observed)
+    points = []
+    i = 0
+    current = None
+    when = start
+    while when <= end:
+        text = _text(when)
+        while i < len(seen) and seen[i] <= text:
+            # A scrape without the section means it was gone at that time
+            current = values[seen[i]] if seen[i] in present else None
+            i += 1
+        points.append((when, current))
+        when += interval
+    return points
+
+
+def change_counts(conn, term, start=None, end=None, subject=None, campus=None):
+    """
+    Number of sections whose enrollment changed between consecutive scrapes
+
+    Sections appearing for the first time count as changed, sections
+    disappearing do not.
+
+    :param conn: sqlite3 connection
+    :param term: Semester option value
+    :param start: Optional first time included
+    :param end: Optional last time included
+    :param subject: Only sections and scrapes of this subject
+    :param campus: Only sections and scrapes of this campus
+    :return: List of (previous scrape timestamp, scrape timestamp, sections changed), oldest first
+    """
+    times = scrape_times(conn, term, start, end, subject, campus)
+    if len(times) < 2:
+        return []
+    scope = ("AND (? IS NULL OR s.subj=?) AND (? IS NULL OR s.cmp=?)", (subject, subject, campus, campus))
+    changed = dict.fromkeys(times[1:], 0)
+    if uses_runs(conn, term):
+        # Every new run starts at the scrape that saw the change
+        cursor = conn.execute(f"""
+            SELECT r.first_ts, count(*)
+            FROM enrollment_runs r JOIN sections s ON s.term=r.term AND s.crn=r.crn
+            WHERE r.term=? AND r.first_ts>? AND r.first_ts<=? {scope[0]}
+            GROUP BY r.first_ts""", (term, times[0], times[-1]) + scope[1])
+        for ts, count in cursor:
+            if ts in changed:
+                changed[ts] = count
+    else:
+        cursor = conn.execute(f"""
+            SELECT e.crn, e.ts, {', '.join('e.' + c for c in COUNT_COLUMNS)}
+            FROM enrollment e JOIN sections s ON s.term=e.term AND s.crn=e.crn
+            WHERE e.term=? AND e.ts>=? AND e.ts<=? {scope[0]}
+            ORDER BY e.crn, e.ts""", (term, times[0], times[-1]) + scope[1])
+        last_crn = last_counts = None
+        for row in cursor:
+            counts = row[2:]
+            if (row[0] != last_crn or counts != last_counts) and row[1] in changed:
+                changed[row[1]] += 1
+            last_crn, last_counts = row[0], counts
+    return [(previous, ts, changed[ts]) for previous, ts in zip(times, times[1:])]
@@ -3,58 +3,189 @@ Enrollment tracker
 
 Records enrollment changes over time
 """
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.blocking import BlockingScheduler
 import datetime
 import logging
-from coursexp import browser_setup, gtlogin, gotosem, scrape_courses, dbadd, logsetup
+from alerts import AlertEngine
+from analytics import Rollups
+import compact
+from dbwriter import DBWriter, connect, timestamp
+from engines import terms_with_retry
+import liveapi
+from liveapi import LiveAPI
+from pagearchive import PageArchive
+import metrics
+from pollpolicy import PollPlan
+from scrapepool import ScrapePool, Target, engine_factory
+from termwatch import TermWatcher
 
-logger = logging.getLogger(__name__)
-logger = logsetup(logger)
+# Logging setup as child of __main__, omscs track sends it to the log file
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
 
 
-def scheduled_actions(browser, semester):
+def scheduled_actions(pool, targets, writer, plan=None, publish=None):
     """
     Actions taken repeatedly to generate time series
 
     Concern:
     Potential remains for unhandled exceptions if resources unavailable
 
-    :param browser: Selenium browser object
-    :param semester: Semester used in gotosem navigation
+    :param pool: ScrapePool used to fetch the course tables
+    :param targets: List of scrapepool.Target scraped each run
+    :param writer: DBWriter kept open between runs
+    :param plan: pollpolicy.PollPlan, if given only targets it has due are
+                 scraped and each is rescheduled from its recent changes
+    :param publish: Called once the run's scrapes are written, eg liveapi.LiveAPI.publish
     """
     ct = datetime.datetime.now()
+    if plan is not None:
+        targets = plan.due(ct)
+        if not targets:
+            return
     print(f"Taking scheduled action {ct}")
-    logger.info(f"Preforming scheduled actions on {semester}")
-    gtlogin(browser)
-    gotosem(browser, semester)
-    rows = scrape_courses(browser)
-    scrape_time = datetime.datetime.now()
-    dbadd(rows, scrape_time)
+    logger.info(f"Preforming scheduled actions on {len(targets)} targets")
+    written = pool.run(targets, writer)
+    if publish is not None:
+        publish()
+    failed = [target for target, rows in written.items() if rows is None]
+    if failed:
+        logger.warning(f"Scrapes failed for {failed}")
+    if plan is not None:
+        now = datetime.datetime.now()
+        for target, rows in written.items():
+            plan.reschedule(target, writer.conn, now, failed=rows is None)
+    metrics.record_browser_rss(pool.engines)
+    metrics.store(writer.conn, timestamp(ct))
+    logger.info(f"Scheduled actions took {datetime.datetime.now() - ct}")
 
 
-def coordinator(semester='201902'):
+def coordinator(semester=None, engine='selenium', store='full', targets=None, max_workers=4,
+                min_interval=60, policy=None, metrics_port=9108, alerts=True, rollups=True,
+                discovery_minutes=5, archive='OMSCS_pages.db', api_port=9110, keep_days=compact.KEEP_DAYS,
+                headless=True):
     """
     Coordinates initial setup, then schedules repeated actions of scraper
 
-    :param semester: Semester used in gotosem navigation
+    :param semester: Semester tracked when no targets are given, required then
+    :param engine: Scraping engine, "selenium" or "http"
+    :param store: "full" keeps every scrape, "changes" only changed enrollment
+    :param targets: List of scrapepool.Target (term, subject, campus),
+                    defaults to online CS courses of semester
+    :param max_workers: Most targets scraped at once, each worker keeps its own engine
+    :param min_interval: Seconds between two scrapes of the same target
+    :param policy: pollpolicy.AdaptivePolicy setting each target's interval from its
+                   recent enrollment changes. Every target is scraped every 30 minutes if None.
+    :param metrics_port: Local port serving Prometheus metrics on /metrics, None to disable.
+                         Metrics are stored in the metrics table after every cycle either way.
+    :param alerts: Check the subscriptions of alerts.py after every write
+    :param rollups: Keep the analytics.py rollup tables up to date after every write
+    :param discovery_minutes: Minutes between checks of OSCAR's term list, None to disable.
+                              New terms are tracked for every subject and campus of targets
+                              and scraped right away.
+    :param archive: Database file every fetched results page is kept in, see pagearchive. None to keep none.
+    :param api_port: Local port of the liveapi.py JSON API, None to disable. Its snapshot is
+                     updated at the end of every run.
+    :param keep_days: Days of scrapes kept at full resolution, older ones are downsampled by
+                      compact.py once a day. None to keep everything.
+    :param headless: Run the scraping and login browsers headless
     """
     logger.debug("Starting the coordinator")
-    browser = browser_setup(headless=True)
-    scheduler = BlockingScheduler()
-    scheduler.add_job(scheduled_actions,
-                      args=[browser, semester],
-                      trigger='interval',
-                      minutes=30,
-                      next_run_time=datetime.datetime.now())
+    if not targets and not semester:
+        raise ValueError("coordinator needs targets or a semester to track")
+    targets = list(targets or [Target(semester, "CS", "O")])
+    pages = PageArchive(archive) if archive is not None else None
+    pool = ScrapePool(engine_factory(engine, headless=headless, archive=pages), min(max_workers, len(targets)),
+                      min_interval)
+    writer = DBWriter(term=targets[0].term, store=store)
+    if alerts:
+        writer.listeners.append(AlertEngine(writer.conn).observe)
+    if rollups:
+        writer.listeners.append(Rollups(writer.conn).observe)
+    if metrics_port is not None:
+        metrics.serve(metrics_port)
+    api = publish = None
+    if api_port is not None:
+        api = LiveAPI(writer.dbname)
+        api.load()
+        writer.listeners.append(api.observe)
+        publish = api.publish
+        liveapi.serve(api, api_port)
+    # One job at a time, so the writer is only ever used from one thread.
+    # Compaction has its own thread and connection, its short transactions interleave with the scrapes.
+    scheduler = BlockingScheduler(executors={'default': ThreadPoolExecutor(max_workers=1),
+                                             'maintenance': ThreadPoolExecutor(max_workers=1)})
+    plan = PollPlan(targets, policy) if policy is not None else None
+    if policy is None:
+        scheduler.add_job(scheduled_actions,
+                          args=[pool, targets, writer, None, publish],
+                          trigger='interval',
+                          minutes=30,
+                          id='scrape',
+                          next_run_time=datetime.datetime.now())
+    else:
+        # Check every minute for targets due
+        scheduler.add_job(scheduled_actions,
+                          args=[pool, targets, writer, plan, publish],
+                          trigger='interval',
+                          minutes=1,
+                          max_instances=1,
+                          coalesce=True,
+                          id='scrape',
+                          next_run_time=datetime.datetime.now())
+
+    def track_term(term):
+        # targets is the list the scrape job was given, so it sees the new targets on its next run
+        for subject, campus in sorted({(target.subject, target.campus) for target in targets}):
+            target = Target(term, subject, campus)
+            if target not in targets:
+                targets.append(target)
+                if plan is not None:
+                    plan.add(target)
+                logger.info(f"Tracking new target {target}")
+        scheduler.modify_job('scrape', next_run_time=datetime.datetime.now())
+
+    if discovery_minutes is not None:
+        watcher = TermWatcher(writer.conn, lambda: pool.call(terms_with_retry), on_new=[track_term])
+        scheduler.add_job(watcher.poll,
+                          trigger='interval',
+                          minutes=discovery_minutes,
+                          max_instances=1,
+                          coalesce=True,
+                          next_run_time=datetime.datetime.now())
+    maintenance = None
+    if keep_days is not None:
+        maintenance = connect(writer.dbname)
+        scheduler.add_job(compact.compact,
+                          args=[maintenance, keep_days],
+                          trigger='interval',
+                          days=1,
+                          max_instances=1,
+                          coalesce=True,
+                          executor='maintenance',
+                          id='compact',
+                          next_run_time=datetime.datetime.now() + datetime.timedelta(minutes=10))
     try:
         print("Starting scheduler")
         print('Press Ctrl+C to exit')
         scheduler.start()
     except (KeyboardInterrupt, SystemExit):
         pass
+    finally:
+        pool.close()
+        writer.close()
+        if maintenance is not None:
+            maintenance.close()
+        if api is not None:
+            api.close()
+        if pages is not None:
+            pages.close()
 
 
 if __name__ == "__main__":
-    # TODO add argparse:
-    # Args: headless, semester
-    coordinator()
+    # Same as python omscs.py track. Registered under its own name, so omscs does not import this file again.
+    import sys
+    import omscs
+    sys.modules['etracker'] = sys.modules['__main__']
+    omscs.main(["track"] + sys.argv[1:])
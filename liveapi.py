@@ -0,0 +1,374 @@
+"""
+Live availability API
+
+Read only HTTP/JSON service answering "how many seats are left" without
+opening the tracker database. The latest counts of every section are
+held in memory as an immutable snapshot per term. etracker stages each
+write into the next snapshot and swaps it in once a scheduled run is
+done, so readers see whole runs only and never take a lock.
+
+GET /terms                                   terms held, with their latest scrape time
+GET /sections?term=201902&subject=CS         every section, term defaults to the newest
+GET /sections/<crn>?term=201902              one section
+GET /sections/<crn>/history?hours=24         its counts at every scrape of the last hours
+
+Responses carry an ETag. Requests sending it back in If-None-Match,
+weak (W/) or not, or sending *, get a 304 without a body. Snapshots and
+their JSON are built once per run, requests only look them up. History is
+read through a small pool of read only connections, in WAL mode they never
+block the writer. Its windows start on HISTORY_BUCKET boundaries, so a
+history response is reused until the window moves on or a run publishes.
+Each snapshot keeps at most MAX_RESPONSES responses, least recently used
+first out.
+
+Usage:
+python liveapi.py [--db OMSCS_CA.db] [--port 9110] [--refresh 30]
+"""
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import datetime
+import hashlib
+import json
+import queue
+import threading
+import time
+import logging
+
+from dbwriter import connect, timestamp
+from enrollhist import COUNT_COLUMNS, history, snapshot_at
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+# Section fields served, besides the counts and the time they were scraped
+INFO_COLUMNS = ("crn", "subj", "crse", "sec", "cmp", "title", "days", "time", "instructor")
+# Longest history served
+MAX_HOURS = 24 * 14
+READERS = 4
+# History windows start on multiples of this
+HISTORY_BUCKET = datetime.timedelta(minutes=5)
+# Responses cached per snapshot
+MAX_RESPONSES = 8192
+
+
+def _json(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _etag(body):
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def _window_start(hours, now=None):
+    """Start of the history window of the last hours, rounded down to HISTORY_BUCKET"""
+    start = (now or datetime.datetime.now()) - datetime.timedelta(hours=hours)
+    return start - (start - datetime.datetime.min) % HISTORY_BUCKET
+
+
+def _matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header against a response's ETag, as RFC 7232 asks for
+
+    :param if_none_match: Header value, eg '"abc", W/"def"' or '*'
+    :param etag: Strong ETag of the response
+    """
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+
+class Snapshot:
+    """
+    Latest counts of one term, never modified once published
+
+    :param term: Semester option value
+    :param records: CRN -> section dict
+    """
+
+    def __init__(self, term, records):
+        self.term = term
+        self.records = records
+        self.ts = max((record['ts'] for record in records.values()), default=None)
+        # (path, query) -> (body, etag), filled as requests come in, least recently used first
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+
+    def response(self, key, build):
+        """
+        :param key: Hashable request key
+        :param build: Callable returning the JSON value, called once per key while it stays cached
+        :return: (body, etag)
+        """
+        with self.lock:
+            cached = self.responses.get(key)
+            if cached is not None:
+                self.responses.move_to_end(key)
+                return cached
+        body = _json(build())
+        # Concurrent builders of the same key store equal values
+        cached = (body, _etag(body))
+        with self.lock:
+            self.responses[key] = cached
+            if len(self.responses) > MAX_RESPONSES:
+                self.responses.popitem(last=False)
+        return cached
+
+    def sections(self, subject=None):
+        return {'term': self.term, 'ts': self.ts,
+                'sections': [record for _, record in sorted(self.records.items())
+                             if subject is None or record['subj'] == subject]}
+
+
+class LiveAPI:
+    """
+    Snapshots served by the API and the read only connections for history
+
+    :param dbname: Tracker database, long layout
+    :param readers: Read only connections kept for history queries
+    """
+
+    def __init__(self, dbname='OMSCS_CA.db', readers=READERS):
+        self.dbname = dbname
+        # term -> Snapshot, replaced as a whole on publish
+        self.snapshots = {}
+        # term -> CRN -> section dict, staged by observe
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.readers = queue.Queue()
+        for _ in range(readers):
+            self.readers.put(connect(dbname, readonly=True))
+        self.data_version = None
+
+    def _terms(self, conn):
+        return [term for (term,) in conn.execute("SELECT DISTINCT term FROM sections ORDER BY term")]
+
+    def load(self):
+        """Build every term's snapshot from the database, eg on startup"""
+        conn = self.readers.get()
+        try:
+            self.data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            snapshots = {}
+            for term in self._terms(conn):
+                info = {row[0]: dict(zip(INFO_COLUMNS, row)) for row in conn.execute(
+                    f"SELECT {', '.join(INFO_COLUMNS)} FROM sections WHERE term=?", (term,))}
+                now = timestamp(datetime.datetime.now())
+                scopes = conn.execute("SELECT subject, campus, max(ts) FROM scrapes WHERE term=? "
+                                      "GROUP BY subject, campus", (term,)).fetchall()
+                ts, counts = snapshot_at(conn, term, now)
+                records = {}
+                for crn, values in counts.items():
+                    if crn in info:
+                        record = dict(info[crn], **dict(zip(COUNT_COLUMNS, values)))
+                        record['ts'] = self._scope_ts(scopes, record) or ts
+                        records[crn] = record
+                snapshots[term] = Snapshot(term, records)
+        finally:
+            self.readers.put(conn)
+        with self.lock:
+            self.pending = {}
+            self.snapshots = snapshots
+        logger.info(f"Loaded snapshots of {len(snapshots)} terms")
+
+    @staticmethod
+    def _scope_ts(scopes, record):
+        """Latest scrape covering a section's subject and campus"""
+        times = [ts for subject, campus, ts in scopes
+                 if subject in ('', record['subj']) and campus in ('', record['cmp'])]
+        return max(times) if times else None
+
+    def refresh(self):
+        """
+        Reload the snapshots if another connection committed since the last load
+
+        For a standalone server, next to a tracker writing the database.
+
+        :return: True if reloaded
+        """
+        conn = self.readers.get()
+        try:
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            self.readers.put(conn)
+        if version == self.data_version:
+            return False
+        self.load()
+        return True
+
+    def observe(self, term, sections, scrape_time, subject='', campus=''):
+        """
+        DBWriter listener staging a written scrape for the next publish
+
+        Sections of the scrape's subject and campus it no longer returned are dropped.
+
+        :param term: Semester the sections belong to
+        :param sections: sections.Section records written
+        :param scrape_time: datetime of the scrape
+        :param subject: Subject searched for, '' for a scrape of every subject
+        :param campus: Campus searched for, '' for a scrape of every campus
+        """
+        ts = timestamp(scrape_time)
+        with self.lock:
+            staged = self.pending.get(term)
+            if staged is None:
+                current = self.snapshots.get(term)
+                staged = self.pending[term] = dict(current.records) if current is not None else {}
+            scraped = {sec.crn for sec in sections}
+            for crn in [crn for crn, record in staged.items() if crn not in scraped and
+                        subject in ('', record['subj']) and campus in ('', record['cmp'])]:
+                del staged[crn]
+            for sec in sections:
+                record = {name: getattr(sec, name) for name in INFO_COLUMNS}
+                record.update(zip(COUNT_COLUMNS, sec.counts))
+                record['ts'] = ts
+                staged[sec.crn] = record
+
+    def publish(self):
+        """Swap the staged scrapes in, readers see the new snapshots from their next request"""
+        with self.lock:
+            if not self.pending:
+                return
+            snapshots = dict(self.snapshots)
+            for term, records in self.pending.items():
+                snapshots[term] = Snapshot(term, records)
+            self.pending = {}
+            self.snapshots = snapshots
+
+    def history(self, term, crn, start):
+        """
+        :param start: First time of the history, datetime
+        :return: List of count dicts with their ts, oldest first
+        """
+        conn = self.readers.get()
+        try:
+            return [dict(zip(COUNT_COLUMNS, counts), ts=ts)
+                    for ts, counts in history(conn, term, crn, timestamp(start))]
+        finally:
+            self.readers.put(conn)
+
+    def close(self):
+        while not self.readers.empty():
+            self.readers.get().close()
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    """Routes GET requests to the snapshots of api"""
+    api = None
+    # Keep-alive, one thread serves every request of a client connection
+    protocol_version = "HTTP/1.1"
+    # Headers and body leave in one segment, handle_one_request flushes after each request.
+    # Written separately, Nagle's algorithm holds the body until the client's delayed ACK.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+        snapshots = self.api.snapshots
+        try:
+            if parts == ['terms']:
+                body = _json([{'term': term, 'ts': snapshots[term].ts, 'sections': len(snapshots[term].records)}
+                              for term in sorted(snapshots)])
+                etag = _etag(body)
+            else:
+                body, etag = self._sections(parts, query, snapshots)
+        except ValueError as e:
+            self._error(400, str(e))
+            return
+        except LookupError as e:
+            self._error(404, e.args[0])
+            return
+        if _matches(self.headers.get('If-None-Match', ''), etag):
+            self._send(304, b'', etag)
+        else:
+            self._send(200, body, etag)
+
+    def _sections(self, parts, query, snapshots):
+        """
+        :return: (body, etag) of a /sections request
+        :raise LookupError: With the message of a 404
+        """
+        if not parts or parts[0] != 'sections' or len(parts) > 3 or (len(parts) == 3 and parts[2] != 'history'):
+            raise LookupError("Not found")
+        term = query.get('term') or max(snapshots, default=None)
+        snapshot = snapshots.get(term)
+        if snapshot is None:
+            raise LookupError(f"Unknown term {term}")
+        if len(parts) == 1:
+            subject = query.get('subject', '').upper() or None
+            return snapshot.response(('sections', subject), lambda: snapshot.sections(subject))
+        crn = int(parts[1])
+        if crn not in snapshot.records:
+            raise LookupError(f"Unknown CRN {crn} in {term}")
+        if len(parts) == 2:
+            return snapshot.response(('section', crn), lambda: snapshot.records[crn])
+        hours = max(1, min(int(query.get('hours', 24)), MAX_HOURS))
+        # Unchanged until the next snapshot or window, so queried once per both
+        start = _window_start(hours)
+        return snapshot.response(('history', crn, hours, start), lambda: {
+            'term': term, 'crn': crn, 'hours': hours, 'history': self.api.history(term, crn, start)})
+
+    def _send(self, status, body, etag):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        body = _json({'error': message})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class APIServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(api, port=9110, background=True):
+    """
+    Start the API on localhost
+
+    :param api: LiveAPI served
+    :param port: Port to listen on, 0 picks a free one
+    :param background: Serve from a daemon thread and return immediately
+    :return: APIServer instance, the API is at http://127.0.0.1:<server_port>/
+    """
+    handler = type("LiveAPIHandler", (APIHandler,), {"api": api})
+    server = APIServer(("127.0.0.1", port), handler)
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default="OMSCS_CA.db")
+    parser.add_argument("--port", type=int, default=9110)
+    parser.add_argument("--refresh", type=float, default=30, help="Seconds between checks for new scrapes")
+    args = parser.parse_args()
+
+    live = LiveAPI(args.db)
+    live.load()
+    serve(live, args.port)
+    print(f"Serving on http://127.0.0.1:{args.port}/sections")
+    try:
+        while True:
+            time.sleep(args.refresh)
+            live.refresh()
+    except KeyboardInterrupt:
+        pass
+    live.close()
@@ -0,0 +1,211 @@
+"""
+Background logging pipeline
+
+Loggers set up through coursexp.logsetup hand their records to a bounded
+in-memory queue and return. One background thread per log file takes
+them off the queue, formats them as JSON lines and writes them. The file
+is rotated once it reaches a size or at midnight, and rotated files are
+gzip compressed, all on the same background thread. When the queue is
+full, eg while the disk stalls, records are dropped and counted rather
+than blocking the scrape.
+
+Messages are formatted by the background thread, so large payloads are
+passed as fields instead of being formatted into the message:
+
+logger.debug("Bad rows", extra=fields(rows=lambda: ue_rows))
+
+Callable fields are only called when the record is written, so nothing
+is built for a level that is disabled. Arguments given to a log call
+must not be changed afterwards, they are read later by the writer.
+Each line is one JSON object:
+
+{"ts": "2019-11-04 10:00:00.123", "level": "ERROR", "logger": "__main__.coursexp", "func": "dbadd",
+ "msg": "Bad row lengths found:2", "rows": [...]}
+"""
+import atexit
+import datetime
+import glob
+import gzip
+import json
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import logging
+
+import metrics
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+LOGFILE = 'OMSCS_CA.log'
+# Bytes after which the log file is rotated
+MAX_BYTES = 50 * 2**20
+# Rotated files kept
+BACKUPS = 14
+# Records waiting for the writer before new ones are dropped
+CAPACITY = 10000
+
+# Log file path -> QueuePipe writing it
+_pipes = {}
+_lock = threading.Lock()
+
+
+def fields(**values):
+    """
+    Structured fields of a record, for the extra argument of a log call
+
+    :param values: JSON values, or callables returning them when the record is written
+    :return: Dict for extra=
+    """
+    return {'fields': values}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with the record's fields and the formatted exception"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(" ", "milliseconds"),
+            'level': record.levelname,
+            'logger': record.name,
+            'func': record.funcName,
+            'msg': record.getMessage(),
+        }
+        for name, value in getattr(record, 'fields', {}).items():
+            try:
+                entry[name] = value() if callable(value) else value
+            except Exception as e:
+                entry[name] = f"<field failed: {e!r}>"
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class RotatingFile(logging.handlers.RotatingFileHandler):
+    """
+    File handler rotating by size and at midnight, keeping gzip compressed backups
+
+    Rotated files are named <file>.<YYYYmmdd-HHMMSS-ffffff>.gz, the oldest are
+    deleted beyond backups.
+
+    :param filename: Log file
+    :param max_bytes: Size the file is rotated at, 0 for no limit
+    :param backups: Compressed files kept
+    """
+
+    def __init__(self, filename, max_bytes=MAX_BYTES, backups=BACKUPS):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True)
+        self.rollover_at = self._next_midnight()
+
+    @staticmethod
+    def _next_midnight():
+        return datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=1), datetime.time())
+
+    def shouldRollover(self, record):
+        if datetime.datetime.now() >= self.rollover_at:
+            return 1
+        # The base class formats the record to measure it, a second time with its fields.
+        # Rotating once the file has reached max_bytes formats each record only when it is written.
+        if self.maxBytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            return int(self.stream.tell() >= self.maxBytes)
+        return 0
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.rollover_at = self._next_midnight()
+        if not os.path.exists(self.baseFilename) or os.path.getsize(self.baseFilename) == 0:
+            return
+        # Microseconds keep names unique and in order when rotating by size
+        rotated = f"{self.baseFilename}.{datetime.datetime.now():%Y%m%d-%H%M%S-%f}"
+        os.rename(self.baseFilename, rotated)
+        with open(rotated, 'rb') as source, gzip.open(rotated + ".gz", 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(rotated)
+        for old in sorted(glob.glob(glob.escape(self.baseFilename) + ".*.gz"))[:-self.backupCount or None]:
+            os.remove(old)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without formatting them, drops them if the queue is full"""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatted by the writer thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc('omscs_log_dropped_total')
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room, the queue may be full when stopping
+        self.queue.put(self._sentinel)
+
+
+class QueuePipe:
+    """
+    Queue, handler and writer thread of one log file
+
+    :param logfile: File records are written to
+    :param max_bytes: Size the file is rotated at
+    :param backups: Compressed files kept
+    :param capacity: Records queued before new ones are dropped
+    """
+
+    def __init__(self, logfile=LOGFILE, max_bytes=MAX_BYTES, backups=BACKUPS, capacity=CAPACITY):
+        self.file = RotatingFile(logfile, max_bytes, backups)
+        self.file.setFormatter(JSONFormatter())
+        self.handler = QueueHandler(queue.Queue(capacity))
+        self.listener = _Listener(self.handler.queue, self.file)
+        self.listener.start()
+
+    def stop(self):
+        """Write the records still queued and close the file"""
+        self.listener.stop()
+        self.file.close()
+
+
+def attach(ilogger, logfile=LOGFILE, **options):
+    """
+    Send a logger's records through the pipe of a log file, started on first use
+
+    :param ilogger: Logging object
+    :param logfile: File the records are written to
+    :param options: Passed to QueuePipe when the pipe is started, eg max_bytes
+    :return: ilogger
+    """
+    path = os.path.abspath(logfile)
+    with _lock:
+        pipe = _pipes.get(path)
+        if pipe is None:
+            pipe = _pipes[path] = QueuePipe(path, **options)
+    if pipe.handler not in ilogger.handlers:
+        ilogger.addHandler(pipe.handler)
+    return ilogger
+
+
+@atexit.register
+def stop_all():
+    """Flush and stop every pipe, registered to run at exit"""
+    with _lock:
+        pipes = list(_pipes.values())
+        _pipes.clear()
+    for pipe in pipes:
+        pipe.stop()
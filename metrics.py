@@ -0,0 +1,269 @@
+"""
+Scrape pipeline metrics
+
+Per stage durations and counters for the scrape pipeline, kept in one
+process wide registry. They can be read three ways:
+- Prometheus text format from a local http endpoint, serve()
+- one row per sample in the sqlite metrics table, store()
+- render() for the same text anywhere else
+
+Stages are timed by decorating the function doing the work:
+
+@timed('gotosem')
+def gotosem(...)
+
+Exported metrics:
+omscs_stage_seconds{stage}          summary of stage durations
+omscs_stage_last_seconds{stage}     duration of the latest run of a stage
+omscs_stage_failures_total{stage}   stage runs ending in an exception
+omscs_rows_scraped_total            sections read from results pages
+omscs_rows_written_total            enrollment rows written to the database
+omscs_retries_total{engine}         scrapes retried after an expired session
+omscs_screenshots_total{page}       screenshots saved on navigation errors
+omscs_browser_rss_bytes             resident memory of the browsers, children included
+omscs_browser_recycles_total{reason} browsers replaced by browsers.ManagedBrowser
+omscs_compacted_rows_total          enrollment rows dropped by compact.py
+omscs_log_dropped_total             log records dropped by logpipe while its queue was full
+"""
+from contextlib import contextmanager
+from functools import wraps
+import json
+import os
+import threading
+import time
+import logging
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+METRIC_TYPES = {
+    'omscs_stage_seconds': ('summary', "Time spent in each scrape pipeline stage"),
+    'omscs_stage_last_seconds': ('gauge', "Duration of the latest run of each stage"),
+    'omscs_stage_failures_total': ('counter', "Stage runs ending in an exception"),
+    'omscs_rows_scraped_total': ('counter', "Sections read from results pages"),
+    'omscs_rows_written_total': ('counter', "Enrollment rows written to the database"),
+    'omscs_retries_total': ('counter', "Scrapes retried after an expired session"),
+    'omscs_screenshots_total': ('counter', "Screenshots saved on navigation errors"),
+    'omscs_browser_rss_bytes': ('gauge', "Resident memory of the browsers, children included"),
+    'omscs_browser_recycles_total': ('counter', "Browsers replaced after too many runs, errors or too much memory"),
+    'omscs_compacted_rows_total': ('counter', "Unchanged enrollment rows dropped by compaction"),
+    'omscs_log_dropped_total': ('counter', "Log records dropped while the log queue was full"),
+}
+
+METRICS_SCHEMA = """CREATE TABLE IF NOT EXISTS metrics(
+    ts TEXT NOT NULL,
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (ts, name, labels)
+) WITHOUT ROWID"""
+
+
+class Registry:
+    """Thread safe store of metric samples, keyed by name and sorted labels"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, ((label, value), ...)) -> value
+        self.values = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter"""
+        key = self._key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge"""
+        with self.lock:
+            self.values[self._key(name, labels)] = value
+
+    def observe(self, stage, seconds, failed=False):
+        """Record one run of a stage"""
+        labels = (('stage', stage),)
+        with self.lock:
+            for name, value in (('omscs_stage_seconds_count', 1), ('omscs_stage_seconds_sum', seconds)):
+                self.values[(name, labels)] = self.values.get((name, labels), 0) + value
+            self.values[('omscs_stage_last_seconds', labels)] = seconds
+            if failed:
+                key = ('omscs_stage_failures_total', labels)
+                self.values[key] = self.values.get(key, 0) + 1
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as a run of stage name"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(name, time.perf_counter() - start, failed=True)
+            raise
+        self.observe(name, time.perf_counter() - start)
+
+    def samples(self):
+        """
+        :return: Sorted list of (name, labels dict, value)
+        """
+        with self.lock:
+            items = sorted(self.values.items())
+        return [(name, dict(labels), value) for (name, labels), value in items]
+
+    def render(self):
+        """
+        :return: Every sample in Prometheus text exposition format
+        """
+        lines = []
+        typed = set()
+        for name, labels, value in self.samples():
+            family = name[:-len('_count')] if name.endswith('_count') else name
+            family = family[:-len('_sum')] if family.endswith('_sum') else family
+            if family in METRIC_TYPES and family not in typed:
+                kind, description = METRIC_TYPES[family]
+                lines += [f"# HELP {family} {description}", f"# TYPE {family} {kind}"]
+                typed.add(family)
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in sorted(labels.items()))
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = Registry()
+
+
+def timed(stage):
+    """
+    Decorator recording each call of the function as a run of stage
+
+    :param stage: Stage name used as the stage label
+    """
+    def decorator(fction):
+        @wraps(fction)
+        def wrapper(*args, **kwargs):
+            with REGISTRY.stage(stage):
+                return fction(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def inc(name, value=1, **labels):
+    """Add to a counter of the process wide registry"""
+    REGISTRY.inc(name, value, **labels)
+
+
+def process_tree_rss(pid):
+    """
+    Resident memory of a process and all its descendants
+
+    Linux only, reads /proc.
+
+    :param pid: Root process id, eg the geckodriver started by selenium
+    :return: Bytes, None if /proc is unavailable
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    rss = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/status') as fh:
+                status = dict(line.split(':', 1) for line in fh if ':' in line)
+        except OSError:
+            # Exited while listing
+            continue
+        children.setdefault(int(status['PPid']), []).append(int(entry))
+        # Kernel threads have no VmRSS
+        rss[int(entry)] = int(status.get('VmRSS', '0 kB').split()[0]) * 1024
+    total = 0
+    todo = [pid]
+    while todo:
+        current = todo.pop()
+        total += rss.get(current, 0)
+        todo += children.get(current, [])
+    return total
+
+
+def record_browser_rss(engines, registry=REGISTRY):
+    """
+    Set omscs_browser_rss_bytes from the browsers of selenium engines
+
+    :param engines: ScrapeEngines, those without a running browser are skipped
+    """
+    total = 0
+    for engine in engines:
+        managed = getattr(engine, 'managed', None)
+        # Asking a managed engine for its browser would start one
+        browser = managed.current if managed is not None else getattr(engine, 'browser', None)
+        service = getattr(browser, 'service', None)
+        process = getattr(service, 'process', None)
+        if process is not None:
+            total += process_tree_rss(process.pid) or 0
+    registry.set('omscs_browser_rss_bytes', total)
+
+
+def store(conn, ts, registry=REGISTRY):
+    """
+    Write every current sample to the metrics table in one transaction
+
+    :param conn: sqlite3 connection in autocommit mode, as DBWriter's
+    :param ts: Timestamp text the samples are stored under
+    """
+    conn.execute(METRICS_SCHEMA)
+    rows = [(ts, name, json.dumps(labels, sort_keys=True), value) for name, labels, value in registry.samples()]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?)", rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _handler(registry):
+    """Request handler class serving registry on /metrics"""
+    # http.server is most of this module's import time, only pay it when serving
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return MetricsHandler
+
+
+def serve(port=9108, registry=REGISTRY, background=True):
+    """
+    Start the metrics endpoint on localhost
+
+    :param port: Port to listen on, 0 picks a free one
+    :param registry: Registry served
+    :param background: Serve from a daemon thread and return immediately
+    :return: HTTPServer instance, metrics are at http://127.0.0.1:<server_port>/metrics
+    """
+    from http.server import HTTPServer
+    server = HTTPServer(("127.0.0.1", port), _handler(registry))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
@@ -0,0 +1,88 @@
+"""
+Migrate legacy per course tables to the long enrollment layout
+
+Imports every <prefix>_<CRN> enrollment table and the latest row per CRN
+of courses<prefix> into the enrollment and sections tables used by
+DBWriter. Rows already present are skipped, so rerunning is harmless.
+
+Usage:
+python migrate.py --term 201902 [--db OMSCS_CA.db] [--drop]
+"""
+import argparse
+import logging
+import re
+
+from dbwriter import connect, create_schema, term_prefix, SECTION_COLUMNS
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+
+def migrate_legacy(dbname='OMSCS_CA.db', term=None, drop=False):
+    """
+    Copy legacy tables for a term into the long layout
+
+    Runs as a single transaction, either everything is imported or nothing.
+
+    :param dbname: Name of the database
+    :param term: Semester option value the legacy tables belong to, required
+    :param drop: Drop the legacy tables once imported
+    :return: (sections imported, enrollment rows imported)
+    :raise ValueError: No term given
+    """
+    if not term:
+        raise ValueError("migrate_legacy needs the term of the legacy tables")
+    prefix = term_prefix(term)
+    course_tbl = f"courses{prefix}"
+    table_re = re.compile(rf"^{prefix}_(\d+)$")
+    conn = connect(dbname)
+    create_schema(conn)
+    tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    enroll_tables = [(name, int(table_re.match(name).group(1))) for name in tables if table_re.match(name)]
+
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        sections = 0
+        if course_tbl in tables:
+            # Legacy appends a row whenever a section changes, the last one is current
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO sections ({', '.join(SECTION_COLUMNS)})
+                SELECT ?, CAST(CRN AS INTEGER), Subj, Crse, Sec, Cmp, Bas, Cred, Title,
+                       Days, Time, Instructor, Location, Attribute
+                FROM {course_tbl}
+                WHERE rowid IN (SELECT max(rowid) FROM {course_tbl} GROUP BY CRN)""", (term,))
+            sections = cursor.rowcount
+        enrollment = 0
+        for name, crn in enroll_tables:
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO enrollment
+                SELECT ?, ?, Timestamp, CAST(Cap AS INTEGER), CAST(Act AS INTEGER), CAST(Rem AS INTEGER),
+                       CAST(WL_Cap AS INTEGER), CAST(WL_Act AS INTEGER), CAST(WL_Rem AS INTEGER)
+                FROM {name}""", (term, crn))
+            enrollment += cursor.rowcount
+        if drop:
+            for name, _ in enroll_tables:
+                cursor.execute(f"DROP TABLE {name}")
+            if course_tbl in tables:
+                cursor.execute(f"DROP TABLE {course_tbl}")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    logger.info(f"Migrated {sections} sections and {enrollment} enrollment rows "
+                f"from {len(enroll_tables)} {prefix} tables")
+    return sections, enrollment
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import legacy per course tables into the long layout")
+    parser.add_argument("--db", default="OMSCS_CA.db", help="Database file")
+    parser.add_argument("--term", required=True, help="Term code of the legacy tables")
+    parser.add_argument("--drop", action="store_true", help="Drop legacy tables after import")
+    args = parser.parse_args()
+    n_sections, n_rows = migrate_legacy(args.db, args.term, args.drop)
+    print(f"Imported {n_sections} sections and {n_rows} enrollment rows")
@@ -0,0 +1,206 @@
+"""
+Declarative navigation steps
+
+The buzzport and OSCAR navigation is written as tables of steps. Each
+step waits for an explicit condition, with its own timeout, then acts on
+what it waited for:
+
+Step('term_submit', 'clickable', (By.XPATH, "//input[@value='Submit']"), click)
+
+No implicit wait is set on the browser, so a check for an element that
+is not there returns at once instead of blocking for the implicit
+timeout, and a step only takes as long as its page. Each step is timed
+as the metrics stage nav_<name>, which shows which OSCAR page is slow.
+
+Locators are formatted with the keyword arguments of run_steps, eg
+"//option[@value='{semester}']".
+
+With OMSCS_SITE set, eg OMSCS_SITE=http://127.0.0.1:8100, buzzport and
+OSCAR urls point at that site instead, such as the oscarsim simulator.
+"""
+from collections import namedtuple
+from urllib.parse import urlsplit
+import datetime
+import os
+import logging
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as expected
+from selenium.webdriver.support.ui import Select, WebDriverWait
+
+import metrics
+from sections import NO_CLASSES
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+# Scheme and host replacing those of every GT url, None for the real servers
+SITE = os.environ.get('OMSCS_SITE')
+
+
+def site_url(url):
+    """url on OMSCS_SITE when it is set, eg https://oscar.gatech.edu/pls/bprod/ -> http://127.0.0.1:8100/pls/bprod/"""
+    if not SITE:
+        return url
+    parts = urlsplit(url)
+    return SITE.rstrip('/') + parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+BUZZPORT_LOGIN = site_url("https://buzzport.gatech.edu/cp/home/displaylogin")
+# Lands on BuzzPort when logged in, on the CAS login page otherwise
+BUZZPORT_HOME = site_url("https://buzzport.gatech.edu/cps/welcome/loginok.html")
+# Seconds a step waits by default
+TIMEOUT = 15
+# Seconds between checks of a condition, WebDriverWait's 0.5 would add up over a dozen steps
+POLL = 0.1
+
+Step = namedtuple('Step', ('name', 'wait', 'locator', 'action', 'timeout'))
+Step.__new__.__defaults__ = (None, None, None, TIMEOUT)
+
+# Step.wait -> expected condition factory taking the formatted locator
+CONDITIONS = {
+    'present': expected.presence_of_element_located,
+    'visible': expected.visibility_of_element_located,
+    'clickable': expected.element_to_be_clickable,
+    'frame': expected.frame_to_be_available_and_switch_to_it,
+    'title': expected.title_is,
+}
+
+
+def click(browser, element, params):
+    element.click()
+
+
+def select_campus(browser, element, params):
+    select = Select(element)
+    select.deselect_all()  # If this isn't done, multiple items are selected
+    select.select_by_value(params['campus'])  # Select only this campus
+
+
+def load(url):
+    """Action opening url, for steps without a wait"""
+    return lambda browser, element, params: browser.get(url)
+
+
+def type_text(param):
+    """Action typing a run_steps keyword argument into the element"""
+    def action(browser, element, params):
+        element.clear()
+        element.send_keys(params[param])
+    return action
+
+
+LOGIN_PAGE = (
+    Step('buzzport_login', action=load(BUZZPORT_LOGIN)),
+    Step('login_button', 'clickable', (By.ID, "login_btn"), click, 30),
+)
+
+CREDENTIALS = (
+    Step('username', 'visible', (By.ID, "username"), type_text('userid')),
+    Step('password', 'visible', (By.ID, "password"), type_text('pwd')),
+    Step('login_submit', 'clickable', (By.NAME, "submit"), click),
+)
+
+# Ensures remember me for 7 days is selected when the push gets sent
+DUO_PUSH = (
+    Step('duo_frame', 'frame', (By.ID, "duo_iframe"), timeout=10),
+    Step('duo_remember', 'clickable', (By.NAME, "dampen_choice"), click, 10),
+    Step('duo_push', 'clickable', (By.XPATH, ".//button[contains(text(), 'Send Me a Push')]"), click, 10),
+)
+
+# Long timeout as this waits for the Duo push to be approved
+DUO_APPROVED = (
+    Step('duo_approved', 'title', "BuzzPort", timeout=120),
+)
+
+LOOKUP_CLASSES = (
+    Step('buzzport_home', action=load(BUZZPORT_HOME)),
+    Step('oscar_link', 'clickable', (By.XPATH, ".//a[contains(text(), 'Registration - OSCAR')]"), click, 30),
+    # Since the iframe is a separate HTML document embedded in the current
+    # one, it is very important to switch to the relevant iframe
+    Step('oscar_frame', 'frame', "the_iframe"),
+    Step('student_menu', 'clickable', (By.NAME, "StuWeb-MainMenuLink"), click),
+    Step('registration_menu', 'clickable', (By.XPATH, ".//a[contains(text(), 'Registration')]"), click),
+    Step('lookup_classes', 'clickable', (By.XPATH, ".//a[contains(text(), 'Look Up Classes')]"), click),
+    Step('term_select', 'present', (By.XPATH, "//select[@name='p_term' or @name='term_in']")),
+)
+
+# Select 'semester' -> Advanced View -> 'subject' -> 'campus' courses, from the Look Up Classes page
+SEARCH = (
+    Step('term_option', 'clickable', (By.XPATH, "//option[@value='{semester}']"), click),
+    Step('term_submit', 'clickable', (By.XPATH, "//input[@value='Submit']"), click),
+    Step('advanced_search', 'clickable', (By.XPATH, "(//input[@name='SUB_BTN'])[2]"), click),
+    # Only the advanced search form has a campus select, the basic one lists subjects too
+    Step('campus_select', 'present', (By.ID, "camp_id"), select_campus),
+    Step('subject_option', 'clickable', (By.XPATH, "//select[@name='sel_subj']/option[@value='{subject}']"), click),
+    Step('search_submit', 'clickable', (By.NAME, "SUB_BTN"), click),
+    Step('results', 'present', (By.XPATH, "//table[@class='datadisplaytable'] | "
+                                          f"//*[contains(text(), '{NO_CLASSES}')]"), timeout=60),
+)
+
+
+def _format(locator, params):
+    if isinstance(locator, tuple):
+        return locator[0], locator[1].format(**params)
+    return locator.format(**params) if isinstance(locator, str) else locator
+
+
+def run_steps(browser, steps, page='oscar', **params):
+    """
+    Run navigation steps in order
+
+    When a step fails, eg with a TimeoutException naming it, a screenshot
+    is saved to ./screenshots and the exception raised again.
+
+    :param browser: Selenium webdriver object
+    :param steps: Sequence of Step
+    :param page: Screenshot name and omscs_screenshots_total label on failure
+    :param params: Values formatted into the locators and given to actions
+    :return: What the last step waited for
+    """
+    found = None
+    for step in steps:
+        with metrics.REGISTRY.stage(f"nav_{step.name}"):
+            try:
+                found = None
+                if step.wait is not None:
+                    condition = CONDITIONS[step.wait](_format(step.locator, params))
+                    found = WebDriverWait(browser, step.timeout, POLL).until(
+                        condition, f"Step {step.name} waited {step.timeout}s for {step.wait} {step.locator}")
+                if step.action is not None:
+                    step.action(browser, found, params)
+            except Exception as e:
+                logger.critical(f"{page} navigation failed at step {step.name}. Exception: {e}")
+                screenshot(browser, page)
+                raise
+    return found
+
+
+def wait_any(browser, conditions, timeout=TIMEOUT):
+    """
+    Wait until the first of several conditions holds
+
+    :param conditions: Dict of name -> expected condition
+    :return: Name of the condition met
+    """
+    def met(driver):
+        for name, condition in conditions.items():
+            try:
+                if condition(driver):
+                    return name
+            except Exception:
+                # eg a stale element while the page changes
+                continue
+        return False
+    return WebDriverWait(browser, timeout, POLL).until(met, f"None of {sorted(conditions)} within {timeout}s")
+
+
+def screenshot(browser, page):
+    # If screenshot directory is missing, the screenshot is silently not saved
+    timestamp = str(datetime.datetime.now())
+    try:
+        browser.save_screenshot(f'./screenshots/{page}_attempt_{timestamp}.png')
+    except Exception as e:
+        logger.warning(f"Screenshot failed: {e!r}")
+    metrics.inc('omscs_screenshots_total', page=page)
@@ -0,0 +1,255 @@
+"""
+Background email notifications
+
+The scrape path only puts messages on a queue. One worker thread sends
+them over a single SMTP connection that is kept open and reused, and
+reconnects with exponential backoff when the server drops it or fails.
+
+The first message with a given subject is sent right away. Further
+messages with the same subject inside the digest window are held back
+and sent together as one digest when the window ends, so a burst of
+identical errors costs two emails instead of one per error.
+
+Settings are read once from the environment / .env:
+EMAIL_USER, EMAIL_PWD, TO_EMAIL, FROM_EMAIL as before, plus optional
+SMTP_HOST (smtp.gmail.com), SMTP_PORT (465) and SMTP_SSL (1).
+smtpstub.py can stand in for the server.
+"""
+from collections import namedtuple
+from email.message import EmailMessage
+from dotenv import load_dotenv
+import atexit
+import datetime
+import os
+import queue
+import smtplib
+import threading
+import time
+import logging
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+SmtpConfig = namedtuple('SmtpConfig', ('host', 'port', 'use_ssl', 'user', 'password', 'from_email', 'to_email'))
+
+# Bodies included in full in one digest, later ones are only counted
+DIGEST_BODIES = 20
+_STOP = object()
+
+
+def load_config(dotenv_path="./.env"):
+    """
+    SMTP settings from the environment
+
+    :param dotenv_path: .env file loaded first
+    :return: SmtpConfig
+    """
+    load_dotenv(dotenv_path=dotenv_path)
+    return SmtpConfig(host=os.environ.get('SMTP_HOST', 'smtp.gmail.com'),
+                      port=int(os.environ.get('SMTP_PORT', 465)),
+                      use_ssl=os.environ.get('SMTP_SSL', '1') not in ('0', 'false', 'False'),
+                      user=os.environ.get('EMAIL_USER'),
+                      password=os.environ.get('EMAIL_PWD'),
+                      from_email=os.environ.get('FROM_EMAIL'),
+                      to_email=os.environ.get('TO_EMAIL'))
+
+
+class Notifier:
+    """
+    Queue of email notifications sent from a worker thread
+
+    :param config: SmtpConfig, load_config() if None
+    :param window: Seconds repeats of a subject are collected into one digest
+    :param retries: Delivery attempts per email before it is dropped
+    :param backoff: Seconds before the first retry, doubled on each following one
+    :param max_backoff: Longest wait between retries
+    :param max_queued: Emails waiting beyond this are dropped, so callers never block
+    """
+
+    def __init__(self, config=None, window=300, retries=5, backoff=2, max_backoff=300, max_queued=1000):
+        self.config = config if config is not None else load_config()
+        self.window = window
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue = queue.Queue(maxsize=max_queued)
+        # Guards the worker thread and stats, which notify updates from the callers' threads
+        self.lock = threading.Lock()
+        self.thread = None
+        self.smtp = None
+        # (subject, recipient) -> monotonic time its current digest window opened
+        self.window_start = {}
+        # (subject, recipient) -> [(wall clock time, body), ...] held for the digest
+        self.held = {}
+        self.stats = {'queued': 0, 'sent': 0, 'collapsed': 0, 'failed': 0, 'dropped': 0, 'connections': 0}
+
+    def start(self):
+        """Start the worker thread if not running"""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+                self.thread.start()
+
+    def notify(self, subject, body, to=None):
+        """
+        Queue an email, returns immediately
+
+        :param subject: Email subject, repeats to the same recipient within
+                        the window are collapsed into a digest
+        :param body: Email body
+        :param to: Recipient address, TO_EMAIL if None
+        """
+        self.start()
+        try:
+            self.queue.put_nowait(((subject, to or self.config.to_email), body, datetime.datetime.now()))
+            self._count('queued')
+        except queue.Full:
+            self._count('dropped')
+            logger.error(f"Notification queue full, dropped: {subject}")
+
+    def close(self, timeout=30):
+        """
+        Send held digests, close the connection and stop the worker
+
+        :param timeout: Seconds to wait for queued emails to go out
+        """
+        if self.thread is None or not self.thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            # A full queue behind an unreachable server would otherwise hold up the exit
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error(f"Notification queue still full after {timeout} s, {self.queue.qsize()} emails not sent")
+            return
+        self.thread.join(max(deadline - time.monotonic(), 0))
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self._next_digest())
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._send_digests(force=True)
+                self._disconnect()
+                return
+            if item is not None:
+                self._handle(*item)
+            self._send_digests()
+
+    def _next_digest(self):
+        """Seconds until the earliest held digest is due, None if nothing is held"""
+        if not self.held:
+            return None
+        due = min(self.window_start[key] + self.window for key in self.held)
+        return max(due - time.monotonic(), 0)
+
+    def _handle(self, key, body, when):
+        now = time.monotonic()
+        start = self.window_start.get(key)
+        if start is not None and now - start < self.window:
+            self.held.setdefault(key, []).append((when, body))
+            self._count('collapsed')
+            return
+        self.window_start[key] = now
+        self._deliver(key[0], body, key[1])
+
+    def _send_digests(self, force=False):
+        now = time.monotonic()
+        for key in list(self.held):
+            if force or now - self.window_start[key] >= self.window:
+                subject, to = key
+                self._deliver(f"{subject} ({len(self.held[key])} more)", digest_body(self.held.pop(key)), to)
+                self.window_start[key] = now
+        # Subjects with nothing held start a fresh window on their next message
+        for key in [k for k, start in self.window_start.items() if k not in self.held and
+                    now - start >= self.window]:
+            del self.window_start[key]
+
+    def _connect(self):
+        config = self.config
+        smtp_class = smtplib.SMTP_SSL if config.use_ssl else smtplib.SMTP
+        smtp = smtp_class(config.host, config.port, timeout=30)
+        if config.user:
+            smtp.login(config.user, config.password)
+        self._count('connections')
+        logger.debug(f"Connected to {config.host}:{config.port}")
+        return smtp
+
+    def _connection(self):
+        """The open connection if the server still answers, a new one otherwise"""
+        if self.smtp is not None:
+            try:
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._disconnect()
+        self.smtp = self._connect()
+        return self.smtp
+
+    def _disconnect(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.smtp = None
+
+    def _deliver(self, subject, body, to):
+        message = EmailMessage()
+        message['From'] = self.config.from_email
+        message['To'] = to
+        message['Subject'] = subject
+        message.set_content(body)
+        delay = self.backoff
+        for attempt in range(1, self.retries + 1):
+            try:
+                self._connection().send_message(message)
+                self._count('sent')
+                logger.debug(f"Sent notification: {subject}")
+                return True
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning(f"Notification attempt {attempt} of {self.retries} failed: {e!r}")
+                self._disconnect()
+                if attempt < self.retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_backoff)
+        self._count('failed')
+        logger.error(f"Giving up on notification: {subject}")
+        return False
+
+
+def digest_body(held):
+    """
+    :param held: List of (datetime, body) of collapsed messages
+    :return: Body listing each message with its time
+    """
+    parts = [f"{len(held)} further occurrences between {held[0][0]:%Y-%m-%d %H:%M:%S} "
+             f"and {held[-1][0]:%Y-%m-%d %H:%M:%S}"]
+    for when, body in held[:DIGEST_BODIES]:
+        parts.append(f"--- {when:%Y-%m-%d %H:%M:%S}\n{body}")
+    if len(held) > DIGEST_BODIES:
+        parts.append(f"--- {len(held) - DIGEST_BODIES} more not shown")
+    return "\n\n".join(parts)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_notifier():
+    """Process wide Notifier, created on first use and flushed at exit"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Notifier()
+            atexit.register(_default.close)
+        return _default
@@ -0,0 +1,233 @@
+"""
+OMSCS course availability command line
+
+One entry point for tracking, registration and the stored enrollment.
+Each command imports what it needs only once it runs, so query and
+export never load selenium, lxml, dotenv or smtplib, and query starts
+about as fast as python itself.
+
+Usage:
+python omscs.py track [--semester 202008 | --target 202008:CS:O ...] [--engine http] [--adaptive]
+python omscs.py regpage [--semester 202008]
+python omscs.py discover-terms [--engine http] [--no-email]
+python omscs.py query {terms,snapshot,history,changes} [--term 201902] [--crn 20000]
+python omscs.py export [--out export] [--term 201902 ...]
+"""
+import argparse
+import os
+import sys
+import logging
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+DBNAME = "OMSCS_CA.db"
+
+
+def _log_to_file():
+    # Library modules log to children of __main__
+    from coursexp import logsetup
+    logsetup(logging.getLogger('__main__'))
+
+
+def _latest_term(command, dbname=DBNAME):
+    """Newest term termwatch has recorded, for commands given no semester"""
+    from dbwriter import connect
+    from termwatch import latest_term
+    term = None
+    if os.path.exists(dbname):
+        db = connect(dbname, readonly=True)
+        try:
+            term = latest_term(db)
+        finally:
+            db.close()
+    if term is None:
+        raise SystemExit(f"omscs {command}: no --semester given and no terms recorded in {dbname}, "
+                         f"run omscs discover-terms first")
+    return term
+
+
+def track(args):
+    """Scrape the targets on a schedule, see etracker.coordinator"""
+    _log_to_file()
+    import etracker
+    from scrapepool import parse_target
+    options = {}
+    if args.target:
+        try:
+            options['targets'] = [parse_target(text) for text in args.target]
+        except ValueError as e:
+            raise SystemExit(f"omscs track: {e}")
+    elif args.semester is None:
+        args.semester = _latest_term("track")
+        logger.info(f"Tracking the latest recorded term {args.semester}")
+    if args.adaptive or args.phases:
+        from pollpolicy import AdaptivePolicy, load_phases
+        options['policy'] = AdaptivePolicy(phases=load_phases(args.phases) if args.phases else ())
+    # Options left out keep coordinator's defaults, 0 or empty turns a feature off
+    for name in ('semester', 'engine', 'store', 'max_workers', 'min_interval', 'headless'):
+        if getattr(args, name) is not None:
+            options[name] = getattr(args, name)
+    for name in ('metrics_port', 'api_port', 'discovery_minutes', 'archive', 'keep_days'):
+        if getattr(args, name) is not None:
+            options[name] = getattr(args, name) or None
+    if args.no_alerts:
+        options['alerts'] = False
+    if args.no_rollups:
+        options['rollups'] = False
+    etracker.coordinator(**options)
+
+
+def regpage(args):
+    """Login and open the semester's search results in a visible browser"""
+    _log_to_file()
+    from regpage import open_registration
+    open_registration(args.semester or _latest_term("regpage"), args.subject, args.campus, headless=args.headless)
+
+
+def discover_terms(args):
+    """Poll OSCAR's term list once and print the known terms"""
+    _log_to_file()
+    from dbwriter import connect
+    from engines import make_engine, terms_with_retry
+    from termwatch import TermWatcher, known_terms
+    engine = make_engine(args.engine)
+    db = connect(args.db)
+    try:
+        result = TermWatcher(db, lambda: terms_with_retry(engine), notify=not args.no_email).poll()
+    finally:
+        engine.close()
+    for value, text, first_seen in known_terms(db):
+        print(f"{value} {text:<40} first seen {first_seen[:19]}{' NEW' if (value, text) in result.new else ''}")
+    db.close()
+
+
+def query(args):
+    """Print stored enrollment as tab separated lines"""
+    from dbwriter import connect
+    import enrollhist
+    if not os.path.exists(args.db):
+        raise SystemExit(f"omscs query: no database {args.db}")
+    db = connect(args.db, readonly=True)
+    try:
+        stored = enrollhist.terms(db)
+        if args.what == "terms":
+            print("\n".join(stored))
+            return
+        term = args.term or (stored[-1] if stored else None)
+        if term is None:
+            raise SystemExit(f"omscs query: no enrollment stored in {args.db}")
+        if args.what == "snapshot":
+            ts, snapshot = enrollhist.snapshot_at(db, term, args.at or "9999")
+            print(f"# {term} as of {ts}")
+            print("\t".join(("crn",) + enrollhist.COUNT_COLUMNS))
+            for crn in sorted(snapshot):
+                print("\t".join(str(value) for value in (crn,) + tuple(snapshot[crn])))
+        elif args.what == "history":
+            print("\t".join(("ts",) + enrollhist.COUNT_COLUMNS))
+            for ts, counts in enrollhist.history(db, term, args.crn, args.start, args.end):
+                print("\t".join(str(value) for value in (ts,) + tuple(counts)))
+        elif args.what == "changes":
+            print("previous\tts\tchanged")
+            for previous, ts, changed in enrollhist.change_counts(db, term, args.start, args.end, args.subject,
+                                                                  args.campus):
+                print(f"{previous}\t{ts}\t{changed}")
+    finally:
+        db.close()
+
+
+def export(args):
+    """Append new enrollment to the column files, see colexport"""
+    from dbwriter import connect
+    from colexport import export_term
+    from enrollhist import terms
+    if not os.path.exists(args.db):
+        raise SystemExit(f"omscs export: no database {args.db}")
+    db = connect(args.db, readonly=True)
+    try:
+        for term in args.term or terms(db):
+            print(f"{term}: {export_term(db, term, args.out)} rows appended")
+    finally:
+        db.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="omscs", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+
+    track_parser = commands.add_parser("track", help="Record enrollment over time")
+    track_parser.add_argument("--semester", help="Semester tracked when no targets are given, "
+                                                 "the latest term discover-terms recorded by default")
+    track_parser.add_argument("--target", action="append", help="term[:subject[:campus]], may be repeated")
+    track_parser.add_argument("--engine", choices=("selenium", "http"))
+    track_parser.add_argument("--store", choices=("full", "changes"))
+    track_parser.add_argument("--max-workers", type=int)
+    track_parser.add_argument("--min-interval", type=float, help="Seconds between scrapes of a target")
+    track_parser.add_argument("--adaptive", action="store_true", help="Set each target's interval from its changes")
+    track_parser.add_argument("--phases", help="Registration phase calendar of pollpolicy, implies --adaptive")
+    track_parser.add_argument("--metrics-port", type=int, help="0 to disable")
+    track_parser.add_argument("--api-port", type=int, help="0 to disable")
+    track_parser.add_argument("--discovery-minutes", type=float, help="0 to disable")
+    track_parser.add_argument("--archive", help="Page archive database, empty to keep no pages")
+    track_parser.add_argument("--keep-days", type=float, help="Days kept at full resolution, 0 to never compact")
+    track_parser.add_argument("--no-alerts", action="store_true")
+    track_parser.add_argument("--no-rollups", action="store_true")
+    track_parser.add_argument("--headless", action="store_true", default=None, help="Hide the browsers, the default")
+    track_parser.add_argument("--no-headless", action="store_false", dest="headless", help="Show the browsers")
+
+    reg_parser = commands.add_parser("regpage", help="Open the registration page of a semester")
+    reg_parser.add_argument("--semester", help="The latest term discover-terms recorded by default")
+    reg_parser.add_argument("--subject", default="CS")
+    reg_parser.add_argument("--campus", default="O")
+    reg_parser.add_argument("--headless", action="store_true")
+
+    terms_parser = commands.add_parser("discover-terms", help="Check OSCAR's term list for new terms")
+    terms_parser.add_argument("--db", default=DBNAME)
+    terms_parser.add_argument("--engine", choices=("selenium", "http"), default="http")
+    terms_parser.add_argument("--no-email", action="store_true")
+
+    query_parser = commands.add_parser("query", help="Print stored enrollment, read only")
+    query_parser.add_argument("what", choices=("terms", "snapshot", "history", "changes"))
+    query_parser.add_argument("--db", default=DBNAME)
+    query_parser.add_argument("--term", help="Latest stored term by default")
+    query_parser.add_argument("--crn", type=int, help="Section of history")
+    query_parser.add_argument("--at", help="Time of snapshot, eg '2019-01-10 12:00', latest by default")
+    query_parser.add_argument("--start", help="First time of history and changes")
+    query_parser.add_argument("--end", help="Last time of history and changes")
+    query_parser.add_argument("--subject", help="Only this subject's changes")
+    query_parser.add_argument("--campus", help="Only this campus' changes")
+
+    export_parser = commands.add_parser("export", help="Export enrollment to column files")
+    export_parser.add_argument("--db", default=DBNAME)
+    export_parser.add_argument("--out", default="export")
+    export_parser.add_argument("--term", nargs="+", help="Terms to export, every stored term by default")
+    return parser
+
+
+def main(argv=None):
+    """
+    Run a command
+
+    :param argv: Arguments after the program name, sys.argv[1:] by default
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "track":
+        track(args)
+    elif args.command == "regpage":
+        regpage(args)
+    elif args.command == "discover-terms":
+        discover_terms(args)
+    elif args.command == "query":
+        if args.what == "history" and args.crn is None:
+            parser.error("query history needs --crn")
+        query(args)
+    elif args.command == "export":
+        export(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,500 @@
+"""
+OSCAR simulator
+
+Local stand-in for the buzzport and OSCAR pages the scraper goes
+through, for load and soak tests without GT servers:
+
+/cp/home/displaylogin            buzzport login button
+/cas/login                       CAS username and password form
+/duo                             Duo step, an iframe with the remember me box and the push button
+/cps/welcome/loginok.html        BuzzPort, with the Registration - OSCAR link
+/oscar                           the_iframe holding OSCAR
+/pls/bprod/twbkwbis.P_GenMenu    student and registration menus
+/pls/bprod/bwskfcls.p_sel_crse_search      Look Up Classes term select
+/pls/bprod/bwckgens.p_proc_term_date       basic search, with the Advanced Search button
+/pls/bprod/bwskfcls.P_GetCrse              advanced search form
+/pls/bprod/bwskfcls.P_GetCrse_Advanced     Sections Found results
+
+Enrollment changes as simulated time passes, which runs speed times
+faster than the wall clock. Every request can be held back, answered
+with a server error, stalled past the client's timeout, or find its
+session expired, each with a configurable rate. Unlike oscarstub, which
+replays recorded pages, every page is generated from the simulated state.
+
+The selenium navigation is pointed here with OMSCS_SITE, see navsteps:
+OMSCS_SITE=http://127.0.0.1:8100 python etracker.py
+and the http engine with HttpEngine(base_url=sim.base_url, login_with=lambda: http_login(sim.url)).
+
+Usage:
+python oscarsim.py [--port 8100] [--speed 60] [--sections 100] [--latency 0.3] [--error-rate 0.01]
+"""
+from http.server import BaseHTTPRequestHandler
+from html import escape
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import datetime
+import random
+import threading
+import time
+import uuid
+import logging
+
+import requests
+
+from oscarstub import StubServer
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+OSCAR_PATH = "/pls/bprod/"
+SEASONS = {'02': 'Spring', '05': 'Summer', '08': 'Fall'}
+SUBJECTS = {'CS': "Computer Science", 'CSE': "Computational Science & Engr", 'ISYE': "Industrial & Systems Engr"}
+CAMPUSES = {'O': "Online", 'A': "Georgia Tech-Atlanta *"}
+HEADERS = ('Select', 'CRN', 'Subj', 'Crse', 'Sec', 'Cmp', 'Bas', 'Cred', 'Title', 'Days', 'Time',
+           'Cap', 'Act', 'Rem', 'WL Cap', 'WL Act', 'WL Rem', 'Instructor', 'Location', 'Attribute')
+INSTRUCTORS = ("Staff", "Joyner", "Isbell", "Starner", "Vempala", "Feamster", "Orso", "Goel")
+SESSION_COOKIE = "SIMSESSID"
+
+
+def term_text(term):
+    """'201902' -> 'Spring 2019'"""
+    return f"{SEASONS.get(term[4:], term[4:])} {term[:4]}"
+
+
+class Section:
+    """Simulated section, its counts change in place"""
+
+    def __init__(self, crn, subj, crse, sec, cmp, rng):
+        self.crn = crn
+        self.subj = subj
+        self.crse = crse
+        self.sec = sec
+        self.cmp = cmp
+        self.title = f"Special Topics {crse}"
+        self.instructor = rng.choice(INSTRUCTORS)
+        self.cap = rng.choice((25, 50, 100, 250, 500))
+        self.act = rng.randint(0, self.cap)
+        self.wl_cap = 100
+        self.wl_act = rng.randint(0, 20) if self.act == self.cap else 0
+
+    def step(self, rng):
+        """One registration event, an add or a drop"""
+        if rng.random() < 0.65:
+            if self.act < self.cap:
+                self.act += 1
+            elif self.wl_act < self.wl_cap:
+                self.wl_act += 1
+        elif self.wl_act:
+            # A drop lets the first on the waitlist in
+            self.wl_act -= 1
+        elif self.act:
+            self.act -= 1
+
+    def cells(self, open_registration, term):
+        if open_registration:
+            select = (f'\n<input type="checkbox" name="sel_crn" value="{self.crn} {term}">\n'
+                      f'<input type="hidden" name="assoc_term_in" value="{term}">\n'
+                      '<abbr title="Not available for registration">&nbsp;</abbr>\n')
+        else:
+            select = 'C'
+        values = (self.crn, self.subj, self.crse, self.sec, self.cmp, 'L', '3.000', escape(self.title), 'TBA', 'TBA',
+                  self.cap, self.act, self.cap - self.act, self.wl_cap, self.wl_act, self.wl_cap - self.wl_act,
+                  f'{escape(self.instructor)} (<abbr title="Primary">P</abbr>)', 'TBA', 'Online')
+        return [select] + [str(value) for value in values]
+
+
+class Simulation:
+    """
+    Simulated terms, sections and sessions
+
+    :param terms: Term codes listed on Look Up Classes, newest first
+    :param subjects: Subjects offered in every term
+    :param campuses: Campuses offered in every term
+    :param sections: Sections per term, subject and campus
+    :param open_terms: Terms whose results carry registration checkboxes (26 field rows)
+    :param speed: Simulated seconds per wall clock second
+    :param change_rate: Registration events per section per simulated hour
+    :param info_rate: Course info changes, eg a new instructor, per section per simulated day
+    :param session_hours: Simulated hours a login lasts
+    :param latency: Mean wall clock seconds each response is held back
+    :param error_rate: Share of OSCAR requests answered with a 500
+    :param stall_rate: Share of OSCAR requests held back stall seconds, eg past a client timeout
+    :param stall: Seconds a stalled request is held back
+    :param expire_rate: Share of OSCAR requests finding their session expired
+    :param duo_delay: Wall clock seconds before a Duo push is approved
+    :param seed: Random seed, the same seed gives the same sections and changes
+    """
+
+    def __init__(self, terms=('201902', '201908'), subjects=('CS',), campuses=('O', 'A'), sections=100,
+                 open_terms=('201902',), speed=60.0, change_rate=1.0, info_rate=0.05, session_hours=12,
+                 latency=0.0, error_rate=0.0, stall_rate=0.0, stall=35.0, expire_rate=0.0, duo_delay=0.5,
+                 seed=0):
+        self.terms = list(terms)
+        self.open_terms = set(open_terms)
+        self.speed = speed
+        self.change_rate = change_rate
+        self.info_rate = info_rate
+        self.session_length = datetime.timedelta(hours=session_hours)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.expire_rate = expire_rate
+        self.duo_delay = duo_delay
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        # Faults are drawn from their own generator, enrollment stays the same with or without them
+        self.faults = random.Random(seed + 1)
+        self.sections = {}
+        crn = 20000
+        for term in self.terms:
+            for subject in subjects:
+                for campus in campuses:
+                    self.sections[(term, subject, campus)] = [
+                        Section(crn + i, subject, str(6000 + i * 7 % 900), f"{campus}{i % 20:02d}", campus, self.rng)
+                        for i in range(sections)]
+                    crn += sections
+        self.started = time.monotonic()
+        self.start = datetime.datetime.now()
+        self.updated = self.start
+        # session token -> simulated expiry time
+        self.sessions = {}
+        # (kind, path) -> count
+        self.counts = {}
+
+    def now(self):
+        """Simulated time"""
+        return self.start + datetime.timedelta(seconds=(time.monotonic() - self.started) * self.speed)
+
+    def advance(self):
+        """Apply the registration events since the last call"""
+        with self.lock:
+            now = self.now()
+            hours = (now - self.updated).total_seconds() / 3600
+            self.updated = now
+            for sections in self.sections.values():
+                for section in sections:
+                    events = self.change_rate * hours
+                    for _ in range(min(int(events) + (self.rng.random() < events % 1), 1000)):
+                        section.step(self.rng)
+                    if self.rng.random() < self.info_rate * hours / 24:
+                        section.instructor = self.rng.choice(INSTRUCTORS)
+
+    def add_term(self, term, subjects=('CS',), campuses=('O',), sections=100):
+        """List a new term, eg to exercise term discovery"""
+        with self.lock:
+            crn = 20000 + sum(len(listed) for listed in self.sections.values())
+            for subject in subjects:
+                for campus in campuses:
+                    self.sections[(term, subject, campus)] = [
+                        Section(crn + i, subject, str(6000 + i * 7 % 900), f"{campus}{i % 20:02d}", campus, self.rng)
+                        for i in range(sections)]
+                    crn += sections
+            self.terms.insert(0, term)
+
+    def login(self):
+        """:return: New session token"""
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[token] = self.now() + self.session_length
+        return token
+
+    def valid(self, token):
+        with self.lock:
+            expires = self.sessions.get(token)
+            return expires is not None and expires > self.now()
+
+    def expire(self, token):
+        with self.lock:
+            self.sessions.pop(token, None)
+
+    def count(self, kind, path):
+        with self.lock:
+            self.counts[(kind, path)] = self.counts.get((kind, path), 0) + 1
+
+    def fault(self):
+        """
+        Draw the fault injected into one OSCAR request
+
+        :return: None, 'error', 'stall' or 'expire'
+        """
+        with self.lock:
+            draw = self.faults.random()
+            delay = self.faults.expovariate(1 / self.latency) if self.latency else 0
+        if delay:
+            time.sleep(delay)
+        for fault, rate in (('error', self.error_rate), ('stall', self.stall_rate), ('expire', self.expire_rate)):
+            if draw < rate:
+                return fault
+            draw -= rate
+        return None
+
+    def results(self, term, subjects, campuses):
+        """Sections Found page of a search"""
+        self.advance()
+        open_registration = term in self.open_terms
+        parts = ['<html><head><title>Class Schedule Listing</title></head><body>']
+        with self.lock:
+            found = [(subject, [section for campus in campuses
+                                for section in self.sections.get((term, subject, campus), ())])
+                     for subject in subjects]
+            found = [(subject, sections) for subject, sections in found if sections]
+            if not found:
+                parts.append('<span class="warningtext">No classes were found that meet your search criteria</span>')
+            else:
+                parts += ['<table class="datadisplaytable" summary="This layout table is used to present the '
+                          'sections found">', '<caption class="captiontext">Sections Found</caption>']
+                for subject, sections in found:
+                    parts.append(f'<tr>\n<th colspan="{len(HEADERS)}" class="ddtitle">'
+                                 f'{escape(SUBJECTS.get(subject, subject))}</th>\n</tr>')
+                    parts.append('<tr>\n' + '\n'.join(f'<th class="ddheader">{h}</th>' for h in HEADERS) + '\n</tr>')
+                    for section in sorted(sections, key=lambda sec: sec.crn):
+                        parts.append('<tr>\n' + '\n'.join(f'<td class="dddefault">{cell}</td>' for cell in
+                                                          section.cells(open_registration, term)) + '\n</tr>')
+                parts.append('</table>')
+        parts.append('</body></html>')
+        return '\n'.join(parts)
+
+
+def _page(title, body):
+    return f'<html><head><title>{escape(title)}</title></head><body>\n{body}\n</body></html>'
+
+
+class SimHandler(BaseHTTPRequestHandler):
+    """Routes requests to the pages of sim"""
+    sim = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self._route(url.path, dict(parse_qsl(url.query, keep_blank_values=True)), [])
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qsl(self.rfile.read(length).decode(), keep_blank_values=True)
+        url = urlsplit(self.path)
+        self._route(url.path, dict(form), form)
+
+    def _token(self):
+        for cookie in self.headers.get("Cookie", "").split(";"):
+            name, _, value = cookie.strip().partition("=")
+            if name == SESSION_COOKIE:
+                return value
+        return None
+
+    def _route(self, path, query, form):
+        sim = self.sim
+        if path.startswith(OSCAR_PATH):
+            proc = path[len(OSCAR_PATH):]
+            sim.count('request', proc)
+            fault = sim.fault()
+            if fault is not None:
+                sim.count(fault, proc)
+            if fault == 'error':
+                self.send_error(500, "Simulated server error")
+                return
+            if fault == 'stall':
+                time.sleep(sim.stall)
+            token = self._token()
+            if fault == 'expire':
+                sim.expire(token)
+            if not sim.valid(token):
+                self._redirect("/cp/home/displaylogin")
+                return
+            handler = getattr(self, 'oscar_' + proc.replace('.', '_'), None)
+            if handler is None:
+                self.send_error(404, f"Unknown procedure {proc}")
+                return
+            handler(query, form)
+            return
+        sim.count('request', path)
+        handler = {
+            "/cp/home/displaylogin": self.buzzport_login,
+            "/cas/login": self.cas_login,
+            "/duo": self.duo,
+            "/duo/frame": self.duo_frame,
+            "/duo/push": self.duo_push,
+            "/cps/welcome/loginok.html": self.buzzport_home,
+            "/oscar": self.oscar_frame,
+        }.get(path)
+        if handler is None:
+            self.send_error(404, f"Unknown page {path}")
+            return
+        handler(query, form)
+
+    def buzzport_login(self, query, form):
+        self._send(_page("BuzzPort Login", '<form action="/cas/login" method="get">'
+                                           '<button id="login_btn" type="submit">Login</button></form>'))
+
+    def cas_login(self, query, form):
+        if self.sim.valid(self._token()):
+            self._redirect("/cps/welcome/loginok.html")
+        elif self.command == 'POST' and query.get('username') and query.get('password'):
+            self._redirect("/duo")
+        else:
+            self._send(_page("GT Login Service", """<form action="/cas/login" method="post">
+<input id="username" name="username" type="text">
+<input id="password" name="password" type="password">
+<input name="submit" type="submit" value="LOGIN">
+</form>"""))
+
+    def duo(self, query, form):
+        self._send(_page("Duo Two-Factor Login", '<iframe id="duo_iframe" src="/duo/frame"></iframe>'))
+
+    def duo_frame(self, query, form):
+        self._send(_page("Duo", """<form action="/duo/push" method="post" target="_top">
+<label><input type="checkbox" name="dampen_choice" value="true">Remember me for 7 days</label>
+<button type="submit">Send Me a Push </button>
+</form>"""))
+
+    def duo_push(self, query, form):
+        # The phone approves after a while
+        time.sleep(self.sim.duo_delay)
+        self._redirect("/cps/welcome/loginok.html", (SESSION_COOKIE, self.sim.login()))
+
+    def buzzport_home(self, query, form):
+        if not self.sim.valid(self._token()):
+            self._redirect("/cp/home/displaylogin")
+            return
+        self._send(_page("BuzzPort", '<a href="/oscar">Registration - OSCAR</a>'))
+
+    def oscar_frame(self, query, form):
+        if not self.sim.valid(self._token()):
+            self._redirect("/cp/home/displaylogin")
+            return
+        self._send(_page("BuzzPort", f'<iframe name="the_iframe" id="the_iframe" '
+                                     f'src="{OSCAR_PATH}twbkwbis.P_GenMenu?name=bmenu.P_MainMnu"></iframe>'))
+
+    def oscar_twbkwbis_P_GenMenu(self, query, form):
+        menus = {
+            'bmenu.P_MainMnu': '<a name="StuWeb-MainMenuLink" href="twbkwbis.P_GenMenu?name=bmenu.P_StuMainMnu">'
+                               'Student Services &amp; Financial Aid</a>',
+            'bmenu.P_StuMainMnu': '<a href="twbkwbis.P_GenMenu?name=bmenu.P_RegMnu">Registration</a>',
+            'bmenu.P_RegMnu': '<a href="bwskfcls.p_sel_crse_search">Look Up Classes</a>',
+        }
+        if query.get('name') not in menus:
+            self.send_error(404, f"Unknown menu {query.get('name')}")
+            return
+        self._send(_page("Main Menu", menus[query['name']]))
+
+    def oscar_bwskfcls_p_sel_crse_search(self, query, form):
+        options = '\n'.join(f'<option value="{term}">{term_text(term)}</option>' for term in self.sim.terms)
+        self._send(_page("Select Term or Date Range", f"""<form action="bwckgens.p_proc_term_date" method="post">
+<input type="hidden" name="p_calling_proc" value="P_CrseSearch">
+<select name="p_term" id="term_input_id">
+<option value="">None</option>
+{options}
+</select>
+<input type="submit" value="Submit">
+</form>"""))
+
+    def oscar_bwckgens_p_proc_term_date(self, query, form):
+        term = query.get('p_term', '')
+        if term not in self.sim.terms:
+            self._send(_page("Select Term or Date Range", "<span class=\"errortext\">Please select a term</span>"))
+            return
+        subjects = '\n'.join(f'<option value="{code}">{escape(name)}</option>' for code, name in SUBJECTS.items())
+        self._send(_page("Look Up Classes", f"""<form action="bwskfcls.P_GetCrse" method="post">
+<input type="hidden" name="term_in" value="{term}">
+<select name="sel_subj" multiple>
+{subjects}
+</select>
+<input type="submit" name="SUB_BTN" value="Course Search">
+<input type="submit" name="SUB_BTN" value="Advanced Search">
+</form>"""))
+
+    def oscar_bwskfcls_P_GetCrse(self, query, form):
+        term = query.get('term_in', '')
+        subjects = '\n'.join(f'<option value="{code}">{escape(name)}</option>' for code, name in SUBJECTS.items())
+        campuses = '\n'.join(f'<option value="{code}">{escape(name)}</option>' for code, name in CAMPUSES.items())
+        self._send(_page("Look Up Classes", f"""<form action="bwskfcls.P_GetCrse_Advanced" method="post">
+<input type="hidden" name="term_in" value="{term}">
+<input type="hidden" name="sel_subj" value="dummy">
+<input type="hidden" name="sel_camp" value="dummy">
+<select name="sel_subj" multiple>
+{subjects}
+</select>
+<select name="sel_camp" id="camp_id" multiple>
+<option value="%" selected>All</option>
+{campuses}
+</select>
+<input type="submit" name="SUB_BTN" value="Section Search">
+</form>"""))
+
+    def oscar_bwskfcls_P_GetCrse_Advanced(self, query, form):
+        subjects = [value for name, value in form if name == 'sel_subj' and value not in ('dummy', '%')]
+        campuses = [value for name, value in form if name == 'sel_camp' and value != 'dummy']
+        if not campuses or '%' in campuses:
+            campuses = list(CAMPUSES)
+        self._send(self.sim.results(query.get('term_in', ''), subjects, campuses))
+
+    def _send(self, page):
+        body = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _redirect(self, location, cookie=None):
+        self.send_response(302)
+        self.send_header("Location", location)
+        if cookie is not None:
+            self.send_header("Set-Cookie", f"{cookie[0]}={cookie[1]}; Path=/")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(sim, port=0, background=True):
+    """
+    Start the simulator on localhost
+
+    :param sim: Simulation served
+    :param port: Port to listen on, 0 picks a free one
+    :param background: Serve from a daemon thread and return immediately
+    :return: HTTPServer instance. sim.url and sim.base_url are set to its buzzport and OSCAR urls.
+    """
+    handler = type("SimulatorHandler", (SimHandler,), {"sim": sim})
+    server = StubServer(("127.0.0.1", port), handler)
+    sim.url = f"http://127.0.0.1:{server.server_port}"
+    sim.base_url = sim.url + OSCAR_PATH
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+def http_login(url, userid='sim', pwd='sim', timeout=30):
+    """
+    Log in to the simulator without a browser, through CAS and an approved Duo push
+
+    :param url: Simulator url, eg sim.url
+    :return: Cookies, as name -> value dict for HttpEngine
+    """
+    with requests.Session() as session:
+        session.post(url + "/cas/login", data={'username': userid, 'password': pwd}, timeout=timeout)
+        session.post(url + "/duo/push", data={'dampen_choice': 'true'}, timeout=timeout).raise_for_status()
+        return session.cookies.get_dict()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--speed", type=float, default=60, help="Simulated seconds per second")
+    parser.add_argument("--sections", type=int, default=100, help="Sections per term, subject and campus")
+    parser.add_argument("--latency", type=float, default=0, help="Mean seconds responses are held back")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--stall-rate", type=float, default=0)
+    parser.add_argument("--expire-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    simulation = Simulation(sections=args.sections, speed=args.speed, latency=args.latency,
+                            error_rate=args.error_rate, stall_rate=args.stall_rate, expire_rate=args.expire_rate,
+                            seed=args.seed)
+    print(f"Simulating OSCAR on http://127.0.0.1:{args.port}/, OMSCS_SITE=http://127.0.0.1:{args.port}")
+    serve(simulation, args.port, background=False)
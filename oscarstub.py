@@ -0,0 +1,102 @@
+"""
+OSCAR stub server
+
+Replays recorded OSCAR pages so the http engine can be run without
+touching GT servers.
+
+Pages are looked up by the last component of the request path, so a
+directory containing:
+
+    bwckgens.p_proc_term_date.html
+    bwskfcls.P_GetCrse_Advanced.html
+
+is enough for HttpEngine(base_url="http://localhost:8000/pls/bprod/").
+Form submissions received are logged so the posted fields can be checked.
+Requests are served on their own threads, with an optional delay to
+stand in for OSCAR's response time.
+
+Usage:
+python oscarstub.py recorded_pages_dir [--port 8000] [--delay 0.5]
+"""
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qsl
+import argparse
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serve <page_dir>/<proc>.html for GET and POST requests"""
+    page_dir = "."
+    # Seconds each response is held back
+    delay = 0
+    # (method, proc, form fields) for every request received
+    requests_seen = []
+
+    def _replay(self, form):
+        proc = os.path.basename(urlsplit(self.path).path)
+        self.requests_seen.append((self.command, proc, form))
+        if self.delay:
+            time.sleep(self.delay)
+        page = os.path.join(self.page_dir, proc + ".html")
+        if not os.path.isfile(page):
+            self.send_error(404, f"No recorded page for {proc}")
+            return
+        with open(page, 'rb') as fh:
+            body = fh.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "SESSID=stub; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._replay(parse_qsl(urlsplit(self.path).query, keep_blank_values=True))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode()
+        self._replay(parse_qsl(body, keep_blank_values=True))
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(page_dir, port=0, background=True, delay=0):
+    """
+    Start a replay server
+
+    :param page_dir: Directory of recorded pages named <proc>.html
+    :param port: Port to listen on, 0 picks a free one
+    :param background: Serve from a daemon thread and return immediately
+    :param delay: Seconds each response is held back
+    :return: HTTPServer instance, base url is http://127.0.0.1:<server_port>/pls/bprod/
+    """
+    handler = type("StubHandler", (ReplayHandler,), {"page_dir": page_dir, "delay": delay, "requests_seen": []})
+    server = StubServer(("127.0.0.1", port), handler)
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("page_dir", help="Directory of recorded OSCAR pages")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0, help="Seconds each response is held back")
+    args = parser.parse_args()
+    print(f"Replaying {args.page_dir} on http://127.0.0.1:{args.port}/pls/bprod/")
+    serve(args.page_dir, args.port, background=False, delay=args.delay)
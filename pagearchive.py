@@ -0,0 +1,287 @@
+"""
+Raw page archive
+
+Keeps every fetched results page, so history can be parsed again after
+a layout change or a parser fix. Pages are stored content addressed:
+
+page_blobs  - one compressed blob per distinct page, keyed by its sha256
+pages       - one row per fetch: target, time and the hash of its page
+page_dicts  - zlib preset dictionaries blobs were compressed with
+
+Identical pages, eg repeated scrapes of a quiet term, cost one row in
+pages and nothing more. Blobs are deflated with a preset dictionary
+trained from archived pages: the markup OSCAR repeats on every page is
+then already known to the compressor and takes next to no space.
+
+The archive is its own database file, so it can grow without slowing
+the tracker database. Pages are added from the engines' worker threads.
+
+Usage:
+python pagearchive.py stats [--archive OMSCS_pages.db]
+python pagearchive.py show 201902 [--at "2019-11-04 10:00"] [--subject CS]
+python pagearchive.py train
+"""
+from collections import Counter, namedtuple
+import argparse
+import datetime
+import hashlib
+import sqlite3
+import threading
+import zlib
+import logging
+
+from dbwriter import PRAGMAS, timestamp
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS page_dicts(
+        id INTEGER PRIMARY KEY,
+        created TEXT NOT NULL,
+        data BLOB NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS page_blobs(
+        hash TEXT NOT NULL PRIMARY KEY,
+        dict_id INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        data BLOB NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS pages(
+        term TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        campus TEXT NOT NULL,
+        ts TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        PRIMARY KEY (term, subject, campus, ts)
+    ) WITHOUT ROWID""",
+)
+# zlib only looks back 32 KiB, a longer dictionary would be wasted
+DICT_SIZE = 32768
+# Pages archived before a dictionary is trained, they are kept without one
+TRAIN_AFTER = 20
+LEVEL = 9
+
+ArchiveStats = namedtuple('ArchiveStats', ('pages', 'blobs', 'raw_bytes', 'stored_bytes'))
+
+
+def page_hash(page):
+    """
+    :param page: Page bytes
+    :return: sha256 hex digest
+    """
+    return hashlib.sha256(page).hexdigest()
+
+
+def train_dictionary(pages, size=DICT_SIZE):
+    """
+    Build a zlib preset dictionary from sample pages
+
+    Lines are ranked by how many samples contain them and how long they
+    are. The most useful go last, where deflate reaches them with the
+    shortest distances.
+
+    :param pages: List of sample page bytes
+    :param size: Most dictionary bytes
+    :return: Dictionary bytes
+    """
+    seen_in = Counter()
+    for page in pages:
+        seen_in.update(set(page.splitlines(keepends=True)))
+    # Lines only in one page are data, not markup
+    common = [line for line, count in seen_in.items() if count > 1 or len(pages) == 1]
+    common.sort(key=lambda line: (seen_in[line] * len(line), line), reverse=True)
+    chosen = []
+    total = 0
+    for line in common:
+        if total + len(line) > size:
+            continue
+        chosen.append(line)
+        total += len(line)
+    return b"".join(reversed(chosen))
+
+
+def compress(page, zdict=None):
+    """
+    :param page: Page bytes
+    :param zdict: Preset dictionary bytes or None
+    :return: Deflated bytes
+    """
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, 15, 9, zlib.Z_DEFAULT_STRATEGY, *([zdict] if zdict else []))
+    return compressor.compress(page) + compressor.flush()
+
+
+def decompress(data, zdict=None):
+    decompressor = zlib.decompressobj(15, *([zdict] if zdict else []))
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+class PageArchive:
+    """
+    Content addressed store of raw pages
+
+    :param path: Archive database file
+    :param train_after: Pages kept before the first dictionary is trained, None to never train
+    :param readonly: Open an existing archive for reading only, eg from reingest workers
+    """
+
+    def __init__(self, path='OMSCS_pages.db', train_after=TRAIN_AFTER, readonly=False):
+        self.path = path
+        self.train_after = train_after
+        self.lock = threading.Lock()
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, isolation_level=None,
+                                        check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            for pragma in PRAGMAS:
+                self.conn.execute(pragma)
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+        # id -> dictionary bytes, 0 is no dictionary
+        self.dicts = {0: None}
+        self.dicts.update(self.conn.execute("SELECT id, data FROM page_dicts"))
+        self.dict_id = max(self.dicts)
+        # Set under the lock by the add that trains the first dictionary, so no other add trains one too
+        self.training = False
+
+    def add(self, page, term, subject='', campus='', fetched=None):
+        """
+        Archive one fetched page
+
+        :param page: Page source, str or bytes
+        :param term: Semester the page was fetched for
+        :param subject: Subject searched for, '' if every subject
+        :param campus: Campus searched for, '' if every campus
+        :param fetched: Time of the fetch, datetime, defaults to now
+        :return: Hash of the page
+        """
+        if isinstance(page, str):
+            page = page.encode('utf-8')
+        digest = page_hash(page)
+        ts = timestamp(fetched or datetime.datetime.now())
+        with self.lock:
+            zdict_id = self.dict_id
+            known = self.conn.execute("SELECT 1 FROM page_blobs WHERE hash=?", (digest,)).fetchone()
+        # Compress outside the lock, so workers archiving at once do not wait on each other
+        data = None if known else compress(page, self.dicts[zdict_id])
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if data is not None:
+                    self.conn.execute("INSERT OR IGNORE INTO page_blobs VALUES (?, ?, ?, ?)",
+                                      (digest, zdict_id, len(page), data))
+                self.conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                                  (term, subject, campus, ts, digest))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            train = data is not None and self.dict_id == 0 and not self.training and \
+                self.train_after is not None and \
+                self.conn.execute("SELECT count(*) FROM page_blobs").fetchone()[0] >= self.train_after
+            if train:
+                self.training = True
+        if train:
+            try:
+                self.train()
+            finally:
+                with self.lock:
+                    self.training = False
+        return digest
+
+    def train(self, samples=TRAIN_AFTER):
+        """
+        Train a new dictionary from the latest distinct pages, used for pages archived from now on
+
+        Blobs already stored keep the dictionary they were compressed with.
+
+        :param samples: Number of pages sampled
+        :return: New dictionary id
+        """
+        with self.lock:
+            hashes = [digest for (digest,) in self.conn.execute(
+                "SELECT hash FROM pages GROUP BY hash ORDER BY max(ts) DESC LIMIT ?", (samples,))]
+        zdict = train_dictionary([self.get(digest) for digest in hashes])
+        with self.lock:
+            cursor = self.conn.execute("INSERT INTO page_dicts(created, data) VALUES (?, ?)",
+                                       (timestamp(datetime.datetime.now()), zdict))
+            self.dict_id = cursor.lastrowid
+            self.dicts[self.dict_id] = zdict
+        logger.info(f"Trained page dictionary {self.dict_id} of {len(zdict)} bytes from {len(hashes)} pages")
+        return self.dict_id
+
+    def get(self, digest):
+        """
+        :param digest: Page hash
+        :return: Page bytes
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT dict_id, data FROM page_blobs WHERE hash=?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        return decompress(row[1], self.dicts[row[0]])
+
+    def pages(self, term, start=None, end=None, subject=None, campus=None):
+        """
+        Fetches of a term
+
+        :param start: Optional first time included, datetime or text
+        :param end: Optional last time included
+        :return: List of (subject, campus, timestamp text, hash), oldest first
+        """
+        start = timestamp(start) if start is not None else ""
+        end = timestamp(end) if end is not None else "9999"
+        with self.lock:
+            return self.conn.execute("""
+                SELECT subject, campus, ts, hash FROM pages
+                WHERE term=? AND ts BETWEEN ? AND ? AND (? IS NULL OR subject=?) AND (? IS NULL OR campus=?)
+                ORDER BY ts""", (term, start, end, subject, subject, campus, campus)).fetchall()
+
+    def stats(self):
+        """
+        :return: ArchiveStats, raw_bytes counts every fetch, stored_bytes every distinct blob
+        """
+        with self.lock:
+            pages = self.conn.execute("SELECT count(*) FROM pages").fetchone()[0]
+            raw = self.conn.execute("SELECT coalesce(sum(b.size), 0) FROM pages p JOIN page_blobs b "
+                                    "ON b.hash=p.hash").fetchone()[0]
+            blobs, stored = self.conn.execute("SELECT count(*), coalesce(sum(length(data)), 0) "
+                                              "FROM page_blobs").fetchone()
+        return ArchiveStats(pages, blobs, raw, stored)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--archive", default="OMSCS_pages.db")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("stats", help="Pages, distinct blobs and sizes")
+    show = commands.add_parser("show", help="Print the page fetched last at or before a time")
+    show.add_argument("term")
+    show.add_argument("--at", help="Timestamp, latest page if omitted")
+    show.add_argument("--subject")
+    show.add_argument("--campus")
+    commands.add_parser("train", help="Train a new dictionary from the latest pages")
+    args = parser.parse_args()
+
+    archive = PageArchive(args.archive)
+    if args.command == "stats":
+        stats = archive.stats()
+        print(f"{stats.pages} pages, {stats.blobs} distinct")
+        print(f"{stats.raw_bytes / 2**20:.1f} MB fetched, {stats.stored_bytes / 2**20:.2f} MB stored "
+              f"({stats.raw_bytes / max(stats.stored_bytes, 1):.0f}x)")
+    elif args.command == "show":
+        fetched = archive.pages(args.term, end=args.at, subject=args.subject, campus=args.campus)
+        if not fetched:
+            parser.exit(1, "No page archived\n")
+        print(archive.get(fetched[-1][3]).decode('utf-8'))
+    elif args.command == "train":
+        print(f"Dictionary {archive.train()}")
+    else:
+        parser.print_help()
+    archive.close()
@@ -0,0 +1,160 @@
+"""
+Adaptive polling policy
+
+Picks the time until each target's next scrape from how often its
+enrollment changed recently, as stored in the database. Busy targets
+are scraped more often, quiet ones back off, always within a minimum
+and maximum interval. A calendar of known registration phases can
+narrow those bounds while a phase is running, so scraping speeds up
+as soon as a phase opens instead of after the first changes are seen.
+
+Phase calendar, a JSON list:
+[{"name": "Phase I", "start": "2019-11-04 08:00", "end": "2019-11-08 16:00",
+  "min_minutes": 5, "max_minutes": 30}]
+
+Intended use:
+plan = PollPlan(targets, AdaptivePolicy(phases=load_phases('phases.json')))
+for target in plan.due(now): scrape, write, then plan.reschedule(target, writer.conn, now)
+"""
+from collections import namedtuple
+import datetime
+import json
+import logging
+
+from enrollhist import change_counts, parse_ts
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+Phase = namedtuple('Phase', ('name', 'start', 'end', 'min_interval', 'max_interval'))
+
+
+def load_phases(path):
+    """
+    Read a registration phase calendar
+
+    :param path: JSON file, see module docstring
+    :return: List of Phase
+    """
+    with open(path) as fh:
+        entries = json.load(fh)
+    phases = []
+    for entry in entries:
+        phases.append(Phase(entry['name'],
+                            datetime.datetime.strptime(entry['start'], "%Y-%m-%d %H:%M"),
+                            datetime.datetime.strptime(entry['end'], "%Y-%m-%d %H:%M"),
+                            datetime.timedelta(minutes=entry['min_minutes']),
+                            datetime.timedelta(minutes=entry['max_minutes'])))
+    return phases
+
+
+class AdaptivePolicy:
+    """
+    Interval inversely proportional to the recent change rate
+
+    interval = changes_per_scrape / (sections changed per second over the window),
+    clamped to the bounds in force. No changes in the window gives the maximum,
+    too little history gives the minimum so a new target is learned quickly.
+
+    :param min_interval: Shortest interval, timedelta
+    :param max_interval: Longest interval, timedelta
+    :param changes_per_scrape: Section changes a scrape should see on average.
+                               Lower catches more separate changes for more scrapes.
+    :param window: How far back change rates are measured, timedelta
+    :param phases: List of Phase, their bounds replace the defaults while running
+    """
+
+    def __init__(self, min_interval=datetime.timedelta(minutes=5), max_interval=datetime.timedelta(hours=2),
+                 changes_per_scrape=8, window=datetime.timedelta(hours=6), phases=()):
+        if min_interval > max_interval:
+            raise ValueError(f"min_interval {min_interval} above max_interval {max_interval}")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.changes_per_scrape = changes_per_scrape
+        self.window = window
+        self.phases = list(phases)
+
+    def bounds(self, when):
+        """
+        :param when: datetime
+        :return: (min interval, max interval) in force at when
+        """
+        for phase in self.phases:
+            if phase.start <= when < phase.end:
+                return phase.min_interval, phase.max_interval
+        return self.min_interval, self.max_interval
+
+    def interval(self, conn, target, now):
+        """
+        Time until the next scrape of a target
+
+        :param conn: sqlite3 connection to the long layout database
+        :param target: scrapepool.Target
+        :param now: Current time, datetime
+        :return: timedelta
+        """
+        low, high = self.bounds(now)
+        counts = change_counts(conn, target.term, now - self.window, now, target.subject or None,
+                               target.campus or None)
+        if not counts:
+            interval = low
+        else:
+            elapsed = max((parse_ts(counts[-1][1]) - parse_ts(counts[0][0])).total_seconds(), 1)
+            changed = sum(count for _, _, count in counts)
+            interval = high if not changed else datetime.timedelta(seconds=self.changes_per_scrape * elapsed / changed)
+        interval = min(max(interval, low), high)
+        # Never sleep past the start of a phase
+        for phase in self.phases:
+            if now < phase.start < now + interval:
+                interval = phase.start - now
+        return interval
+
+
+class PollPlan:
+    """
+    Next scrape time of every target
+
+    :param targets: List of scrapepool.Target
+    :param policy: AdaptivePolicy
+    :param start: Time every target is first due, defaults to now
+    """
+
+    def __init__(self, targets, policy, start=None):
+        self.policy = policy
+        start = start or datetime.datetime.now()
+        self.next_run = {target: start for target in targets}
+
+    def add(self, target, when=None):
+        """
+        Start planning a target, due at when or straight away
+
+        :param target: scrapepool.Target
+        :param when: datetime, defaults to now
+        """
+        self.next_run.setdefault(target, when or datetime.datetime.now())
+
+    def due(self, now):
+        """
+        :param now: datetime
+        :return: Targets whose next scrape time has passed
+        """
+        return [target for target, when in self.next_run.items() if when <= now]
+
+    def reschedule(self, target, conn, now, failed=False):
+        """
+        Set a target's next scrape time after it was scraped
+
+        :param target: scrapepool.Target
+        :param conn: sqlite3 connection the scrape was written to
+        :param now: datetime
+        :param failed: The scrape failed, retry after the minimum interval
+        :return: Time of the next scrape
+        """
+        if failed:
+            interval = self.policy.bounds(now)[0]
+        else:
+            interval = self.policy.interval(conn, target, now)
+        self.next_run[target] = now + interval
+        logger.debug(f"Next scrape of {target} in {interval}")
+        return self.next_run[target]
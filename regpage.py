@@ -1,15 +1,33 @@
-"""Navigate directly to the registration page for the supplied semester"""
+"""
+Navigate directly to the registration page for the supplied semester
+
+Usage:
+python regpage.py [--semester 202008] [--subject CS] [--campus O]
+which is the same as python omscs.py regpage
+"""
+import sys
+
 from coursexp import gtlogin, gotosem, browser_setup
 
-# Setup optional logging
-import logging
-from coursexp import logsetup
-logger = logging.getLogger(__name__)
-logger = logsetup(logger)
-
-# Navigate to page
-browser = browser_setup(headless=False)
-gtlogin(browser, True)
-semester = '201902'
-gotosem(browser, semester)
-exit()
+
+def open_registration(semester, subject='CS', campus='O', headless=False):
+    """
+    Login, sending the Duo push right away, and open the semester's search results
+
+    :param semester: Semester option value on webpage
+    :param subject: Subject option value, eg 'CS' or 'CSE'
+    :param campus: Campus option value, eg 'O' for online
+    :param headless: Set if headless mode is to be used
+    :return: Selenium browser object, left open on the results page
+    """
+    browser = browser_setup(headless=headless)
+    gtlogin(browser, True)
+    gotosem(browser, semester, subject, campus)
+    return browser
+
+
+if __name__ == "__main__":
+    # Same as python omscs.py regpage, without importing this file a second time
+    import omscs
+    sys.modules['regpage'] = sys.modules['__main__']
+    omscs.main(["regpage"] + sys.argv[1:])
@@ -0,0 +1,179 @@
+"""
+Re-ingest archived pages
+
+Parses the results pages kept by pagearchive again and writes them
+through a DBWriter, eg to rebuild a term's history after a parser fix
+or a layout change. Pages are decompressed and parsed on a process pool
+using every core. The parsed scrapes come back in fetch order and are
+written by this process alone, many scrapes per transaction.
+
+Progress is checkpointed in the target database, in the same
+transaction as the scrapes it covers, so an interrupted run picks up
+after the last batch written when started again.
+
+Usage:
+python reingest.py 201902 --db rebuilt.db [--archive OMSCS_pages.db] [--store changes] [--processes 8]
+python reingest.py 201902 --db OMSCS_CA.db --replace
+"""
+from collections import namedtuple
+from itertools import islice
+import argparse
+import datetime
+import multiprocessing
+import os
+import logging
+
+from analytics import Rollups
+from compact import create_compact_schema
+from dbwriter import DBWriter, timestamp
+from pagearchive import PageArchive
+from sections import parse_sections
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+CHECKPOINT_SCHEMA = """CREATE TABLE IF NOT EXISTS reingest_checkpoints(
+    term TEXT NOT NULL PRIMARY KEY,
+    ts TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    campus TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    updated TEXT NOT NULL
+) WITHOUT ROWID"""
+# Scrapes written per transaction
+BATCH = 200
+# Tables holding a term's history in the long layout
+TERM_TABLES = ('sections', 'section_versions', 'enrollment', 'enrollment_runs', 'scrapes', 'reingest_checkpoints',
+               'enrollment_rollups', 'compaction_progress')
+
+ReingestStats = namedtuple('ReingestStats', ('pages', 'written', 'failed', 'resumed'))
+
+# Worker process state
+_archive = None
+_last = (None, None)
+
+
+def _init_worker(archive_path):
+    global _archive
+    _archive = PageArchive(archive_path, readonly=True)
+
+
+def _parse(page):
+    """
+    :param page: (subject, campus, ts, hash) from PageArchive.pages
+    :return: (page, sections or None, error text or None)
+    """
+    global _last
+    digest = page[3]
+    # Repeated pages usually land in the same chunk, parse them once
+    if _last[0] == digest:
+        return page, _last[1], None
+    try:
+        sections = parse_sections(_archive.get(digest).decode('utf-8'))
+    except Exception as e:
+        return page, None, repr(e)
+    _last = (digest, sections)
+    return page, sections, None
+
+
+def clear_term(conn, term):
+    """Delete a term's history and checkpoint from the long layout tables"""
+    create_compact_schema(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in TERM_TABLES:
+            conn.execute(f"DELETE FROM {table} WHERE term=?", (term,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def reingest(term, dbname, archive_path='OMSCS_pages.db', store='full', processes=None, batch=BATCH,
+             replace=False, rollups=True):
+    """
+    Write a term's archived pages to a database
+
+    :param term: Semester option value
+    :param dbname: Target database, long layout
+    :param archive_path: pagearchive database file
+    :param store: "full" or "changes", as DBWriter
+    :param processes: Parsing processes, every core if None
+    :param batch: Scrapes written per transaction and checkpoint
+    :param replace: Delete the term's history in the target first and start over
+    :param rollups: Rebuild the term's analytics rollups afterwards
+    :return: ReingestStats, resumed is the number of pages a checkpoint let us skip
+    :raise ValueError: If the target holds scrapes of the term that no earlier run wrote and replace is not set
+    """
+    archive = PageArchive(archive_path, readonly=True)
+    pages = sorted(archive.pages(term), key=lambda page: (page[2], page[0], page[1]))
+    archive.close()
+    writer = DBWriter(dbname, term=term, store=store)
+    conn = writer.conn
+    conn.execute(CHECKPOINT_SCHEMA)
+    if replace:
+        clear_term(conn, term)
+    checkpoint = conn.execute("SELECT ts, subject, campus, pages, failed FROM reingest_checkpoints WHERE term=?",
+                              (term,)).fetchone()
+    # Pages are kept under their fetch time, not the time the tracker wrote the scrape,
+    # so written on top of the tracker's own scrapes every scrape would be there twice
+    if checkpoint is None and conn.execute("SELECT 1 FROM scrapes WHERE term=? LIMIT 1", (term,)).fetchone():
+        writer.close()
+        raise ValueError(f"{dbname} already has scrapes of {term}, reingest with replace to start over")
+    done, failed = (checkpoint[3], checkpoint[4]) if checkpoint else (0, 0)
+    if checkpoint:
+        pages = [page for page in pages if (page[2], page[0], page[1]) > tuple(checkpoint[:3])]
+        logger.info(f"Resuming {term} after {checkpoint[0]}, {len(pages)} pages left")
+    processes = processes or os.cpu_count()
+    chunksize = max(1, min(64, len(pages) // (processes * 4)))
+    written = 0
+    try:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(archive_path,)) as pool:
+            results = pool.imap(_parse, pages, chunksize)
+            while True:
+                chunk = list(islice(results, batch))
+                if not chunk:
+                    break
+                with writer.batch():
+                    for (subject, campus, ts, digest), sections, error in chunk:
+                        if sections is None:
+                            failed += 1
+                            logger.warning(f"Page {digest} of {subject or '*'}:{campus or '*'} at {ts} "
+                                           f"failed to parse: {error}")
+                            continue
+                        writer.write(sections, ts, term=term, subject=subject, campus=campus)
+                        written += 1
+                    last = chunk[-1][0]
+                    done += len(chunk)
+                    conn.execute("INSERT OR REPLACE INTO reingest_checkpoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (term, last[2], last[0], last[1], done, failed,
+                                  timestamp(datetime.datetime.now())))
+                logger.debug(f"Re-ingested {done} pages of {term}, up to {last[2]}")
+        if rollups:
+            Rollups(conn).rebuild(term)
+    finally:
+        writer.close()
+    return ReingestStats(done, written, failed, done - len(pages))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("term")
+    parser.add_argument("--db", required=True, help="Target database")
+    parser.add_argument("--archive", default="OMSCS_pages.db")
+    parser.add_argument("--store", choices=("full", "changes"), default="full")
+    parser.add_argument("--processes", type=int, help="Parsing processes, every core by default")
+    parser.add_argument("--batch", type=int, default=BATCH, help="Scrapes per transaction")
+    parser.add_argument("--replace", action="store_true", help="Delete the term from the target and start over")
+    parser.add_argument("--no-rollups", action="store_true", help="Skip rebuilding the analytics rollups")
+    args = parser.parse_args()
+
+    try:
+        stats = reingest(args.term, args.db, args.archive, args.store, args.processes, args.batch, args.replace,
+                         not args.no_rollups)
+    except ValueError as e:
+        raise SystemExit(f"reingest: {e}")
+    print(f"{stats.pages} pages, {stats.written} scrapes written, {stats.failed} failed to parse, "
+          f"{stats.resumed} done by an earlier run")
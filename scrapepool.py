@@ -0,0 +1,171 @@
+"""
+Concurrent scraping of several targets
+
+A target is one (term, subject, campus) search. ScrapePool runs the
+searches for a list of targets on a bounded pool of worker threads,
+each worker keeping its own engine (browser or http session) between
+runs. Results are handed back to the calling thread and written through
+one DBWriter, so sqlite only ever sees a single writer.
+
+Scrapes spend nearly all their time waiting on OSCAR, so with at least
+as many workers as targets a run takes about as long as its slowest
+target.
+
+Intended use:
+pool = ScrapePool(lambda: make_engine('http'), max_workers=4)
+pool.run([Target('201902', 'CS', 'O'), Target('201902', 'CSE', 'O')], writer)
+pool.close()
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+import logging
+
+from engines import OSCAR_BASE_URL, http_sessions, make_engine, scrape_with_retry
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+Target = namedtuple('Target', ('term', 'subject', 'campus'))
+
+
+def parse_target(text):
+    """
+    Target from its command line form
+
+    :param text: 'term[:subject[:campus]]', eg '201902:CSE:O'
+    :return: Target, subject defaults to CS and campus to O
+    """
+    parts = text.split(':')
+    if not 1 <= len(parts) <= 3 or not all(parts):
+        raise ValueError(f"Target should be term[:subject[:campus]], got {text}")
+    return Target(*(parts + ['CS', 'O'][len(parts) - 1:]))
+
+
+class RateLimiter:
+    """
+    Minimum interval between starts of the same key
+
+    :param min_interval: Seconds between two starts of one key
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        # key -> monotonic time the next start is allowed
+        self.next_start = {}
+
+    def wait(self, key):
+        """Block until key may start, and reserve that start"""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(key, now))
+            self.next_start[key] = start + self.min_interval
+        if start > now:
+            logger.debug(f"Rate limiting {key} for {start - now:.1f}s")
+            time.sleep(start - now)
+
+
+def engine_factory(name='selenium', headless=True, **kwargs):
+    """
+    Callable building one engine per worker
+
+    http engines share a single SessionManager, so only one of them logs
+    in. selenium engines each log in their own browser.
+
+    :param name: "selenium" or "http"
+    :param headless: Set if headless mode is to be used for any browser
+    :param kwargs: Passed to make_engine
+    """
+    if name == 'http' and 'cookies' not in kwargs and 'login_with' not in kwargs:
+        kwargs.setdefault('sessions', http_sessions(kwargs.get('base_url', OSCAR_BASE_URL), headless))
+    return lambda: make_engine(name, headless=headless, **kwargs)
+
+
+class ScrapePool:
+    """
+    Bounded pool of scraping workers
+
+    :param factory: Callable returning a new ScrapeEngine, called once per worker thread
+    :param max_workers: Number of worker threads, and so of engines
+    :param min_interval: Seconds between two scrapes of the same target
+    """
+
+    def __init__(self, factory, max_workers=4, min_interval=60):
+        self.factory = factory
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.limiter = RateLimiter(min_interval)
+        self.local = threading.local()
+        self.engines = []
+        self.engines_lock = threading.Lock()
+
+    def _engine(self):
+        engine = getattr(self.local, 'engine', None)
+        if engine is None:
+            engine = self.local.engine = self.factory()
+            with self.engines_lock:
+                self.engines.append(engine)
+        return engine
+
+    def _scrape(self, target):
+        self.limiter.wait(target)
+        return scrape_with_retry(self._engine(), target.term, target.subject, target.campus)
+
+    def scrape(self, targets):
+        """
+        Scrape targets concurrently, yielding results as they finish
+
+        :param targets: Iterable of Target
+        :return: Generator of (target, sections, scrape_time), sections and
+                 scrape_time are None and the error is logged if the target failed
+        """
+        futures = {self.executor.submit(self._scrape, target): target for target in targets}
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                sections, scrape_time = future.result()
+            except Exception:
+                logger.exception(f"Scrape of {target} failed")
+                yield target, None, None
+                continue
+            logger.info(f"Scraped {len(sections)} sections for {target}")
+            yield target, sections, scrape_time
+
+    def call(self, fction):
+        """
+        Run a function on a worker with that worker's engine
+
+        :param fction: Callable taking a ScrapeEngine, eg engines.terms_with_retry
+        :return: Its result, exceptions are raised in the calling thread
+        """
+        return self.executor.submit(lambda: fction(self._engine())).result()
+
+    def run(self, targets, writer):
+        """
+        Scrape targets and write each result as it arrives
+
+        :param targets: Iterable of Target
+        :param writer: DBWriter owned by the calling thread
+        :return: Target -> enrollment rows written, None for failed targets
+        """
+        written = {}
+        for target, sections, scrape_time in self.scrape(targets):
+            if sections is None:
+                written[target] = None
+                continue
+            written[target] = writer.write(sections, scrape_time, term=target.term,
+                                           subject=target.subject, campus=target.campus)
+        return written
+
+    def close(self):
+        """Wait for running scrapes, then close every worker's engine"""
+        self.executor.shutdown(wait=True)
+        for engine in self.engines:
+            try:
+                engine.close()
+            except Exception:
+                logger.exception(f"Closing {engine.name} engine failed")
+        self.engines = []
@@ -0,0 +1,259 @@
+"""
+Typed section parser
+
+Reads the OSCAR results table by its header row instead of by position.
+The header is mapped to field names once, then every data row is walked
+cell by cell into a compact Section record with the enrollment numbers
+already converted to int. Column order changes, the extra select cell
+inputs while registration is open, and unknown extra columns are all
+handled without looking at row lengths.
+
+The page is streamed through lxml's parser target interface, so no
+element tree is built and only the cell text of the results table is
+ever held in memory.
+"""
+import logging
+
+from lxml import etree
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+# Header text, lower cased and space collapsed -> Section field
+HEADER_FIELDS = {
+    'select': 'slct',
+    'crn': 'crn',
+    'subj': 'subj',
+    'crse': 'crse',
+    'sec': 'sec',
+    'cmp': 'cmp',
+    'bas': 'bas',
+    'cred': 'cred',
+    'title': 'title',
+    'days': 'days',
+    'time': 'time',
+    'cap': 'cap',
+    'act': 'act',
+    'rem': 'rem',
+    'wl cap': 'wl_cap',
+    'wl act': 'wl_act',
+    'wl rem': 'wl_rem',
+    'instructor': 'instructor',
+    'location': 'location',
+    'attribute': 'attribute',
+}
+# OSCAR's answer to a search without results, shown instead of the table
+NO_CLASSES = "No classes were found"
+INT_FIELDS = ('crn', 'cap', 'act', 'rem', 'wl_cap', 'wl_act', 'wl_rem')
+# Fields every results table has to provide
+REQUIRED_FIELDS = INT_FIELDS + ('subj', 'crse')
+
+
+class Section:
+    """
+    One row of the results table
+
+    Text fields default to '' when the table has no such column.
+    """
+    __slots__ = ('slct', 'crn', 'subj', 'crse', 'sec', 'cmp', 'bas', 'cred', 'title', 'days', 'time',
+                 'cap', 'act', 'rem', 'wl_cap', 'wl_act', 'wl_rem', 'instructor', 'location', 'attribute')
+    COURSE_FIELDS = ('slct', 'crn', 'subj', 'crse', 'sec', 'cmp', 'bas', 'cred', 'title', 'days', 'time',
+                     'instructor', 'location', 'attribute')
+    COUNT_FIELDS = ('cap', 'act', 'rem', 'wl_cap', 'wl_act', 'wl_rem')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name, ''))
+
+    @property
+    def counts(self):
+        """(cap, act, rem, wl_cap, wl_act, wl_rem) as ints"""
+        return (self.cap, self.act, self.rem, self.wl_cap, self.wl_act, self.wl_rem)
+
+    def course_row(self):
+        """Course info as the text tuple stored in the legacy courses table"""
+        return tuple(str(getattr(self, name)) for name in self.COURSE_FIELDS)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Build from a validated 22 field row as returned by scrape_courses
+
+        :param row: List of cell text, after dbadd's 26 -> 22 trim
+        """
+        fields = dict(zip(cls.COURSE_FIELDS, row[1:12] + row[18:21]))
+        fields.update(zip(cls.COUNT_FIELDS, (int(el) for el in row[12:18])))
+        fields['crn'] = int(fields['crn'])
+        return cls(**fields)
+
+    def __eq__(self, other):
+        return isinstance(other, Section) and all(getattr(self, name) == getattr(other, name)
+                                                  for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Section(crn={self.crn}, {self.subj} {self.crse} {self.sec}, counts={self.counts})"
+
+
+def column_map(header_cells):
+    """
+    Map cell positions to Section fields from the header row
+
+    :param header_cells: List of (header text, colspan)
+    :return: (list of (position, field) for known headers, total column count)
+    """
+    columns = []
+    position = 0
+    for text, colspan in header_cells:
+        field = HEADER_FIELDS.get(" ".join(text.split()).lower())
+        if field is not None:
+            columns.append((position, field))
+        position += colspan
+    missing = set(REQUIRED_FIELDS) - {field for _, field in columns}
+    if missing:
+        raise ValueError(f"Course table header missing columns: {sorted(missing)}")
+    return columns, position
+
+
+class _TableTarget:
+    """
+    lxml parser target collecting Sections from the datadisplaytable
+
+    Rows are turned into Sections as soon as their closing tag is seen.
+    These callbacks run for every tag and text node of the page, so they
+    are kept to a few comparisons each.
+    """
+
+    def __init__(self):
+        self.sections = []
+        self.columns = None
+        self.width = 0
+        self.crn_pos = 0
+        self.absent = ()
+        self.found = False
+        # Nesting depth inside the results table, 0 when outside it
+        self.depth = 0
+        # Cell text of the current row, and colspans only once a spanning cell is seen
+        self.row = None
+        self.spans = None
+        self.header = False
+        # Text of the current cell, None outside cells
+        self.cell = None
+        # lxml still calls close() after a callback raises, keep the first error to report
+        self.error = None
+        # Set when the page says the search found nothing, only looked for until the table is found
+        self.no_classes = False
+
+    def start(self, tag, attrib):
+        if tag == 'td' or tag == 'th':
+            if self.depth == 1:
+                self.cell = ''
+                if tag == 'th':
+                    self.header = True
+                colspan = attrib.get('colspan')
+                if colspan is not None and colspan != '1':
+                    if self.spans is None:
+                        self.spans = [1] * len(self.row)
+                    self.spans.append(int(colspan))
+                elif self.spans is not None:
+                    self.spans.append(1)
+        elif tag == 'tr':
+            if self.depth == 1:
+                self.row = []
+                self.spans = None
+                self.header = False
+        elif tag == 'table':
+            if self.depth:
+                self.depth += 1
+            elif not self.found and attrib.get('class') == 'datadisplaytable':
+                self.found = True
+                self.depth = 1
+
+    def data(self, text):
+        if self.cell is not None:
+            self.cell += text
+        elif not self.found and NO_CLASSES in text:
+            self.no_classes = True
+
+    def end(self, tag):
+        if tag == 'td' or tag == 'th':
+            if self.cell is not None and self.depth == 1:
+                # \xa0 is used for empty cells, strip it along with whitespace and newlines
+                text = self.cell.strip()
+                if '\n' in text:
+                    text = " ".join(text.split())
+                self.row.append(text)
+                self.cell = None
+        elif tag == 'tr':
+            if self.row is not None and self.depth == 1:
+                row, self.row = self.row, None
+                if self.header:
+                    # Subject title rows come before the header, the header is the first row with a CRN column.
+                    # Multi subject results repeat both per subject.
+                    if self.columns is None and any(text.lower() == 'crn' for text in row):
+                        self.set_columns(row, self.spans or [1] * len(row))
+                elif self.columns is not None and self.error is None:
+                    self.add_row(row, self.spans)
+        elif tag == 'table' and self.depth:
+            self.depth -= 1
+
+    def set_columns(self, row, spans):
+        try:
+            self.columns, self.width = column_map(zip(row, spans))
+        except ValueError as e:
+            self.error = e
+            raise
+        self.crn_pos = next(pos for pos, name in self.columns if name == 'crn')
+        self.absent = tuple(set(Section.__slots__) - {name for _, name in self.columns})
+
+    def add_row(self, cells, spans):
+        if spans is not None or len(cells) != self.width:
+            # Spanning cells shift positions, only then are they worked out per cell
+            spread = [''] * self.width
+            position = 0
+            for text, colspan in zip(cells, spans or [1] * len(cells)):
+                if position < self.width:
+                    spread[position] = text
+                position += colspan
+            cells = spread
+        if not cells[self.crn_pos]:
+            # Subject separators and extra meeting time rows carry no CRN
+            return
+        section = object.__new__(Section)
+        for name in self.absent:
+            setattr(section, name, '')
+        try:
+            for pos, name in self.columns:
+                setattr(section, name, int(cells[pos]) if name in INT_FIELDS else cells[pos])
+        except ValueError:
+            logger.error(f"Non integer enrollment field in row: {cells}")
+            self.error = ValueError(f"Non integers found where expected in course table: {cells}")
+            raise self.error
+        self.sections.append(section)
+
+    def close(self):
+        if self.error is not None:
+            raise self.error
+        if not self.found:
+            if self.no_classes:
+                return self.sections
+            raise ValueError("Course table not found")
+        if self.columns is None:
+            raise ValueError("Course table header row not found")
+        return self.sections
+
+
+def parse_sections(html_source):
+    """
+    Parse the results page into Section records
+
+    :param html_source: HTML of the OSCAR "Sections Found" results page
+    :return: List of Section, empty if OSCAR found no classes for the search
+    :raises ValueError: If the table or its header is missing, the header
+                        lacks required columns or a numeric field is not
+                        an integer
+    """
+    parser = etree.HTMLParser(target=_TableTarget())
+    sections = etree.fromstring(html_source, parser)
+    logger.debug(f"Parsed {len(sections)} sections")
+    return sections
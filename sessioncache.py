@@ -0,0 +1,151 @@
+"""
+Authenticated session cache
+
+Logging in goes through buzzport, CAS and a Duo push that can take up to
+two minutes, so cookies from a successful login are kept encrypted on
+disk and reused across cycles and restarts. Before reuse the session is
+checked with one cheap request, and the full login only runs when that
+check fails.
+
+The cache is encrypted with a Fernet key from the SESSION_KEY environment
+variable. Create one with:
+python sessioncache.py --new-key
+and add SESSION_KEY=<key> to .env. Without a key cookies are only kept
+in memory for the life of the process.
+"""
+from cryptography.fernet import Fernet, InvalidToken
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+import threading
+import logging
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+
+class CookieCache:
+    """
+    Encrypted cookie file
+
+    :param path: File the encrypted cookies are written to
+    :param key: Fernet key, defaults to the SESSION_KEY environment variable
+    """
+
+    def __init__(self, path='session.bin', key=None):
+        self.path = path
+        if key is None:
+            load_dotenv(dotenv_path="./.env")
+            key = os.environ.get('SESSION_KEY')
+        self.fernet = Fernet(key) if key else None
+        if self.fernet is None:
+            logger.warning("SESSION_KEY not set, login cookies will not be kept between runs")
+
+    def load(self):
+        """
+        :return: Cookies as saved, None if missing, unreadable or encrypted with another key
+        """
+        if self.fernet is None or not os.path.isfile(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as fh:
+                return json.loads(self.fernet.decrypt(fh.read()).decode())
+        except (InvalidToken, ValueError) as e:
+            logger.warning(f"Ignoring unreadable session cache {self.path}: {e!r}")
+            return None
+
+    def save(self, cookies):
+        """
+        :param cookies: JSON serializable cookies, eg selenium's get_cookies()
+        """
+        if self.fernet is None:
+            return
+        token = self.fernet.encrypt(json.dumps(cookies).encode())
+        # Written next to the cache and renamed, so a crash never leaves half a file
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(token)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        """Remove the cache file"""
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+class SessionManager:
+    """
+    Hands out valid cookies, logging in only when needed
+
+    Thread safe, engines of one pool can share a manager so only one of
+    them ever logs in.
+
+    :param login: Callable performing the full login, returns cookies
+    :param check: Callable taking cookies, True if they are still accepted.
+                  Should cost a single request.
+    :param cache: CookieCache, defaults to session.bin keyed by SESSION_KEY
+    """
+
+    def __init__(self, login, check, cache=None):
+        self.login = login
+        self.check = check
+        self.cache = cache if cache is not None else CookieCache()
+        self.current = None
+        self.lock = threading.Lock()
+        self.stats = {'checks': 0, 'logins': 0, 'logins_avoided': 0}
+
+    def _valid(self, cookies):
+        self.stats['checks'] += 1
+        try:
+            return bool(self.check(cookies))
+        except Exception as e:
+            logger.warning(f"Session check failed: {e!r}")
+            return False
+
+    def get(self, rejected=None, verify=False):
+        """
+        Cookies for an authenticated session
+
+        Tried in order: cookies already handed out, the on disk cache, a full login.
+
+        :param rejected: Cookies the caller just found expired, never handed out again
+        :param verify: Check cookies already handed out as well, instead of trusting them
+        :return: Cookies
+        """
+        with self.lock:
+            current = self.current if self.current != rejected else None
+            if current is not None and (not verify or self._valid(current)):
+                if verify:
+                    self.stats['logins_avoided'] += 1
+                return current
+            cached = self.cache.load()
+            if cached and cached != rejected and cached != self.current and self._valid(cached):
+                self.stats['logins_avoided'] += 1
+                logger.info(f"Reusing cached session, {self.stats['logins_avoided']} logins avoided")
+                self.current = cached
+                return cached
+            logger.info("No valid session, logging in")
+            self.current = self.login()
+            self.stats['logins'] += 1
+            self.cache.save(self.current)
+            return self.current
+
+    def invalidate(self):
+        """Forget every stored session"""
+        with self.lock:
+            self.current = None
+            self.cache.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--new-key", action="store_true", help="Print a new SESSION_KEY")
+    parser.add_argument("--clear", metavar="PATH", help="Remove a session cache file")
+    args = parser.parse_args()
+    if args.new_key:
+        print(f"SESSION_KEY={Fernet.generate_key().decode()}")
+    if args.clear:
+        CookieCache(args.clear).clear()
@@ -0,0 +1,109 @@
+"""
+SMTP stub server
+
+Accepts mail on localhost and keeps it in memory, so notifications can
+be exercised without a real mail server. Any AUTH is accepted.
+
+Point the notifier at it with, in .env or the environment:
+
+    SMTP_HOST=127.0.0.1
+    SMTP_PORT=8025
+    SMTP_SSL=0
+
+Usage:
+python smtpstub.py [--port 8025]
+"""
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import argparse
+import threading
+import logging
+
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+
+class SMTPHandler(StreamRequestHandler):
+    """Minimal SMTP conversation: EHLO, AUTH, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+    # (mail from, [recipients], message text) for every message received
+    messages = []
+    # Number of connections accepted
+    connections = []
+    # Commands that get a 421 and a dropped connection, to test reconnects
+    fail_next = []
+
+    def reply(self, text):
+        self.wfile.write((text + "\r\n").encode())
+
+    def handle(self):
+        self.connections.append(self.client_address)
+        self.reply("220 smtpstub ready")
+        mail_from, rcpts = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if self.fail_next and self.fail_next[0] == verb:
+                self.fail_next.pop(0)
+                self.reply("421 stub closing connection")
+                return
+            if verb in ('EHLO', 'HELO'):
+                self.reply("250-smtpstub")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == 'AUTH':
+                self.reply("235 accepted")
+            elif verb == 'MAIL':
+                mail_from, rcpts = command.split(':', 1)[1].strip(' <>'), []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                rcpts.append(command.split(':', 1)[1].strip(' <>'))
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 end with .")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode(errors='replace')
+                    if data in ('.\r\n', '.\n', ''):
+                        break
+                    lines.append(data[1:] if data.startswith('..') else data)
+                self.messages.append((mail_from, rcpts, "".join(lines)))
+                logger.debug(f"Message from {mail_from} to {rcpts}")
+                self.reply("250 queued")
+            elif verb in ('RSET', 'NOOP'):
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class StubServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(port=0, background=True):
+    """
+    Start an SMTP stub
+
+    :param port: Port to listen on, 0 picks a free one
+    :param background: Serve from a daemon thread and return immediately
+    :return: Server instance, received mail is in server.RequestHandlerClass.messages
+    """
+    handler = type("StubHandler", (SMTPHandler,), {"messages": [], "connections": [], "fail_next": []})
+    server = StubServer(("127.0.0.1", port), handler)
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+    print(f"Accepting mail on 127.0.0.1:{args.port}")
+    serve(args.port, background=False)
@@ -0,0 +1,168 @@
+"""
+Term discovery
+
+Watches the term <select> of OSCAR's Look Up Classes page and keeps the
+options seen in the terms table. A term appearing there is reported
+and, in etracker, added to the tracked targets straight away, so the
+first students registering for a new term are not missed.
+
+Fetching the term list is a single page load, much cheaper than a
+search, so it can be polled every few minutes. Replaces the pickle
+files of coursexp.avail_sems.
+
+Usage:
+python termwatch.py [--db OMSCS_CA.db] [--engine http]
+or python omscs.py discover-terms
+"""
+from collections import namedtuple
+import datetime
+import logging
+
+import lxml.html
+
+from dbwriter import timestamp
+
+# Logging setup as child of __main__
+logger = logging.getLogger('__main__.' + __name__)
+logger.setLevel(logging.DEBUG)
+
+# Look Up Classes term selection page
+TERM_PAGE = 'bwskfcls.p_sel_crse_search'
+# The registration and the public schedule forms name the select differently
+TERM_SELECTS = ('p_term', 'term_in')
+
+TERMS_SCHEMA = """CREATE TABLE IF NOT EXISTS terms(
+    term TEXT NOT NULL PRIMARY KEY,
+    text TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    dropped TEXT
+) WITHOUT ROWID"""
+
+TermChanges = namedtuple('TermChanges', ('terms', 'new', 'dropped'))
+
+
+def parse_terms(html_source):
+    """
+    Options of the term select
+
+    :param html_source: Look Up Classes page source
+    :return: List of (term value, option text), page order. Placeholder
+             options without a term code are left out.
+    """
+    if not html_source.strip():
+        raise ValueError("Empty page")
+    root = lxml.html.fromstring(html_source)
+    for name in TERM_SELECTS:
+        selects = root.xpath(f"//select[@name='{name}']")
+        if selects:
+            return [(option.get('value').strip(), ' '.join(option.text_content().split()))
+                    for option in selects[0].iter('option') if (option.get('value') or '').strip().isdigit()]
+    raise ValueError("No term select on page")
+
+
+def record_terms(conn, options, now=None):
+    """
+    Store the term options seen and compare them with the previous ones
+
+    The first call on an empty terms table only records the options, so
+    terms that were already listed are not reported as new.
+
+    :param conn: sqlite3 connection in autocommit mode
+    :param options: List of (term value, option text) from parse_terms
+    :param now: Time of the check, datetime, defaults to now
+    :return: TermChanges, new and dropped are lists of (term value, option text)
+    """
+    ts = timestamp(now or datetime.datetime.now())
+    conn.execute(TERMS_SCHEMA)
+    known = {term: (text, dropped) for term, text, dropped in conn.execute("SELECT term, text, dropped FROM terms")}
+    seen = dict(options)
+    if known:
+        new = [(term, text) for term, text in options if term not in known or known[term][1] is not None]
+    else:
+        new = []
+    dropped = [(term, text) for term, (text, gone) in known.items() if gone is None and term not in seen]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany("INSERT OR IGNORE INTO terms VALUES (?, ?, ?, ?, NULL)",
+                         [(term, text, ts, ts) for term, text in options])
+        conn.executemany("UPDATE terms SET text=?, last_seen=?, dropped=NULL WHERE term=?",
+                         [(text, ts, term) for term, text in options])
+        conn.executemany("UPDATE terms SET dropped=? WHERE term=?", [(ts, term) for term, _ in dropped])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return TermChanges(options, new, dropped)
+
+
+def known_terms(conn, include_dropped=False):
+    """
+    :param conn: sqlite3 connection
+    :return: List of (term value, option text, first seen), newest term first
+    """
+    conn.execute(TERMS_SCHEMA)
+    return conn.execute("SELECT term, text, first_seen FROM terms WHERE ? OR dropped IS NULL ORDER BY term DESC",
+                        (include_dropped,)).fetchall()
+
+
+def latest_term(conn):
+    """
+    :param conn: sqlite3 connection, may be read only
+    :return: Newest term value still listed, None if no terms were recorded
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='terms'").fetchone() is None:
+        return None
+    row = conn.execute("SELECT max(term) FROM terms WHERE dropped IS NULL").fetchone()
+    return row[0]
+
+
+class TermWatcher:
+    """
+    Periodic term check
+
+    :param conn: sqlite3 connection the terms table is kept in, normally the DBWriter's
+    :param fetch: Callable returning the current (term value, option text) options,
+                  eg a ScrapeEngine's terms method
+    :param on_new: Callables taking a new term value, eg adding it to the tracked targets
+    :param notify: Email when terms appear or disappear
+    """
+
+    def __init__(self, conn, fetch, on_new=(), notify=True):
+        self.conn = conn
+        self.fetch = fetch
+        self.on_new = list(on_new)
+        self.notify = notify
+
+    def poll(self, now=None):
+        """
+        Fetch the term options once and act on any change
+
+        :return: TermChanges
+        """
+        changes = record_terms(self.conn, self.fetch(), now)
+        if changes.new:
+            logger.info(f"New terms: {changes.new}")
+        if changes.dropped:
+            logger.info(f"Dropped terms: {changes.dropped}")
+        if self.notify and (changes.new or changes.dropped):
+            from notify import default_notifier
+            body = "\n".join([f"New: {value} {text}" for value, text in changes.new] +
+                             [f"Dropped: {value} {text}" for value, text in changes.dropped] +
+                             ["", "All terms:"] + [f"{value} {text}" for value, text in changes.terms])
+            default_notifier().notify("OSCAR term options changed", body)
+        for term, _ in changes.new:
+            for callback in self.on_new:
+                try:
+                    callback(term)
+                except Exception:
+                    logger.exception(f"Handling new term {term} failed")
+        return changes
+
+
+if __name__ == "__main__":
+    # Same as python omscs.py discover-terms, without importing this file a second time
+    import sys
+    import omscs
+    sys.modules['termwatch'] = sys.modules['__main__']
+    omscs.main(["discover-terms"] + sys.argv[1:])
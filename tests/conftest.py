@@ -0,0 +1,40 @@
+"""
+Shared fixtures
+
+Run from the repository root:
+python -m pytest tests
+"""
+import datetime
+import os
+import sys
+import logging
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.getLogger('__main__').addHandler(logging.NullHandler())
+
+from sections import Section  # noqa: E402
+
+START = datetime.datetime(2019, 1, 7, 9, 0)
+
+
+def make_section(crn, subj='CS', crse='6250', cmp='O', cap=100, act=0, wl_act=0, sec=None, **fields):
+    """Section with consistent remaining seats, only the fields a test cares about need giving"""
+    return Section(crn=crn, subj=subj, crse=crse, sec=sec or f"{cmp}01", cmp=cmp, title=f"{subj} {crse}",
+                   cap=cap, act=act, rem=cap - act, wl_cap=100, wl_act=wl_act, wl_rem=100 - wl_act, **fields)
+
+
+@pytest.fixture
+def section():
+    return make_section
+
+
+@pytest.fixture
+def start():
+    return START
+
+
+@pytest.fixture
+def dbname(tmp_path):
+    return str(tmp_path / 'test.db')
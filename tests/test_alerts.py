@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+
+from alerts import RULES, AlertEngine, add_subscription, remove_subscription
+from dbwriter import DBWriter, connect
+
+LATER = datetime.timedelta(minutes=15)
+
+
+@pytest.fixture
+def writer(dbname, section, start):
+    writer = DBWriter(dbname, term='201902')
+    writer.write([section(1, act=100), section(2, act=100), section(3, crse='6035', act=100)], start)
+    yield writer
+    writer.close()
+
+
+@pytest.fixture
+def delivered(writer):
+    delivered = []
+    engine = AlertEngine(writer.conn, deliver=delivered.append)
+    writer.listeners.append(engine.observe)
+    return delivered
+
+
+def subscribe(dbname, *args, **kwargs):
+    """Subscribe from another connection, as the alerts.py CLI does"""
+    conn = connect(dbname)
+    subscription_id = add_subscription(conn, *args, **kwargs)
+    conn.close()
+    return subscription_id
+
+
+@pytest.mark.parametrize('rule, old, new, threshold, fires', [
+    ('seats_open', (100, 100, 0, 100, 0, 100), (100, 99, 1, 100, 0, 100), 1, True),
+    ('seats_open', (100, 98, 2, 100, 0, 100), (100, 97, 3, 100, 0, 100), 1, False),
+    ('seats_open', (100, 99, 1, 100, 0, 100), (100, 100, 0, 100, 0, 100), 1, False),
+    ('waitlist_moved', (100, 100, 0, 100, 10, 90), (100, 100, 0, 100, 6, 94), 5, False),
+    ('waitlist_moved', (100, 100, 0, 100, 10, 90), (100, 100, 0, 100, 15, 85), 5, True),
+    ('cap_increased', (100, 100, 0, 100, 0, 100), (110, 100, 10, 100, 0, 100), 1, True),
+])
+def test_rules(rule, old, new, threshold, fires):
+    assert RULES[rule](old, new, threshold) == fires
+
+
+def test_seats_open_by_crn_and_course(writer, delivered, dbname, section, start):
+    by_crn = subscribe(dbname, '201902', 'seats_open', 'crn@example.com', crn=1)
+    by_course = subscribe(dbname, '201902', 'seats_open', 'course@example.com', course='cs  6250')
+    writer.write([section(1, act=99), section(2, act=99), section(3, crse='6035', act=99)], start + LATER)
+    fired = sorted((alert.subscription.id, alert.section.crn) for alert in delivered)
+    # CS 6035 is not watched
+    assert fired == [(by_crn, 1), (by_course, 1), (by_course, 2)]
+    assert delivered[0].old[2] == 0 and delivered[0].new[2] == 1
+    last_fired = writer.conn.execute("SELECT count(*) FROM subscriptions WHERE last_fired IS NOT NULL").fetchone()
+    assert last_fired == (2,)
+
+
+def test_subscription_changes_are_reloaded(writer, delivered, dbname, section, start):
+    subscription_id = subscribe(dbname, '201902', 'seats_open', 'me@example.com', crn=1)
+    writer.write([section(1, act=99)], start + LATER)
+    assert len(delivered) == 1
+    conn = connect(dbname)
+    remove_subscription(conn, subscription_id)
+    conn.close()
+    writer.write([section(1, act=100)], start + 2 * LATER)
+    writer.write([section(1, act=99)], start + 3 * LATER)
+    assert len(delivered) == 1
+
+
+def test_unchanged_sections_fire_nothing(writer, delivered, dbname, section, start):
+    subscribe(dbname, '201902', 'waitlist_moved', 'me@example.com', course='CS 6250', threshold=0)
+    writer.write([section(1, act=100), section(2, act=100)], start + LATER)
+    assert delivered == []
+
+
+def test_subscription_needs_one_of_crn_or_course(writer):
+    with pytest.raises(ValueError):
+        add_subscription(writer.conn, '201902', 'seats_open', 'me@example.com')
+    with pytest.raises(ValueError):
+        add_subscription(writer.conn, '201902', 'seats_open', 'me@example.com', crn=1, course='CS 6250')
+    with pytest.raises(ValueError):
+        add_subscription(writer.conn, '201902', 'seats_closed', 'me@example.com', crn=1)
@@ -0,0 +1,74 @@
+import datetime
+
+import analytics
+from dbwriter import DBWriter
+
+
+def course_row(conn, term='201902', subj='CS', crse='6250'):
+    return conn.execute("SELECT sections, cap, act, wl_act FROM rollup_courses WHERE term=? AND subj=? AND crse=?",
+                        (term, subj, crse)).fetchone()
+
+
+def tables(conn):
+    return [conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2, 3, 4").fetchall()
+            for table in ('rollup_courses', 'rollup_hourly', 'rollup_daily')]
+
+
+def write_two_campuses(writer, section, start):
+    """CS 6250 tracked as an online and an Atlanta target, each scraped every 15 minutes"""
+    acts = [(10, 5), (12, 5), (12, 4), (15, 4)]
+    for i, (online, atlanta) in enumerate(acts):
+        when = start + datetime.timedelta(minutes=15 * i)
+        writer.write([section(1, cmp='O', act=online), section(2, cmp='O', act=1, crse='6200')], when,
+                     term='201902', subject='CS', campus='O')
+        writer.write([section(3, cmp='A', act=atlanta)], when + datetime.timedelta(minutes=1),
+                     term='201902', subject='CS', campus='A')
+
+
+def test_course_totals_span_targets(dbname, section, start):
+    writer = DBWriter(dbname, term='201902')
+    rollups = analytics.Rollups(writer.conn)
+    writer.listeners.append(rollups.observe)
+    write_two_campuses(writer, section, start)
+    assert course_row(writer.conn) == (2, 200, 19, 0)
+    hourly = writer.conn.execute("SELECT bucket, added, dropped, act FROM rollup_hourly "
+                                 "WHERE crse='6250' ORDER BY bucket").fetchall()
+    # 10 online at first sight, then the Atlanta 5 as the other target is first written, +2, -1, +3.
+    # Each target's partial totals replacing the other's would add and drop 10 or more every scrape.
+    assert hourly == [('2019-01-07 09', 10, 1, 19)]
+    writer.close()
+
+
+def test_rebuild_matches_incremental(dbname, section, start):
+    writer = DBWriter(dbname, term='201902')
+    rollups = analytics.Rollups(writer.conn)
+    writer.listeners.append(rollups.observe)
+    write_two_campuses(writer, section, start)
+    incremental = tables(writer.conn)
+    assert analytics.Rollups(writer.conn).rebuild('201902') == 8
+    assert tables(writer.conn) == incremental
+    writer.close()
+
+
+def test_restart_keeps_other_targets(dbname, section, start):
+    writer = DBWriter(dbname, term='201902')
+    writer.listeners.append(analytics.Rollups(writer.conn).observe)
+    write_two_campuses(writer, section, start)
+    # A new process only sees the online scrape, the Atlanta counts come from the database
+    writer.listeners[:] = [analytics.Rollups(writer.conn).observe]
+    writer.write([section(1, cmp='O', act=16), section(2, cmp='O', act=1, crse='6200')],
+                 start + datetime.timedelta(hours=2), term='201902', subject='CS', campus='O')
+    assert course_row(writer.conn) == (2, 200, 20, 0)
+    writer.close()
+
+
+def test_section_gone_from_its_target(dbname, section, start):
+    writer = DBWriter(dbname, term='201902')
+    writer.listeners.append(analytics.Rollups(writer.conn).observe)
+    write_two_campuses(writer, section, start)
+    writer.write([section(3, cmp='A', act=4)], start + datetime.timedelta(hours=2), term='201902', subject='CS',
+                 campus='A')
+    writer.write([section(2, cmp='O', act=1, crse='6200')], start + datetime.timedelta(hours=2, minutes=1),
+                 term='201902', subject='CS', campus='O')
+    assert course_row(writer.conn) == (1, 100, 4, 0)
+    writer.close()
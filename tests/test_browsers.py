@@ -0,0 +1,104 @@
+import pytest
+from selenium.common.exceptions import InvalidSessionIdException, WebDriverException
+
+import browsers
+import metrics
+from browsers import ManagedBrowser
+
+
+class FakeDriver:
+    """Counts quits, nothing else of a webdriver is used by ManagedBrowser"""
+
+    def __init__(self):
+        self.quits = 0
+
+    def quit(self):
+        self.quits += 1
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, 'REGISTRY', registry)
+    return registry
+
+
+@pytest.fixture
+def started():
+    return []
+
+
+@pytest.fixture
+def factory(started):
+    def factory():
+        started.append(FakeDriver())
+        return started[-1]
+    return factory
+
+
+def recycles(registry):
+    return {labels['reason']: value for name, labels, value in registry.samples()
+            if name == 'omscs_browser_recycles_total'}
+
+
+def run(managed, error=None):
+    try:
+        with managed.run():
+            if error is not None:
+                raise error
+    except type(error):
+        pass
+
+
+def test_recycled_after_max_runs(registry, factory, started):
+    managed = ManagedBrowser(factory, max_runs=3, max_rss=None)
+    for _ in range(7):
+        run(managed)
+    assert len(started) == 3 and [driver.quits for driver in started] == [1, 1, 0]
+    assert recycles(registry) == {'runs': 2}
+
+
+def test_recycled_above_max_rss(registry, factory, started, monkeypatch):
+    rss = {}
+    monkeypatch.setattr(browsers, 'browser_rss', lambda browser: rss.get(browser, 2**20))
+    managed = ManagedBrowser(factory, max_runs=None, max_rss=2**30)
+    run(managed)
+    rss[started[0]] = 2**31
+    run(managed)
+    run(managed)
+    assert len(started) == 2 and started[0].quits == 1
+    assert recycles(registry) == {'memory': 1}
+
+
+def test_recycled_after_errors_in_a_row(registry, factory, started):
+    managed = ManagedBrowser(factory, max_runs=None, max_rss=None, max_errors=2)
+    run(managed, ValueError("missing element"))
+    run(managed)
+    run(managed, ValueError("missing element"))
+    assert len(started) == 1
+    run(managed, ValueError("missing element"))
+    assert started[0].quits == 1 and managed.current is None
+    assert recycles(registry) == {'errors': 1}
+
+
+@pytest.mark.parametrize('error', [InvalidSessionIdException("gone"),
+                                   WebDriverException("TypeError: can't access dead object")])
+def test_recycled_after_fatal_error(registry, factory, started, error):
+    managed = ManagedBrowser(factory, max_runs=None, max_rss=None)
+    with pytest.raises(WebDriverException):
+        with managed.run():
+            raise error
+    assert started[0].quits == 1
+    assert recycles(registry) == {'fatal': 1}
+
+
+def test_failed_quit_still_replaces(factory, started):
+    managed = ManagedBrowser(factory, max_runs=None, max_rss=None)
+    managed.get()
+
+    def broken():
+        raise WebDriverException("already gone")
+
+    started[0].quit = broken
+    managed.recycle()
+    assert managed.get() is started[1]
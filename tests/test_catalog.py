@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+from catalog import FieldChange, catalog_at, changes, versions
+from dbwriter import DBWriter, timestamp
+
+HOUR = datetime.timedelta(hours=1)
+
+
+@pytest.fixture
+def writer(dbname, section, start):
+    writer = DBWriter(dbname, term='201902')
+    writer.write([section(1, instructor='Staff'), section(2, subj='CSE', instructor='Vuduc')], start)
+    # Counts alone changed
+    writer.write([section(1, act=5, instructor='Staff'), section(2, subj='CSE', instructor='Vuduc')], start + HOUR)
+    writer.write([section(1, act=5, instructor='Feamster'), section(2, subj='CSE', instructor='Vuduc')],
+                 start + 2 * HOUR)
+    yield writer
+    writer.close()
+
+
+def test_versions_follow_course_info(writer, section, start):
+    found = versions(writer.conn, '201902', 1)
+    assert [(row['instructor'], row['valid_from'], row['valid_to']) for row in found] == [
+        ('Staff', timestamp(start), timestamp(start + 2 * HOUR)),
+        ('Feamster', timestamp(start + 2 * HOUR), None)]
+    assert found[0]['hash'] != found[1]['hash']
+    assert len(versions(writer.conn, '201902', 2)) == 1
+
+
+def test_hashes_survive_a_new_writer(writer, dbname, section, start):
+    # Loads the hashes stored by the first writer
+    again = DBWriter(dbname, term='201902')
+    again.write([section(1, instructor='Feamster'), section(2, subj='CSE', instructor='Vuduc')], start + 3 * HOUR)
+    # Changed back, a new version again
+    again.write([section(1, instructor='Staff'), section(2, subj='CSE', instructor='Vuduc')], start + 4 * HOUR)
+    assert [row['instructor'] for row in versions(again.conn, '201902', 1)] == ['Staff', 'Feamster', 'Staff']
+    assert len(versions(again.conn, '201902', 2)) == 1
+    again.close()
+
+
+def test_changes(writer, start):
+    change = FieldChange(1, timestamp(start + 2 * HOUR), 'instructor', 'Staff', 'Feamster')
+    assert changes(writer.conn, '201902') == [change]
+    assert changes(writer.conn, '201902', crn=1, field='instructor') == [change]
+    assert changes(writer.conn, '201902', field='title') == []
+    assert changes(writer.conn, '201902', since=start + 3 * HOUR) == []
+    with pytest.raises(ValueError):
+        changes(writer.conn, '201902', field='act')
+
+
+@pytest.mark.parametrize('offset, instructors', [
+    (-HOUR, {}),
+    (0 * HOUR, {1: 'Staff', 2: 'Vuduc'}),
+    (1.5 * HOUR, {1: 'Staff', 2: 'Vuduc'}),
+    (2 * HOUR, {1: 'Feamster', 2: 'Vuduc'}),
+    (10 * HOUR, {1: 'Feamster', 2: 'Vuduc'}),
+])
+def test_catalog_at(writer, start, offset, instructors):
+    assert {row['crn']: row['instructor'] for row in catalog_at(writer.conn, '201902', start + offset)} == instructors
+
+
+def test_catalog_at_of_a_subject(writer, start):
+    assert [row['crn'] for row in catalog_at(writer.conn, '201902', start + HOUR, subject='CSE')] == [2]
@@ -0,0 +1,91 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pytest
+
+import colexport
+from dbwriter import DBWriter, connect
+
+LATER = datetime.timedelta(minutes=15)
+
+
+@pytest.fixture(params=['full', 'changes'])
+def writer(request, dbname):
+    writer = DBWriter(dbname, term='201902', store=request.param)
+    yield writer
+    writer.close()
+
+
+def export(dbname, out):
+    conn = connect(dbname, readonly=True)
+    try:
+        return colexport.export_term(conn, '201902', out)
+    finally:
+        conn.close()
+
+
+def test_incremental_export(writer, dbname, tmp_path, section, start):
+    out = str(tmp_path / 'export')
+    writer.write([section(20), section(10, act=5)], start)
+    writer.write([section(20), section(10, act=6)], start + LATER)
+    assert export(dbname, out) == 4
+    assert export(dbname, out) == 0
+    writer.write([section(10, act=7), section(30, act=1)], start + 2 * LATER)
+    assert export(dbname, out) == 2
+
+    directory = os.path.join(out, '201902')
+    with open(os.path.join(directory, 'manifest.json')) as fh:
+        manifest = json.load(fh)
+    assert manifest['rows'] == 6 and manifest['last_ts'].startswith('2019-01-07 09:30')
+    columns = colexport.load(out, '201902')
+    # Ids are given in order of first sight and kept by the second export
+    assert sorted(columns['crns'][:2]) == [10, 20] and columns['crns'][2] == 30
+    times = columns['ts'].astype('datetime64[m]').astype(object)
+    rows = sorted(zip(times, columns['crns'][columns['crn_id']], columns['act']))
+    assert rows == [(start, 10, 5), (start, 20, 0), (start + LATER, 10, 6), (start + LATER, 20, 0),
+                    (start + 2 * LATER, 10, 7), (start + 2 * LATER, 30, 1)]
+    assert list(times) == sorted(times)
+    with open(os.path.join(directory, 'sections.json')) as fh:
+        assert [row[0] for row in json.load(fh)] == list(columns['crns'])
+
+
+def test_header_is_fixed_size(tmp_path):
+    writer = colexport.ColumnWriter(str(tmp_path), 0)
+    for rows in (3, 100000):
+        writer.append({name: np.zeros(rows, dtype) for name, dtype in colexport.COLUMNS})
+    for name, dtype in colexport.COLUMNS:
+        path = writer.path(name)
+        assert os.path.getsize(path) == colexport.HEADER_SIZE + 100003 * dtype.itemsize
+        with open(path, 'rb') as fh:
+            np.lib.format.read_magic(fh)
+            shape, _, read_dtype = np.lib.format.read_array_header_1_0(fh)
+            assert (fh.tell(), shape, read_dtype) == (colexport.HEADER_SIZE, (100003,), dtype)
+
+
+def test_interrupted_export_is_cut_off(tmp_path):
+    writer = colexport.ColumnWriter(str(tmp_path), 0)
+    writer.append({name: np.arange(5).astype(dtype) for name, dtype in colexport.COLUMNS})
+    # The manifest was last written at 3 rows
+    writer = colexport.ColumnWriter(str(tmp_path), 3)
+    writer.append({name: np.full(1, 9, dtype) for name, dtype in colexport.COLUMNS})
+    assert list(np.load(writer.path('act'))) == [0, 1, 2, 9]
+
+
+def test_chunks_end_on_whole_scrapes(writer, dbname, tmp_path, section, start, monkeypatch):
+    monkeypatch.setattr(colexport, 'CHUNK_ROWS', 3)
+    out = str(tmp_path / 'export')
+    for i in range(3):
+        writer.write([section(10, act=i), section(20, act=i)], start + i * LATER)
+    manifests = []
+    write_json = colexport._write_json
+
+    def keep_manifest(path, data):
+        if path.endswith('manifest.json'):
+            manifests.append(dict(data))
+        write_json(path, data)
+
+    monkeypatch.setattr(colexport, '_write_json', keep_manifest)
+    assert export(dbname, out) == 6
+    assert [manifest['rows'] for manifest in manifests] == [4, 6]
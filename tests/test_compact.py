@@ -0,0 +1,48 @@
+import datetime
+
+import compact
+import enrollhist
+import metrics
+from dbwriter import connect
+from test_enrollhist import reconstructed, write
+
+
+def test_metrics_thinned(dbname, start):
+    conn = connect(dbname)
+    registry = metrics.Registry()
+    # Three days of snapshots every 10 minutes
+    for i in range(3 * 24 * 6):
+        registry.inc('omscs_rows_written_total', 10)
+        metrics.store(conn, str(start + datetime.timedelta(minutes=10 * i)), registry)
+    now = start + datetime.timedelta(days=3)
+    compact.compact(conn, keep_days=1, daily_days=2, now=now, pause=0)
+    stored = conn.execute("SELECT ts, value FROM metrics ORDER BY ts").fetchall()
+    daily, hourly, full = ([(ts, value) for ts, value in stored if low <= ts < high] for low, high in (
+        ('', '2019-01-08'), ('2019-01-08', '2019-01-09 09:00'), ('2019-01-09 09:00', '9999')))
+    # Before daily_days the last snapshot of the day, then the last of each hour, all of the last keep_days
+    assert daily == [('2019-01-07 23:50:00', 10 * 15 * 6)]
+    assert len(hourly) == 24 + 9 and all(ts[14:16] == '50' for ts, _ in hourly)
+    assert len(full) == 24 * 6 and full[-1][1] == 10 * 3 * 24 * 6
+    # Running again changes nothing
+    compact.compact(conn, keep_days=1, daily_days=2, now=now, pause=0)
+    assert conn.execute("SELECT ts, value FROM metrics ORDER BY ts").fetchall() == stored
+    conn.close()
+
+
+def test_compaction_keeps_what_enrollhist_returns(tmp_path, section, start):
+    writer = write(str(tmp_path / 'full.db'), section, start, 'full')
+    before = reconstructed(writer.conn, start)
+    rows = writer.conn.execute("SELECT count(*) FROM enrollment").fetchone()[0]
+    now = start + datetime.timedelta(days=2)
+    dropped = compact.compact(writer.conn, keep_days=1, daily_days=1.25, now=now, pause=0)['201902'].dropped
+    assert dropped > rows / 4
+    assert writer.conn.execute("SELECT count(*) FROM enrollment").fetchone()[0] == rows - dropped
+    assert writer.conn.execute("SELECT DISTINCT resolution FROM enrollment_rollups ORDER BY 1").fetchall() == \
+        [('day',), ('hour',)]
+    assert reconstructed(writer.conn, start) == before
+    # Scrapes keep being written after compaction and read the same as uncompacted ones
+    later = start + datetime.timedelta(hours=40)
+    writer.write([section(1, act=99)], later, subject='CS', campus='O')
+    assert enrollhist.history(writer.conn, '201902', 1)[-1] == (str(later), (100, 99, 1, 100, 0, 100))
+    assert enrollhist.snapshot_at(writer.conn, '201902', later)[1][1] == (100, 99, 1, 100, 0, 100)
+    writer.close()
@@ -0,0 +1,51 @@
+import pytest
+
+from coursexp import dbadd
+from dbwriter import DBWriter
+from migrate import migrate_legacy
+
+
+def test_write_needs_a_term(dbname, section, start):
+    writer = DBWriter(dbname)
+    with pytest.raises(ValueError):
+        writer.write([section(1)], start)
+    assert writer.write([section(1)], start, term='201908') == 1
+    assert writer.conn.execute("SELECT DISTINCT term FROM enrollment").fetchall() == [('201908',)]
+    writer.close()
+
+
+@pytest.mark.parametrize('layout', ['long', 'legacy'])
+def test_dbadd_needs_a_term(dbname, section, start, layout):
+    with pytest.raises(ValueError):
+        dbadd([section(1)], start, dbname=dbname)
+    writer = DBWriter(dbname, layout=layout)
+    dbadd([section(1)], start, writer=writer, term='201908')
+    tables = {name for (name,) in writer.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert 'F19_1' in tables if layout == 'legacy' else 'enrollment' in tables
+    writer.close()
+
+
+def test_failing_listener_does_not_fail_the_write(dbname, section, start, caplog):
+    writer = DBWriter(dbname, term='201902')
+    seen = []
+
+    def broken(term, sections, scrape_time, subject='', campus=''):
+        raise RuntimeError("listener bug")
+
+    writer.listeners += [broken, lambda *args, **kwargs: seen.append((args[0], kwargs))]
+    assert writer.write([section(1), section(2)], start, subject='CS', campus='O') == 2
+    # Committed, and the listeners after the failing one still ran
+    assert writer.conn.execute("SELECT count(*) FROM enrollment").fetchone()[0] == 2
+    assert seen == [('201902', {'subject': 'CS', 'campus': 'O'})]
+    assert any(record.exc_info and 'listener bug' in str(record.exc_info[1]) for record in caplog.records)
+    assert writer.write([section(1, act=5)], start.replace(hour=10), subject='CS', campus='O') == 1
+    writer.close()
+
+
+def test_migrate_needs_a_term(dbname, section, start):
+    writer = DBWriter(dbname, term='201908', layout='legacy')
+    writer.write([section(1), section(2)], start)
+    writer.close()
+    with pytest.raises(ValueError):
+        migrate_legacy(dbname)
+    assert migrate_legacy(dbname, term='201908') == (2, 2)
@@ -0,0 +1,97 @@
+import types
+
+import pytest
+
+import engines
+import oscarsim
+from engines import HttpEngine, SessionExpired, scrape_with_retry
+from pagearchive import PageArchive
+from sessioncache import CookieCache
+
+
+@pytest.fixture
+def sim():
+    simulation = oscarsim.Simulation(sections=20, speed=1)
+    server = oscarsim.serve(simulation)
+    yield simulation
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def engine(sim):
+    engine = HttpEngine(base_url=sim.base_url, login_with=lambda: oscarsim.http_login(sim.url), timeout=5)
+    engine.login()
+    yield engine
+    engine.close()
+
+
+def test_scrape(engine):
+    sections = engine.scrape('201902', 'CS', 'O')
+    assert len(sections) == 20
+    assert {sec.cmp for sec in sections} == {'O'}
+
+
+def test_no_classes_found(engine):
+    assert engine.scrape('201902', 'ISYE', 'O') == []
+
+
+def test_expired_session_logs_in_again(sim, engine):
+    for token in list(sim.sessions):
+        sim.expire(token)
+    with pytest.raises(SessionExpired):
+        engine.scrape('201902', 'CS', 'O')
+    sections, _ = scrape_with_retry(engine, '201902', 'CS', 'O')
+    assert len(sections) == 20
+
+
+def test_login_form_without_redirect(engine, monkeypatch):
+    form = oscarsim._page("GT Login Service", '<input id="username" name="username" type="text">')
+    monkeypatch.setattr(engine, 'search_form', lambda *args: types.SimpleNamespace(text=form))
+    with pytest.raises(SessionExpired):
+        engine.scrape('201902', 'CS', 'O')
+
+
+def test_unexpected_page_is_not_a_login(engine, monkeypatch):
+    page = oscarsim._page("Class Schedule Listing", "<p>Service temporarily unavailable</p>")
+    monkeypatch.setattr(engine, 'search_form', lambda *args: types.SimpleNamespace(text=page))
+    with pytest.raises(ValueError):
+        engine.scrape('201902', 'CS', 'O')
+
+
+def test_only_results_are_archived(engine, monkeypatch, tmp_path):
+    engine.archive = PageArchive(str(tmp_path / 'pages.db'))
+    form = oscarsim._page("GT Login Service", '<input id="username" name="username" type="text">')
+    search_form = engine.search_form
+    monkeypatch.setattr(engine, 'search_form', lambda *args: types.SimpleNamespace(text=form))
+    with pytest.raises(SessionExpired):
+        engine.scrape('201902', 'CS', 'O')
+    assert engine.archive.pages('201902') == []
+    monkeypatch.setattr(engine, 'search_form', search_form)
+    engine.scrape('201902', 'CS', 'O')
+    assert len(engine.archive.pages('201902')) == 1
+    engine.archive.close()
+
+
+class FakeBrowser:
+    """Stays on the CAS login page whatever it loads, as after a failed login"""
+    title = "GT Login Service"
+    current_url = "https://login.gatech.edu/cas/login"
+
+    def get(self, url):
+        pass
+
+    def get_cookies(self):
+        return []
+
+    def add_cookie(self, cookie):
+        pass
+
+
+def test_failed_selenium_login(monkeypatch, tmp_path):
+    # gtlogin logs, emails and swallows its own errors
+    monkeypatch.setattr(engines, 'gtlogin', lambda browser: None)
+    engine = engines.SeleniumEngine(browser=FakeBrowser(), cache=CookieCache(str(tmp_path / 'session.bin')))
+    with pytest.raises(SessionExpired):
+        engine.login()
+    assert engine.cookies is None
@@ -0,0 +1,64 @@
+import datetime
+import random
+
+import pytest
+
+import enrollhist
+from dbwriter import DBWriter
+
+CRNS = {'O': range(1, 9), 'A': range(20, 24)}
+
+
+def scrapes(section, start, n=60):
+    """
+    Two campus targets scraped every 30 minutes, a few seats changing each time
+
+    CRN 3 is missing from scrapes 20 to 29, CRN 22 from 40 on and CRN 9 only appears at 50.
+    """
+    rng = random.Random(0)
+    acts = {crn: rng.randrange(50) for crns in CRNS.values() for crn in crns}
+    acts[9] = 0
+    for i in range(n):
+        when = start + datetime.timedelta(minutes=30 * i)
+        for crn in rng.sample(sorted(acts), 3):
+            acts[crn] = min(acts[crn] + 1, 100)
+        for cmp, crns in sorted(CRNS.items()):
+            listed = [crn for crn in crns if not (crn == 3 and 20 <= i < 30) and not (crn == 22 and i >= 40)]
+            if cmp == 'O' and i >= 50:
+                listed.append(9)
+            yield [section(crn, cmp=cmp, act=acts[crn]) for crn in listed], when, cmp
+            when += datetime.timedelta(minutes=1)
+
+
+def write(dbname, section, start, store):
+    writer = DBWriter(dbname, term='201902', store=store)
+    for sections, when, cmp in scrapes(section, start):
+        writer.write(sections, when, subject='CS', campus=cmp)
+    return writer
+
+
+def reconstructed(conn, start):
+    end = start + datetime.timedelta(hours=31)
+    crns = [crn for crns in CRNS.values() for crn in crns] + [9]
+    return ([enrollhist.history(conn, '201902', crn) for crn in crns],
+            [enrollhist.series(conn, '201902', crn, start, end, datetime.timedelta(minutes=20)) for crn in crns],
+            [enrollhist.snapshot_at(conn, '201902', start + datetime.timedelta(minutes=m)) for m in range(0, 1900, 95)],
+            list(enrollhist.change_counts(conn, '201902')))
+
+
+@pytest.fixture
+def full(tmp_path, section, start):
+    writer = write(str(tmp_path / 'full.db'), section, start, 'full')
+    yield writer.conn
+    writer.close()
+
+
+def test_change_only_store_reconstructs_every_scrape(full, tmp_path, section, start):
+    changes = write(str(tmp_path / 'changes.db'), section, start, 'changes')
+    assert enrollhist.uses_runs(changes.conn, '201902') and not enrollhist.uses_runs(full, '201902')
+    stored = changes.conn.execute("SELECT count(*) FROM enrollment_runs").fetchone()[0]
+    assert stored < full.execute("SELECT count(*) FROM enrollment").fetchone()[0] / 4
+    assert reconstructed(changes.conn, start) == reconstructed(full, start)
+    history = dict(enrollhist.history(changes.conn, '201902', 3))
+    assert len(history) == 50 and not any('2019-01-07 19:00' <= ts < '2019-01-08 00:00' for ts in history)
+    changes.close()
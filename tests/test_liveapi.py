@@ -0,0 +1,124 @@
+import datetime
+import http.client
+import json
+
+import pytest
+
+import liveapi
+from dbwriter import DBWriter
+
+
+@pytest.fixture
+def api(dbname, section, start):
+    writer = DBWriter(dbname, term='201902')
+    writer.write([section(1, act=10), section(2, act=20)], start, term='201902', subject='CS', campus='O')
+    writer.write([section(3, cmp='A', act=5)], start + datetime.timedelta(minutes=1), term='201902', subject='CS',
+                 campus='A')
+    writer.close()
+    api = liveapi.LiveAPI(dbname, readers=1)
+    api.load()
+    yield api
+    api.close()
+
+
+@pytest.fixture
+def port(api):
+    server = liveapi.serve(api, 0)
+    yield server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def get(port, path, if_none_match=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', path, headers={'If-None-Match': if_none_match} if if_none_match else {})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response.status, response.getheader('ETag'), body
+
+
+@pytest.mark.parametrize('header, status', [
+    ('{etag}', 304),
+    ('W/{etag}', 304),
+    ('"other", {etag}', 304),
+    ('"other", W/{etag}', 304),
+    ('*', 304),
+    ('"other"', 200),
+    ('W/"other"', 200),
+])
+def test_if_none_match(port, header, status):
+    code, etag, body = get(port, '/sections/1')
+    assert code == 200 and json.loads(body)['act'] == 10
+    code, tag, body = get(port, '/sections/1', header.format(etag=etag))
+    assert (code, tag) == (status, etag)
+    assert (body == b'') == (status == 304)
+
+
+def test_etag_changes_with_the_snapshot(api, port, section, start):
+    _, etag, _ = get(port, '/sections/1')
+    api.observe('201902', [section(1, act=11), section(2, act=20)], start + datetime.timedelta(minutes=15),
+                subject='CS', campus='O')
+    # Staged only, readers keep the published snapshot
+    assert get(port, '/sections/1', etag)[0] == 304
+    api.publish()
+    code, tag, body = get(port, '/sections/1', etag)
+    assert code == 200 and tag != etag and json.loads(body)['act'] == 11
+
+
+def test_observe_drops_sections_gone_from_the_scope(api, section, start):
+    later = start + datetime.timedelta(minutes=15)
+    api.observe('201902', [section(1, act=11)], later, subject='CS', campus='O')
+    api.publish()
+    # CRN 2 is gone from the online scrape, the Atlanta CRN 3 was not part of it
+    assert sorted(api.snapshots['201902'].records) == [1, 3]
+    api.observe('201902', [], later, subject='CS', campus='A')
+    api.publish()
+    assert sorted(api.snapshots['201902'].records) == [1]
+
+
+def test_load_matches_observe(api, dbname, section, start):
+    later = start + datetime.timedelta(minutes=15)
+    writer = DBWriter(dbname, term='201902')
+    writer.listeners.append(api.observe)
+    writer.write([section(1, act=11)], later, term='201902', subject='CS', campus='O')
+    writer.close()
+    api.publish()
+    observed = api.snapshots['201902'].records
+    api.load()
+    assert api.snapshots['201902'].records == observed
+
+
+def test_window_start():
+    now = datetime.datetime(2019, 1, 7, 9, 7, 30)
+    assert liveapi._window_start(2, now) == datetime.datetime(2019, 1, 7, 7, 5)
+    assert liveapi._window_start(2, now.replace(minute=10, second=0)) == datetime.datetime(2019, 1, 7, 7, 10)
+
+
+def test_history_is_cached_per_window(api, port, monkeypatch, start):
+    window = [start]
+    queried = []
+    history = api.history
+    monkeypatch.setattr(liveapi, '_window_start', lambda hours: window[0])
+    monkeypatch.setattr(api, 'history', lambda term, crn, since: queried.append(since) or history(term, crn, since))
+    for _ in range(2):
+        code, _, body = get(port, '/sections/1/history?hours=2')
+        assert code == 200 and [entry['act'] for entry in json.loads(body)['history']] == [10]
+    window[0] = start + liveapi.HISTORY_BUCKET
+    code, _, body = get(port, '/sections/1/history?hours=2')
+    assert json.loads(body)['history'] == []
+    assert queried == [start, start + liveapi.HISTORY_BUCKET]
+
+
+def test_responses_are_bounded(monkeypatch):
+    monkeypatch.setattr(liveapi, 'MAX_RESPONSES', 2)
+    snapshot = liveapi.Snapshot('201902', {})
+    built = []
+
+    def response(key):
+        return snapshot.response(key, lambda: built.append(key) or key)
+
+    for key in ('a', 'b', 'a', 'c', 'a', 'b'):
+        response(key)
+    # b was least recently used when c came in
+    assert built == ['a', 'b', 'c', 'b'] and list(snapshot.responses) == ['a', 'b']
@@ -0,0 +1,117 @@
+import datetime
+import glob
+import gzip
+import json
+import logging
+import queue
+
+import pytest
+
+import logpipe
+import metrics
+from logpipe import JSONFormatter, QueueHandler, QueuePipe, RotatingFile, fields
+
+
+@pytest.fixture
+def test_logger(request):
+    test_logger = logging.getLogger(f"test_logpipe.{request.node.name}")
+    test_logger.propagate = False
+    yield test_logger
+    test_logger.handlers.clear()
+
+
+def lines(path):
+    with open(path, encoding='utf-8') as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_full_queue_drops_records(test_logger, monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, 'REGISTRY', registry)
+    handler = QueueHandler(queue.Queue(2))
+    test_logger.addHandler(handler)
+    for i in range(5):
+        test_logger.warning(f"record {i}")
+    assert handler.dropped == 3
+    assert [handler.queue.get_nowait().getMessage() for _ in range(2)] == ["record 0", "record 1"]
+    assert ('omscs_log_dropped_total', {}, 3) in registry.samples()
+
+
+def test_lazy_fields(test_logger, tmp_path):
+    path = str(tmp_path / 'test.log')
+    pipe = QueuePipe(path)
+    test_logger.addHandler(pipe.handler)
+    test_logger.setLevel(logging.INFO)
+    calls = []
+
+    def rows():
+        calls.append(1)
+        return [[1, 2], [3]]
+
+    test_logger.debug("Rows", extra=fields(rows=rows))
+    test_logger.error("Bad rows", extra=fields(rows=rows, count=2, broken=lambda: 1 / 0))
+    pipe.stop()
+    # Only the enabled record built its rows, on the writer thread
+    assert calls == [1]
+    entry, = lines(path)
+    assert (entry['level'], entry['msg'], entry['rows'], entry['count']) == ('ERROR', "Bad rows", [[1, 2], [3]], 2)
+    assert entry['broken'].startswith("<field failed: ZeroDivisionError")
+
+
+def test_exceptions_are_formatted(test_logger, tmp_path):
+    path = str(tmp_path / 'test.log')
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(JSONFormatter())
+    test_logger.addHandler(handler)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        test_logger.exception("Failed")
+    handler.close()
+    entry, = lines(path)
+    assert entry['func'] == 'test_exceptions_are_formatted' and 'ZeroDivisionError' in entry['exc']
+
+
+def test_size_rotation_keeps_compressed_backups(test_logger, tmp_path):
+    path = str(tmp_path / 'test.log')
+    handler = RotatingFile(path, max_bytes=1000, backups=2)
+    handler.setFormatter(JSONFormatter())
+    test_logger.addHandler(handler)
+    for i in range(100):
+        test_logger.warning(f"record {i:03d}")
+    handler.close()
+    backups = sorted(glob.glob(path + ".*.gz"))
+    assert len(backups) == 2
+    with gzip.open(backups[-1], 'rt', encoding='utf-8') as fh:
+        rotated = [json.loads(line)['msg'] for line in fh]
+    current = [entry['msg'] for entry in lines(path)]
+    # The newest backup ends where the current file starts
+    assert int(rotated[-1][-3:]) + 1 == int(current[0][-3:]) and current[-1] == "record 099"
+
+
+def test_midnight_rotation(test_logger, tmp_path):
+    path = str(tmp_path / 'test.log')
+    handler = RotatingFile(path, max_bytes=0)
+    handler.setFormatter(JSONFormatter())
+    test_logger.addHandler(handler)
+    test_logger.warning("yesterday")
+    handler.rollover_at = datetime.datetime.now() - datetime.timedelta(seconds=1)
+    test_logger.warning("today")
+    handler.close()
+    backup, = glob.glob(path + ".*.gz")
+    with gzip.open(backup, 'rt', encoding='utf-8') as fh:
+        assert [json.loads(line)['msg'] for line in fh] == ["yesterday"]
+    assert [entry['msg'] for entry in lines(path)] == ["today"]
+    assert handler.rollover_at > datetime.datetime.now()
+
+
+def test_attach_shares_one_pipe_per_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(logpipe, '_pipes', {})
+    path = str(tmp_path / 'test.log')
+    first, second = logging.getLogger('test_logpipe.first'), logging.getLogger('test_logpipe.second')
+    for attached in (first, second, first):
+        logpipe.attach(attached, path)
+    assert len(logpipe._pipes) == 1 and first.handlers == second.handlers
+    logpipe.stop_all()
+    first.handlers.clear()
+    second.handlers.clear()
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.webdriver.common.by import By
+
+import metrics
+from navsteps import Step, click, run_steps
+
+
+class FakeElement:
+    def __init__(self, driver, name):
+        self.driver = driver
+        self.name = name
+
+    def click(self):
+        self.driver.clicked.append(self.name)
+
+
+class FakeDriver:
+    """Elements appear at a set time after the driver is made, a webdriver as far as run_steps goes"""
+
+    def __init__(self, elements, title="BuzzPort"):
+        self.created = time.monotonic()
+        # (by, value) -> seconds after which it is on the page
+        self.elements = elements
+        self.title = title
+        self.clicked = []
+        self.screenshots = []
+
+    def find_element(self, by, value):
+        if time.monotonic() - self.created < self.elements.get((by, value), float('inf')):
+            raise NoSuchElementException(value)
+        return FakeElement(self, value)
+
+    def save_screenshot(self, path):
+        self.screenshots.append(path)
+        return True
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, 'REGISTRY', registry)
+    return registry
+
+
+def sample(registry, name, **labels):
+    return {tuple(sorted(found.items())): value for sample_name, found, value in registry.samples()
+            if sample_name == name}.get(tuple(sorted(labels.items())))
+
+
+def test_steps_wait_act_and_are_timed(registry):
+    driver = FakeDriver({(By.ID, 'term_6250'): 0.2, (By.ID, 'submit'): 0})
+    steps = (Step('course', 'present', (By.ID, "term_{crse}"), click, 2),
+             Step('submit', 'present', (By.ID, "submit"), click),
+             Step('home', 'title', "BuzzPort"))
+    found = run_steps(driver, steps, crse='6250')
+    assert driver.clicked == ['term_6250', 'submit'] and found is True
+    # Event driven, the wait ends soon after the element appears
+    assert 0.2 <= sample(registry, 'omscs_stage_last_seconds', stage='nav_course') < 0.5
+    assert sample(registry, 'omscs_stage_last_seconds', stage='nav_submit') < 0.1
+    assert sample(registry, 'omscs_stage_seconds_count', stage='nav_home') == 1
+    assert driver.screenshots == [] and sample(registry, 'omscs_stage_failures_total', stage='nav_course') is None
+
+
+def test_failed_step_screenshots_and_counts(registry):
+    driver = FakeDriver({(By.ID, 'submit'): 0})
+    steps = (Step('submit', 'present', (By.ID, "submit"), click),
+             Step('results', 'present', (By.ID, "results"), timeout=0.3),
+             Step('never', 'present', (By.ID, "submit"), click))
+    with pytest.raises(TimeoutException, match='Step results waited 0.3s'):
+        run_steps(driver, steps, page='search')
+    assert driver.clicked == ['submit']
+    assert len(driver.screenshots) == 1 and driver.screenshots[0].startswith('./screenshots/search_attempt_')
+    assert sample(registry, 'omscs_screenshots_total', page='search') == 1
+    assert sample(registry, 'omscs_stage_failures_total', stage='nav_results') == 1
+    assert sample(registry, 'omscs_stage_seconds_count', stage='nav_never') is None
+
+
+def test_failed_action(registry):
+    def broken(browser, element, params):
+        raise RuntimeError("stale element")
+
+    driver = FakeDriver({})
+    with pytest.raises(RuntimeError):
+        run_steps(driver, (Step('act', action=broken),), page='menu')
+    assert sample(registry, 'omscs_screenshots_total', page='menu') == 1
+    assert sample(registry, 'omscs_stage_failures_total', stage='nav_act') == 1
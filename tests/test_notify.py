@@ -0,0 +1,47 @@
+import socket
+import threading
+import time
+
+import smtpstub
+from notify import Notifier, SmtpConfig
+
+
+def config(port):
+    return SmtpConfig('127.0.0.1', port, False, None, None, 'tracker@example.com', 'me@example.com')
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_close_with_a_full_queue_returns():
+    notifier = Notifier(config(closed_port()), retries=1000, backoff=0.05, max_queued=2)
+    for i in range(3):
+        notifier.notify(f"error {i}", "body")
+    started = time.monotonic()
+    notifier.close(timeout=0.5)
+    assert time.monotonic() - started < 2
+    assert notifier.stats['queued'] + notifier.stats['dropped'] == 3
+
+
+def test_stats_from_many_threads():
+    server = smtpstub.serve()
+    notifier = Notifier(config(server.server_address[1]), window=60)
+
+    def notify(thread):
+        for i in range(50):
+            notifier.notify("same subject", f"{thread} {i}")
+
+    threads = [threading.Thread(target=notify, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    notifier.close(timeout=10)
+    server.shutdown()
+    server.server_close()
+    assert notifier.stats['queued'] == 400
+    assert (notifier.stats['sent'], notifier.stats['collapsed']) == (2, 399)
+    assert len(server.RequestHandlerClass.messages) == 2
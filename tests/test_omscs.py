@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import etracker
+import omscs
+from dbwriter import connect
+from termwatch import record_terms
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def coordinator(monkeypatch):
+    calls = []
+    monkeypatch.setattr(omscs, '_log_to_file', lambda: None)
+    monkeypatch.setattr(etracker, 'coordinator', lambda **options: calls.append(options))
+    return calls
+
+
+@pytest.mark.parametrize('argv, headless', [([], None), (['--headless'], True), (['--no-headless'], False)])
+def test_track_headless(coordinator, argv, headless):
+    omscs.main(['track', '--semester', '201902'] + argv)
+    assert coordinator[0].get('headless') == headless
+
+
+def test_track_latest_term(coordinator, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit, match='discover-terms'):
+        omscs.main(['track'])
+    assert not os.path.exists(omscs.DBNAME)
+    db = connect(omscs.DBNAME)
+    record_terms(db, [('201908', 'Fall 2019'), ('201905', 'Summer 2019')])
+    record_terms(db, [('201905', 'Summer 2019')])
+    db.close()
+    # Fall 2019 is no longer listed
+    omscs.main(['track'])
+    assert coordinator[0]['semester'] == '201905'
+
+
+def test_track_options(coordinator):
+    omscs.main(['track', '--target', '201908:CS:A', '--engine', 'http', '--api-port', '0', '--no-alerts'])
+    options = coordinator[0]
+    assert (options['engine'], options['api_port'], options['alerts']) == ('http', None, False)
+    assert [tuple(target) for target in options['targets']] == [('201908', 'CS', 'A')]
+
+
+def test_legacy_entry_point_runs_once():
+    # Run as a script, etracker.py is handed to omscs as the etracker module instead of being imported again
+    code = ("import runpy, sys, omscs\n"
+            "sys.argv = ['etracker.py', '--no-headless']\n"
+            "omscs.track = lambda args: print(sys.modules['etracker'] is sys.modules['__main__'], args.headless)\n"
+            "runpy.run_path('etracker.py', run_name='__main__')\n")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    assert result.stdout.split() == ['True', 'False']
+
+
+def test_export_needs_the_database(tmp_path):
+    missing = str(tmp_path / 'missing.db')
+    with pytest.raises(SystemExit, match='no database'):
+        omscs.main(['export', '--db', missing, '--out', str(tmp_path / 'export')])
+    assert not os.path.exists(missing)
@@ -0,0 +1,33 @@
+import threading
+import time
+
+import oscarsim
+import pagearchive
+from pagearchive import PageArchive
+
+
+def test_one_dictionary_trained_by_concurrent_adds(tmp_path, monkeypatch):
+    train_dictionary = pagearchive.train_dictionary
+
+    def slow_training(pages, size=pagearchive.DICT_SIZE):
+        time.sleep(0.1)
+        return train_dictionary(pages, size)
+
+    monkeypatch.setattr(pagearchive, 'train_dictionary', slow_training)
+    sim = oscarsim.Simulation(sections=5)
+    pages = [sim.results('201902', ['CS'], ['O']) + f"<!-- {i} -->" for i in range(40)]
+    archive = PageArchive(str(tmp_path / 'pages.db'), train_after=5)
+
+    def add(offset):
+        for i in range(offset, len(pages), 8):
+            archive.add(pages[i], '201902', 'CS', 'O', fetched=f"2019-01-07 09:{i:02d}:00")
+
+    threads = [threading.Thread(target=add, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert archive.conn.execute("SELECT count(*) FROM page_dicts").fetchone()[0] == 1
+    assert archive.stats().blobs == 40
+    assert all(archive.get(pagearchive.page_hash(page.encode())) == page.encode() for page in pages)
+    archive.close()
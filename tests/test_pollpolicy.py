@@ -0,0 +1,86 @@
+import datetime
+import json
+
+import pytest
+
+from dbwriter import DBWriter
+from pollpolicy import AdaptivePolicy, Phase, PollPlan, load_phases
+from scrapepool import Target
+
+MINUTES = datetime.timedelta(minutes=1)
+TARGET = Target('201902', 'CS', 'O')
+
+
+@pytest.fixture
+def writer(dbname):
+    writer = DBWriter(dbname, term='201902')
+    yield writer
+    writer.close()
+
+
+def scrape_every_15_minutes(writer, section, start, changed, scrapes=4):
+    """Scrapes of 20 sections, changed of which take a seat between two scrapes"""
+    for i in range(scrapes):
+        sections = [section(crn, act=i if crn < changed else 0) for crn in range(20)]
+        writer.write(sections, start + 15 * i * MINUTES, subject='CS', campus='O')
+    return start + 15 * (scrapes - 1) * MINUTES
+
+
+def test_new_target_gets_the_minimum(writer, start):
+    assert AdaptivePolicy().interval(writer.conn, TARGET, start) == 5 * MINUTES
+
+
+@pytest.mark.parametrize('changed, changes_per_scrape, interval', [
+    # 3 scrape pairs over 45 minutes
+    (0, 8, 120 * MINUTES),
+    (20, 8, 6 * MINUTES),
+    (20, 1, 5 * MINUTES),
+    (1, 8, 120 * MINUTES),
+    (5, 8, 24 * MINUTES),
+])
+def test_interval_follows_the_change_rate(writer, section, start, changed, changes_per_scrape, interval):
+    now = scrape_every_15_minutes(writer, section, start, changed)
+    policy = AdaptivePolicy(changes_per_scrape=changes_per_scrape)
+    assert policy.interval(writer.conn, TARGET, now) == interval
+
+
+def test_phase_bounds(writer, section, start):
+    now = scrape_every_15_minutes(writer, section, start, 0)
+    phase = Phase('Phase I', now - MINUTES, now + 60 * MINUTES, 2 * MINUTES, 10 * MINUTES)
+    policy = AdaptivePolicy(phases=[phase])
+    assert policy.bounds(now) == (2 * MINUTES, 10 * MINUTES)
+    assert policy.bounds(phase.end) == (5 * MINUTES, 120 * MINUTES)
+    assert policy.interval(writer.conn, TARGET, now) == 10 * MINUTES
+
+
+def test_never_sleeps_past_a_phase_start(writer, section, start):
+    now = scrape_every_15_minutes(writer, section, start, 0)
+    phase = Phase('Phase I', now + 30 * MINUTES, now + 90 * MINUTES, 2 * MINUTES, 10 * MINUTES)
+    assert AdaptivePolicy(phases=[phase]).interval(writer.conn, TARGET, now) == 30 * MINUTES
+
+
+def test_min_above_max():
+    with pytest.raises(ValueError):
+        AdaptivePolicy(min_interval=10 * MINUTES, max_interval=5 * MINUTES)
+
+
+def test_load_phases(tmp_path):
+    path = tmp_path / 'phases.json'
+    path.write_text(json.dumps([{"name": "Phase I", "start": "2019-11-04 08:00", "end": "2019-11-08 16:00",
+                                 "min_minutes": 5, "max_minutes": 30}]))
+    assert load_phases(str(path)) == [Phase('Phase I', datetime.datetime(2019, 11, 4, 8, 0),
+                                            datetime.datetime(2019, 11, 8, 16, 0), 5 * MINUTES, 30 * MINUTES)]
+
+
+def test_poll_plan(writer, section, start):
+    other = Target('201902', 'CSE', 'O')
+    plan = PollPlan([TARGET], AdaptivePolicy(), start=start)
+    plan.add(other, start + 10 * MINUTES)
+    assert plan.due(start) == [TARGET]
+    now = scrape_every_15_minutes(writer, section, start, 0)
+    assert plan.reschedule(TARGET, writer.conn, now) == now + 120 * MINUTES
+    assert plan.reschedule(other, writer.conn, now, failed=True) == now + 5 * MINUTES
+    assert plan.due(now + 5 * MINUTES) == [other]
+    # Adding a planned target keeps its time
+    plan.add(other, start)
+    assert plan.due(now + 5 * MINUTES) == [other]
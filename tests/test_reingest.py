@@ -0,0 +1,51 @@
+import datetime
+
+import pytest
+
+import oscarsim
+from dbwriter import DBWriter
+from pagearchive import PageArchive
+from reingest import reingest
+from sections import parse_sections
+
+
+@pytest.fixture
+def archive_path(tmp_path, start):
+    path = str(tmp_path / 'pages.db')
+    sim = oscarsim.Simulation(sections=5)
+    archive = PageArchive(path)
+    for i in range(3):
+        archive.add(sim.results('201902', ['CS'], ['O']), '201902', 'CS', 'O',
+                    fetched=start + datetime.timedelta(minutes=15 * i))
+    archive.close()
+    return path
+
+
+def scrape_count(dbname):
+    writer = DBWriter(dbname, term='201902')
+    count = writer.conn.execute("SELECT count(*) FROM scrapes WHERE term='201902'").fetchone()[0]
+    writer.close()
+    return count
+
+
+def test_reingest_again_resumes(archive_path, dbname):
+    assert reingest('201902', dbname, archive_path, processes=1).written == 3
+    stats = reingest('201902', dbname, archive_path, processes=1)
+    assert (stats.written, stats.resumed) == (0, 3)
+    assert scrape_count(dbname) == 3
+
+
+def test_tracked_term_needs_replace(archive_path, dbname, start):
+    # The tracker wrote the same pages, a little after each fetch
+    archive = PageArchive(archive_path, readonly=True)
+    writer = DBWriter(dbname, term='201902')
+    for _, _, ts, digest in archive.pages('201902'):
+        scrape_time = datetime.datetime.strptime(ts, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(seconds=1)
+        writer.write(parse_sections(archive.get(digest).decode('utf-8')), scrape_time, subject='CS', campus='O')
+    writer.close()
+    archive.close()
+    with pytest.raises(ValueError):
+        reingest('201902', dbname, archive_path, processes=1)
+    assert scrape_count(dbname) == 3
+    assert reingest('201902', dbname, archive_path, processes=1, replace=True).written == 3
+    assert scrape_count(dbname) == 3
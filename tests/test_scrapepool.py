@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+import oscarsim
+from dbwriter import DBWriter
+from engines import HttpEngine
+from scrapepool import RateLimiter, ScrapePool, Target, parse_target
+
+TARGETS = [Target(term, subject, campus) for term in ('201902', '201908') for subject in ('CS', 'CSE')
+           for campus in ('O', 'A')]
+
+
+@pytest.fixture
+def sim():
+    simulation = oscarsim.Simulation(subjects=('CS', 'CSE'), sections=5, speed=1)
+    server = oscarsim.serve(simulation)
+    yield simulation
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool(sim):
+    def factory():
+        return HttpEngine(base_url=sim.base_url, login_with=lambda: oscarsim.http_login(sim.url), timeout=5)
+    pool = ScrapePool(factory, max_workers=4, min_interval=0)
+    yield pool
+    pool.close()
+
+
+@pytest.mark.parametrize('text, target', [
+    ('201902', Target('201902', 'CS', 'O')),
+    ('201902:CSE', Target('201902', 'CSE', 'O')),
+    ('201908:CS:A', Target('201908', 'CS', 'A')),
+])
+def test_parse_target(text, target):
+    assert parse_target(text) == target
+
+
+@pytest.mark.parametrize('text', ['', '201902:', '201902::O', '201902:CS:O:X'])
+def test_parse_bad_target(text):
+    with pytest.raises(ValueError):
+        parse_target(text)
+
+
+def test_rate_limiter_spaces_starts_of_a_key():
+    limiter = RateLimiter(0.2)
+    starts = []
+
+    def start(key):
+        limiter.wait(key)
+        starts.append((key, time.monotonic()))
+
+    threads = [threading.Thread(target=start, args=(key,)) for key in ('a', 'a', 'a', 'b')]
+    began = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    times = sorted(ts for key, ts in starts if key == 'a')
+    assert all(later - earlier >= 0.19 for earlier, later in zip(times, times[1:]))
+    # Other keys are not held up
+    assert [ts for key, ts in starts if key == 'b'][0] - began < 0.15
+
+
+def test_run_writes_every_target_through_one_writer(pool, dbname):
+    writer = DBWriter(dbname)
+    written = pool.run(TARGETS, writer)
+    assert written == {target: 5 for target in TARGETS}
+    scopes = writer.conn.execute("SELECT DISTINCT term, subject, campus FROM scrapes").fetchall()
+    assert sorted(scopes) == sorted(TARGETS)
+    writer.close()
+    # Each worker kept its engine between targets
+    assert 1 <= len(pool.engines) <= 4
+
+
+def test_failed_target_does_not_stop_the_run(pool, dbname, monkeypatch):
+    engine_for = pool._engine
+
+    def engine():
+        engine = engine_for()
+        scrape = engine.scrape
+        engine.scrape = lambda term, subject, campus: (scrape(term, subject, campus) if subject != 'BAD'
+                                                       else 1 / 0)
+        return engine
+
+    monkeypatch.setattr(pool, '_engine', engine)
+    writer = DBWriter(dbname)
+    written = pool.run([Target('201902', 'BAD', 'O'), Target('201902', 'CS', 'O')], writer)
+    writer.close()
+    assert written == {Target('201902', 'BAD', 'O'): None, Target('201902', 'CS', 'O'): 5}
+
+
+def test_call_runs_on_a_worker_engine(pool):
+    assert [value for value, _ in pool.call(lambda engine: engine.terms())] == ['201902', '201908']
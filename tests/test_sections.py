@@ -0,0 +1,39 @@
+import pytest
+
+from sections import parse_sections
+
+NO_CLASSES_PAGE = """<html><head><title>Class Schedule Listing</title></head><body>
+<table class="plaintable"><tr><td class="pldefault">
+<span class="warningtext">No classes were found that meet your search criteria</span>
+</td></tr></table>
+</body></html>"""
+
+RESULTS_PAGE = """<html><body>
+<table class="datadisplaytable" summary="This layout table is used to present the sections found">
+<tr><th colspan="20" class="ddtitle">Computer Science</th></tr>
+<tr><th>Select</th><th>CRN</th><th>Subj</th><th>Crse</th><th>Sec</th><th>Cmp</th><th>Cred</th><th>Title</th>
+<th>Cap</th><th>Act</th><th>Rem</th><th>WL Cap</th><th>WL Act</th><th>WL Rem</th><th>Instructor</th></tr>
+<tr><td>C</td><td>20001</td><td>CS</td><td>6250</td><td>O01</td><td>O</td><td>3.000</td><td>Networks</td>
+<td>100</td><td>90</td><td>10</td><td>50</td><td>0</td><td>50</td><td>Feamster</td></tr>
+</table>
+</body></html>"""
+
+
+def test_results_table():
+    sections = parse_sections(RESULTS_PAGE)
+    assert [(sec.crn, sec.subj, sec.crse, sec.counts) for sec in sections] == \
+        [(20001, 'CS', '6250', (100, 90, 10, 50, 0, 50))]
+
+
+def test_no_classes_found_is_empty():
+    assert parse_sections(NO_CLASSES_PAGE) == []
+
+
+@pytest.mark.parametrize('page', [
+    "<html><body><p>Please log in</p></body></html>",
+    "<html><body><table class='datadisplaytable'><tr><td>20001</td></tr></table></body></html>",
+    RESULTS_PAGE.replace("<td>90</td>", "<td>ninety</td>"),
+])
+def test_malformed_pages_raise(page):
+    with pytest.raises(ValueError):
+        parse_sections(page)
@@ -0,0 +1,81 @@
+import datetime
+
+import pytest
+
+import oscarsim
+from dbwriter import connect
+from engines import HttpEngine, terms_with_retry
+from termwatch import TermWatcher, known_terms, latest_term, parse_terms, record_terms
+
+SPRING, FALL, SPRING_20 = ('201902', 'Spring 2019'), ('201908', 'Fall 2019'), ('202002', 'Spring 2020')
+
+
+@pytest.fixture
+def conn(dbname):
+    conn = connect(dbname)
+    yield conn
+    conn.close()
+
+
+def test_parse_terms():
+    page = oscarsim._page("Select Term", """<select name="term_in">
+<option value="">None</option>
+<option value="201908">Fall 2019
+  (View only)</option>
+<option value=" 201902 ">Spring 2019</option>
+</select>""")
+    assert parse_terms(page) == [('201908', 'Fall 2019 (View only)'), ('201902', 'Spring 2019')]
+
+
+@pytest.mark.parametrize('page', ['', '  ', oscarsim._page("Login", '<select name="other"></select>')])
+def test_parse_terms_needs_the_select(page):
+    with pytest.raises(ValueError):
+        parse_terms(page)
+
+
+def test_first_run_records_without_reporting(conn, start):
+    changes = record_terms(conn, [FALL, SPRING], start)
+    assert (changes.new, changes.dropped) == ([], [])
+    assert [row[:2] for row in known_terms(conn)] == [FALL, SPRING]
+
+
+def test_new_dropped_and_returning_terms(conn, start):
+    record_terms(conn, [FALL, SPRING], start)
+    changes = record_terms(conn, [SPRING_20, FALL], start + datetime.timedelta(hours=1))
+    assert (changes.new, changes.dropped) == ([SPRING_20], [SPRING])
+    assert [row[0] for row in known_terms(conn)] == ['202002', '201908']
+    assert [row[0] for row in known_terms(conn, include_dropped=True)] == ['202002', '201908', '201902']
+    # Listed again, so reported again
+    changes = record_terms(conn, [SPRING_20, FALL, SPRING], start + datetime.timedelta(hours=2))
+    assert (changes.new, changes.dropped) == ([SPRING], [])
+    assert known_terms(conn)[-1][2].startswith('2019-01-07 09:00')
+
+
+def test_latest_term(conn, start):
+    assert latest_term(conn) is None
+    record_terms(conn, [SPRING_20, FALL], start)
+    record_terms(conn, [FALL], start)
+    assert latest_term(conn) == '201908'
+
+
+def test_watcher_finds_terms_on_oscar(conn):
+    sim = oscarsim.Simulation(sections=5, speed=1)
+    server = oscarsim.serve(sim)
+    engine = HttpEngine(base_url=sim.base_url, login_with=lambda: oscarsim.http_login(sim.url), timeout=5)
+    added = []
+
+    def broken(term):
+        raise RuntimeError("callback bug")
+
+    watcher = TermWatcher(conn, lambda: terms_with_retry(engine), on_new=[broken, added.append], notify=False)
+    try:
+        assert watcher.poll().new == []
+        sim.add_term('202002')
+        changes = watcher.poll()
+    finally:
+        engine.close()
+        server.shutdown()
+        server.server_close()
+    assert changes.new == [SPRING_20] and changes.terms[0] == SPRING_20
+    # A failing callback does not keep the others from running
+    assert added == ['202002']